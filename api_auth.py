@@ -2,16 +2,11 @@ import hmac
 import hashlib
 import base64
 
-import dotenv
-import os
-
-dotenv_file = dotenv.find_dotenv()
-dotenv.load_dotenv(dotenv_file)
-SECRET_KEY = os.environ["secret_key"]
+from settings import settings
 
 def generate_token(course_code):
     message = course_code.encode('utf-8')
-    key = SECRET_KEY.encode('utf-8')
+    key = settings.secret_key.encode('utf-8')
     sig = hmac.new(key, message, hashlib.sha256).digest()
     return base64.urlsafe_b64encode(sig).decode('utf-8')
 
@@ -0,0 +1,70 @@
+"""Per-call latency of the lookups behind the upload, exempt and stats endpoints.
+
+    python benchmarks/db_lookups.py --code 2024-FW-D2-S01-COSC-1P02-LEC --year 2024 --project-id 1
+    python benchmarks/db_lookups.py --code ... --year 2024 --project-id 1 --repeat 500 --pure
+
+Needs the configured MySQL database (.env). Each lookup is called --repeat times in two modes:
+a new connection and statement per call (csv_db without a pool), and a pooled connection whose
+prepared statements are reused, as syllabus_api runs them. Reports the median and p95 per call.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv_db
+from settings import settings
+
+
+def latencies(func, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def summary(runs):
+    runs = sorted(runs)
+    p95 = runs[min(len(runs) - 1, int(len(runs) * 0.95))]
+    return f"median {statistics.median(runs) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-call latency of the API's database lookups.")
+    parser.add_argument('--code', required=True, help="an OrganizationalUnits Code to look up")
+    parser.add_argument('--year', type=int, required=True)
+    parser.add_argument('--terms', nargs='+', default=['FW', 'SP', 'SU'])
+    parser.add_argument('--project-id', type=int, required=True)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--pure', action='store_true', help="use the pure-Python driver instead of the C extension")
+    args = parser.parse_args()
+
+    if args.pure:
+        os.environ['db_use_pure'] = 'true'
+    settings.reload()
+
+    lookups = {
+        'get_orgUnitId_by_code': lambda: csv_db.get_orgUnitId_by_code(args.code),
+        'fetch_counts': lambda: csv_db.fetch_counts(args.year, args.terms, args.project_id),
+        'fetch_department_count': lambda: csv_db.fetch_department_count([args.year - 1, args.year], args.project_id),
+    }
+    driver = 'pure Python' if settings.db_use_pure or not csv_db.mysql.connector.HAVE_CEXT else 'C extension'
+    print(f"MySQL driver: {driver}; {args.repeat} calls per lookup")
+
+    unpooled = {name: latencies(func, args.repeat) for name, func in lookups.items()}
+    csv_db.enable_pool(1)
+    for func in lookups.values():
+        func()  # prepare once, as the first request on a pooled connection does
+    pooled = {name: latencies(func, args.repeat) for name, func in lookups.items()}
+
+    for name in lookups:
+        print(f"  {name:<24} new connection: {summary(unpooled[name])}   pooled + prepared: {summary(pooled[name])}")
+
+
+if __name__ == '__main__':
+    main()
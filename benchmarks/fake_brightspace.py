@@ -0,0 +1,381 @@
+"""Local stand-in for the Brightspace endpoints d2l_functions and main.py call.
+
+Covers the OAuth token endpoint, Data Hub (datasets/bds) extracts and their downloads,
+managefiles folders/listing/download, the 308 resumable upload and file save, and the
+content toc/root/module/topic structure calls. Latency, bandwidth, partial upload
+acknowledgements and 403/429 throttling are configurable, and every call is counted
+per route template.
+
+    python benchmarks/fake_brightspace.py --port 8765 --datahub-dir benchmarks/data \\
+        --extract 1=ContentObjects --extract 2=OrganizationalUnits --extract 3=OrganizationalUnitAncestors
+
+Point the pipeline at it with bspace_url=http://127.0.0.1:8765 and
+auth_url=http://127.0.0.1:8765/core/connect/token. GET /_fake/stats returns the call
+counts as JSON and POST /_fake/reset clears them.
+"""
+import io
+import os
+import re
+import json
+import time
+import random
+import zipfile
+import argparse
+import threading
+import urllib.parse
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FOLDER, FILE = 1, 2
+
+
+class FakeBrightspace:
+    """State and behaviour of the fake tenant; serve it with start() or serve_forever()."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, bandwidth=None, throttle_rate=0.0,
+                 throttle_status=429, retry_after=1, partial_ack=1.0, file_size=200_000,
+                 datahub_dir=None, extracts=None, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.throttle_rate = throttle_rate
+        self.throttle_status = throttle_status
+        self.retry_after = retry_after
+        self.partial_ack = partial_ack
+        self.file_size = file_size
+        self.datahub_dir = datahub_dir
+        self.extracts = extracts or {}
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.folders = defaultdict(set)
+        self.files = defaultdict(dict)
+        self.modules = defaultdict(list)
+        self.uploads = {}
+        self.next_id = 1
+        self.reset_stats()
+
+        handler = type('Handler', (FakeBrightspaceHandler,), {'fake': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        self.calls = defaultdict(lambda: {'count': 0, 'status': defaultdict(int), 'bytes_in': 0, 'bytes_out': 0})
+
+    def stats(self):
+        with self.lock:
+            routes = {route: {**c, 'status': dict(c['status'])} for route, c in sorted(self.calls.items())}
+        return {'total_calls': sum(c['count'] for c in routes.values()), 'routes': routes}
+
+    def new_id(self):
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+    def record(self, route, status, bytes_in, bytes_out):
+        with self.lock:
+            c = self.calls[route]
+            c['count'] += 1
+            c['status'][str(status)] += 1
+            c['bytes_in'] += bytes_in
+            c['bytes_out'] += bytes_out
+
+    def throttled(self):
+        with self.lock:
+            return self.throttle_rate and self.random.random() < self.throttle_rate
+
+    def transfer_delay(self, size):
+        if self.bandwidth and size:
+            time.sleep(size / self.bandwidth)
+
+
+class FakeBrightspaceHandler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = 'HTTP/1.1'
+
+    # (method, path pattern, route template, handler name)
+    ROUTES = [
+        ('POST', r'/core/connect/token', 'POST /core/connect/token', 'token'),
+        ('GET', r'/d2l/api/lp/[\d.]+/datasets/bds/(?P<schema>[^/]+)/plugins/(?P<plugin>[^/]+)/extracts',
+         'GET /d2l/api/lp/{v}/datasets/bds/{schemaId}/plugins/{pluginId}/extracts', 'extracts'),
+        ('GET', r'/_fake/extracts/(?P<plugin>[^/]+)\.zip', 'GET {DownloadLink}', 'extract_download'),
+        ('GET', r'/d2l/api/lp/[\d.]+/(?P<org>\d+)/managefiles/file', 'GET /d2l/api/lp/{v}/{orgUnitId}/managefiles/file',
+         'download_file'),
+        ('GET', r'/d2l/api/lp/[\d.]+/(?P<org>\d+)/managefiles/?', 'GET /d2l/api/lp/{v}/{orgUnitId}/managefiles/',
+         'list_folder'),
+        ('POST', r'/d2l/api/lp/[\d.]+/(?P<org>\d+)/managefiles/folder', 'POST /d2l/api/lp/{v}/{orgUnitId}/managefiles/folder',
+         'create_folder'),
+        ('POST', r'/d2l/api/lp/[\d.]+/(?P<org>\d+)/managefiles/file/upload',
+         'POST /d2l/api/lp/{v}/{orgUnitId}/managefiles/file/upload', 'upload_start'),
+        ('POST', r'/d2l/upload/(?P<key>[^/]+)', 'POST /d2l/upload/{fileKey}', 'upload_chunk'),
+        ('POST', r'/d2l/api/lp/[\d.]+/(?P<org>\d+)/managefiles/file/save',
+         'POST /d2l/api/lp/{v}/{orgUnitId}/managefiles/file/save', 'save_file'),
+        ('GET', r'/d2l/api/le/[\d.]+/(?P<org>\d+)/content/toc', 'GET /d2l/api/le/{v}/{orgUnitId}/content/toc', 'toc'),
+        ('POST', r'/d2l/api/le/[\d.]+/(?P<org>\d+)/content/root/?', 'POST /d2l/api/le/{v}/{orgUnitId}/content/root/',
+         'create_root'),
+        ('POST', r'/d2l/api/le/[\d.]+/(?P<org>\d+)/content/modules/(?P<module>\d+)/structure/?',
+         'POST /d2l/api/le/{v}/{orgUnitId}/content/modules/{moduleId}/structure/', 'create_structure'),
+        ('GET', r'/_fake/stats', None, 'fake_stats'),
+        ('POST', r'/_fake/reset', None, 'fake_reset'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        fake = self.fake
+        url = urllib.parse.urlsplit(self.path)
+        self.query = dict(urllib.parse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+
+        for route_method, pattern, template, name in self.ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                break
+        else:
+            self.respond(404, {'Error': f'No fake route for {method} {url.path}'})
+            return
+
+        if template is None:
+            getattr(self, name)(**match.groupdict())
+            return
+
+        if fake.latency:
+            time.sleep(fake.latency)
+        fake.transfer_delay(len(self.body))
+        if fake.throttled():
+            status, sent = self.respond(fake.throttle_status, {'Error': 'Throttled'},
+                                        headers={'Retry-After': str(fake.retry_after)})
+        else:
+            status, sent = getattr(self, name)(**match.groupdict())
+        fake.record(template, status, len(self.body), sent)
+
+    def respond(self, status, body=None, headers=None, content_type='application/json'):
+        if isinstance(body, (dict, list)):
+            data = json.dumps(body).encode()
+        else:
+            data = body or b''
+        self.fake.transfer_delay(len(data))
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        return status, len(data)
+
+    def json_body(self):
+        return json.loads(self.body or b'{}')
+
+    # ---- OAuth ----
+
+    def token(self):
+        form = dict(urllib.parse.parse_qsl(self.body.decode()))
+        if form.get('grant_type') != 'refresh_token':
+            return self.respond(400, {'error': 'unsupported_grant_type'})
+        return self.respond(200, {
+            'access_token': f"fake-access-{self.fake.new_id()}",
+            'refresh_token': f"fake-refresh-{self.fake.new_id()}",
+            'expires_in': 7200,
+            'token_type': 'Bearer',
+        })
+
+    # ---- Data Hub ----
+
+    def extracts(self, schema, plugin):
+        return self.respond(200, {'Objects': [{
+            'SchemaId': schema,
+            'PluginId': plugin,
+            'CreatedDate': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+            'DownloadLink': f"{self.fake.base_url}/_fake/extracts/{plugin}.zip",
+        }], 'Next': None})
+
+    def extract_download(self, plugin):
+        name = self.fake.extracts.get(plugin)
+        if name is None or not self.fake.datahub_dir:
+            return self.respond(404, {'Error': f'No extract configured for plugin {plugin}'})
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.write(os.path.join(self.fake.datahub_dir, f"{name}.csv"), f"{name}.csv")
+        return self.respond(200, buffer.getvalue(), content_type='application/zip',
+                            headers={'Content-Disposition': f'attachment; filename="{name}.zip"'})
+
+    # ---- Manage files ----
+
+    def download_file(self, org):
+        path = self.query.get('path', '')
+        name = os.path.basename(path) or 'file'
+        return self.respond(200, b'x' * self.fake.file_size, content_type='application/octet-stream',
+                            headers={'Content-Disposition': f'attachment; filename="{urllib.parse.quote(name)}"'})
+
+    def list_folder(self, org):
+        path = self.query.get('path', '').strip('/')
+        prefix = f"{path}/" if path else ''
+        objects = [
+            {'Name': folder[len(prefix):], 'FileSystemObjectType': FOLDER}
+            for folder in sorted(self.fake.folders[org])
+            if folder.startswith(prefix) and '/' not in folder[len(prefix):]
+        ] + [
+            {'Name': name, 'FileSystemObjectType': FILE}
+            for (folder, name) in sorted(self.fake.files[org]) if folder == path
+        ]
+        return self.respond(200, {'Objects': objects, 'Next': None})
+
+    def create_folder(self, org):
+        parts = self.json_body().get('RelativePath', '').strip('/').split('/')
+        with self.fake.lock:
+            for i in range(1, len(parts) + 1):
+                self.fake.folders[org].add('/'.join(parts[:i]))
+        return self.respond(200)
+
+    def upload_start(self, org):
+        size = self.headers.get('X-Upload-Content-Length')
+        if size is None:
+            return self.respond(400, {'Error': 'X-Upload-Content-Length is required'})
+        key = f"fakekey{self.fake.new_id()}"
+        with self.fake.lock:
+            self.fake.uploads[key] = {'size': int(size), 'received': 0,
+                                      'name': self.headers.get('X-Upload-File-Name', 'file'), 'complete': False}
+        return self.respond(308, headers={'Location': f"/d2l/upload/{key}"})
+
+    def upload_chunk(self, key):
+        upload = self.fake.uploads.get(key)
+        if upload is None:
+            return self.respond(404, {'Error': 'Unknown upload'})
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+)', self.headers.get('Content-Range', ''))
+        if not match:
+            return self.respond(400, {'Error': 'Content-Range is required'})
+        first = int(match.group(1))
+
+        with self.fake.lock:
+            if first == upload['received']:
+                # Optionally acknowledge only part of the chunk to exercise the resume path
+                accepted = len(self.body)
+                if self.fake.partial_ack < 1 and upload['received'] + accepted < upload['size']:
+                    accepted = max(1, int(accepted * self.fake.partial_ack))
+                upload['received'] += accepted
+            received = upload['received']
+            upload['complete'] = received >= upload['size']
+
+        if upload['complete']:
+            return self.respond(200)
+        return self.respond(308, headers={'Location': f"/d2l/upload/{key}", 'Range': f"bytes=0-{received - 1}"})
+
+    def save_file(self, org):
+        form = dict(urllib.parse.parse_qsl(self.body.decode()))
+        upload = self.fake.uploads.get(form.get('fileKey'))
+        if upload is None or not upload['complete']:
+            return self.respond(404, {'Error': 'Unknown or incomplete file key'})
+        with self.fake.lock:
+            self.fake.files[org][(form.get('relativePath', '').strip('/'), upload['name'])] = upload['size']
+            del self.fake.uploads[form['fileKey']]
+        return self.respond(200)
+
+    # ---- Content ----
+
+    def toc(self, org):
+        return self.respond(200, {'Modules': self.fake.modules[org], 'Topics': []})
+
+    def create_root(self, org):
+        payload = self.json_body()
+        module = {'ModuleId': self.fake.new_id(), 'Title': payload.get('Title'), 'Modules': [], 'Topics': []}
+        with self.fake.lock:
+            self.fake.modules[org].append(module)
+        return self.respond(200, {'Id': module['ModuleId'], **payload})
+
+    def create_structure(self, org, module):
+        payload = self.json_body()
+        parent = find_module(self.fake.modules[org], int(module))
+        if parent is None:
+            return self.respond(404, {'Error': f'Unknown module {module}'})
+        new_id = self.fake.new_id()
+        with self.fake.lock:
+            if payload.get('Type') == 1:
+                parent['Topics'].append({'TopicId': new_id, 'Title': payload.get('Title'), 'Url': payload.get('Url')})
+            else:
+                parent['Modules'].append({'ModuleId': new_id, 'Title': str(payload.get('Title')), 'Modules': [], 'Topics': []})
+        return self.respond(200, {'Id': new_id, **payload})
+
+    # ---- Control ----
+
+    def fake_stats(self):
+        return self.respond(200, self.fake.stats())
+
+    def fake_reset(self):
+        with self.fake.lock:
+            self.fake.reset_stats()
+        return self.respond(200, {'reset': True})
+
+
+def find_module(modules, module_id):
+    for module in modules:
+        if module['ModuleId'] == module_id:
+            return module
+        found = find_module(module['Modules'], module_id)
+        if found is not None:
+            return found
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Brightspace tenant.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--bandwidth', type=float, help="bytes per second for request and response bodies")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered with --throttle-status")
+    parser.add_argument('--throttle-status', type=int, default=429, choices=(403, 429))
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--partial-ack', type=float, default=1.0, help="fraction of each upload chunk acknowledged")
+    parser.add_argument('--file-size', type=int, default=200_000, help="size of downloaded course files")
+    parser.add_argument('--datahub-dir', help="directory with the extract CSVs to serve")
+    parser.add_argument('--extract', action='append', default=[], metavar='PLUGIN_ID=Extract',
+                        help="serve <datahub-dir>/<Extract>.csv for the plugin id")
+    parser.add_argument('--stats-file', help="write call counts here on shutdown")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeBrightspace(
+        host=args.host, port=args.port, latency=args.latency, bandwidth=args.bandwidth,
+        throttle_rate=args.throttle_rate, throttle_status=args.throttle_status, retry_after=args.retry_after,
+        partial_ack=args.partial_ack, file_size=args.file_size, datahub_dir=args.datahub_dir,
+        extracts=dict(e.split('=', 1) for e in args.extract), seed=args.seed,
+    )
+    print(f"Fake Brightspace listening on {fake.base_url}")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.stats_file:
+            with open(args.stats_file, 'w') as f:
+                json.dump(fake.stats(), f, indent=2)
+        print(json.dumps(fake.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Measure cold import time of the entry-point modules in fresh interpreters.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --modules syllabus_api --repeat 10 --budget-ms 400
+
+Each module is imported --repeat times in a new process with an empty environment apart from
+PATH, so neither a .env file nor configuration is needed; importing must not read either.
+Reports the median wall time, the slowest imports from `python -X importtime`, and whether
+any heavy dependency was imported eagerly. Exits 1 when a median exceeds --budget-ms.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that should only be imported when a code path needs them
+HEAVY = ('pandas', 'numpy', 'openpyxl', 'pyarrow', 'mysql.connector', 'dotenv')
+
+PROBE = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def clean_env():
+    # Run from an empty directory so find_dotenv() has nothing to pick up either
+    return {'PATH': os.environ.get('PATH', ''), 'PYTHONDONTWRITEBYTECODE': '1'}
+
+
+def probe(module, cwd):
+    code = PROBE.format(root=ROOT, module=module, heavy=HEAVY)
+    out = subprocess.run([sys.executable, '-c', code], env=clean_env(), cwd=cwd,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module, cwd, top):
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); import {module}"
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=clean_env(), cwd=cwd,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the entry points.")
+    parser.add_argument('--modules', nargs='+', default=['syllabus_api', 'csv_db', 'd2l_functions', 'snapshots'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, help="fail when a module's median import exceeds this")
+    args = parser.parse_args()
+
+    cwd = tempfile.mkdtemp(prefix='syllabus-import-')
+    over_budget = False
+    for module in args.modules:
+        runs = [probe(module, cwd) for _ in range(args.repeat)]
+        median_ms = statistics.median(r['seconds'] for r in runs) * 1000
+        loaded = runs[-1]['loaded']
+        print(f"{module}: median {median_ms:.0f} ms over {args.repeat} runs"
+              + (f"; heavy imports loaded eagerly: {', '.join(loaded)}" if loaded else ""))
+
+        for cumulative_us, self_us, name in slowest_imports(module, cwd, args.top):
+            print(f"    {cumulative_us / 1000:>8.1f} ms  {name}")
+
+        if args.budget_ms is not None and median_ms > args.budget_ms:
+            print(f"    over budget ({args.budget_ms:.0f} ms)")
+            over_budget = True
+    os.rmdir(cwd)
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
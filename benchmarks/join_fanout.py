@@ -0,0 +1,146 @@
+"""Compare the course queries through OrganizationalUnitAncestors with the CourseProject table.
+
+    python benchmarks/join_fanout.py
+    python benchmarks/join_fanout.py --scale 5 --extra-ancestors 4 --repeat 20
+
+Loads synthetic extracts into an in-memory SQLite database (standing in for MySQL, so no
+server is needed) with the keys from tables/tables.sql. CourseProject is built with the same
+INSERT ... SELECT as csv_db.refresh_course_project. For one term it reports how many rows
+each join produces before the project filter, checks that both forms return the same
+courses, and times the fetch_counts query for every project.
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic_data
+
+SCHEMA = """
+    CREATE TABLE OrganizationalUnits (
+        OrgUnitId INTEGER PRIMARY KEY, Code TEXT, Year INTEGER, Term TEXT,
+        Department TEXT, SectionType TEXT, Recorded INTEGER, IsDeleted INTEGER);
+    CREATE INDEX idx_ou_year_term ON OrganizationalUnits (Year, Term);
+    CREATE TABLE OrganizationalUnitAncestors (
+        OrgUnitId INTEGER NOT NULL, AncestorOrgUnitId INTEGER NOT NULL,
+        PRIMARY KEY (OrgUnitId, AncestorOrgUnitId));
+    CREATE TABLE Faculty (FacultyId INTEGER PRIMARY KEY, ProjectId INTEGER);
+    CREATE TABLE CourseProject (
+        OrgUnitId INTEGER NOT NULL, FacultyId INTEGER NOT NULL, ProjectId INTEGER NOT NULL,
+        PRIMARY KEY (OrgUnitId, FacultyId));
+    CREATE INDEX idx_course_project_project ON CourseProject (ProjectId, OrgUnitId);
+"""
+
+BUILD_COURSE_PROJECT = """
+    INSERT INTO CourseProject (OrgUnitId, FacultyId, ProjectId)
+    SELECT ou.OrgUnitId, f.FacultyId, f.ProjectId
+    FROM OrganizationalUnits ou
+    JOIN OrganizationalUnitAncestors oua ON oua.OrgUnitId = ou.OrgUnitId
+    JOIN Faculty f ON f.FacultyId = oua.AncestorOrgUnitId
+    WHERE f.ProjectId IS NOT NULL
+"""
+
+# Rows reaching the project filter, and the courses that pass it
+ANCESTOR_JOIN = """
+    FROM OrganizationalUnits ou
+    LEFT JOIN OrganizationalUnitAncestors oua ON ou.OrgUnitId = oua.OrgUnitId
+    LEFT JOIN Faculty f ON oua.AncestorOrgUnitId = f.FacultyId
+    WHERE ou.IsDeleted = 0 AND ou.Year = ? AND ou.Term = ?
+"""
+COURSE_PROJECT_JOIN = """
+    FROM OrganizationalUnits ou
+    JOIN CourseProject cp ON ou.OrgUnitId = cp.OrgUnitId
+    WHERE ou.IsDeleted = 0 AND ou.Year = ? AND ou.Term = ?
+"""
+
+COUNTS = """
+    SELECT COUNT(*), SUM(ou.Recorded >= 1)
+    {join} AND {project} = ?
+"""
+
+
+def load(db, frames, extra_ancestors):
+    courses = frames['OrganizationalUnits']
+    courses = courses[courses['OrgUnitTypeId'] == 3]
+    codes = courses['Code'].str.split('-', expand=True)
+    rng = np.random.default_rng(0)
+    db.executemany(
+        "INSERT INTO OrganizationalUnits VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        zip(courses['OrgUnitId'].tolist(), courses['Code'].tolist(),
+            codes[0].astype(int).tolist(), codes[1].tolist(), codes[4].tolist(), codes[6].tolist(),
+            rng.choice([0, 1], len(courses)).tolist(), courses['IsDeleted'].astype(int).tolist()))
+
+    ancestors = frames['OrganizationalUnitAncestors']
+    rows = list(zip(ancestors['OrgUnitId'].tolist(), ancestors['AncestorOrgUnitId'].tolist()))
+    # Deeper hierarchies than the synthetic extract (department, semester, template, ...) fan out further
+    ids = courses['OrgUnitId'].tolist()
+    for level in range(extra_ancestors):
+        rows += [(i, 1_000_000 * (level + 1) + i % 500) for i in ids]
+    db.executemany("INSERT OR IGNORE INTO OrganizationalUnitAncestors VALUES (?, ?)", rows)
+
+    db.executemany("INSERT INTO Faculty VALUES (?, ?)", [(f, f + 1000) for f in synthetic_data.FACULTY_IDS])
+    start = time.perf_counter()
+    db.execute(BUILD_COURSE_PROJECT)
+    return time.perf_counter() - start
+
+
+def timed(db, sql, params, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.execute(sql, params).fetchall()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the ancestor join fan-out against CourseProject.")
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--extra-ancestors', type=int, default=3,
+                        help="ancestor levels added per course on top of the synthetic extract's three")
+    parser.add_argument('--year', type=int, default=2024)
+    parser.add_argument('--term', default='FW')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='syllabus-fanout-') as data_dir:
+        frames = synthetic_data.generate(data_dir, args.scale)
+    db = sqlite3.connect(':memory:')
+    db.executescript(SCHEMA)
+    build_seconds = load(db, frames, args.extra_ancestors)
+    params = (args.year, args.term)
+
+    def count(sql):
+        return db.execute(f"SELECT COUNT(*) {sql}", params).fetchone()[0]
+
+    ancestor_rows = count(ANCESTOR_JOIN)
+    course_project_rows = count(COURSE_PROJECT_JOIN)
+    old = set(db.execute(f"SELECT ou.OrgUnitId, f.ProjectId {ANCESTOR_JOIN} AND f.ProjectId IS NOT NULL", params))
+    new = set(db.execute(f"SELECT ou.OrgUnitId, cp.ProjectId {COURSE_PROJECT_JOIN}", params))
+    if old != new:
+        print(f"Result mismatch: {len(old ^ new)} rows differ")
+        sys.exit(1)
+
+    print(f"{args.term} {args.year}: {len(new)} courses with a project; "
+          f"CourseProject built in {build_seconds * 1000:.0f} ms "
+          f"({db.execute('SELECT COUNT(*) FROM CourseProject').fetchone()[0]} rows)")
+    print(f"  rows before the project filter: {ancestor_rows} via ancestors, {course_project_rows} via CourseProject "
+          f"({ancestor_rows / max(course_project_rows, 1):.1f}x fan-out removed)")
+
+    old_total = new_total = 0.0
+    for faculty in synthetic_data.FACULTY_IDS:
+        project = (faculty + 1000,)
+        old_total += timed(db, COUNTS.format(join=ANCESTOR_JOIN, project='f.ProjectId'), params + project, args.repeat)
+        new_total += timed(db, COUNTS.format(join=COURSE_PROJECT_JOIN, project='cp.ProjectId'), params + project, args.repeat)
+    print(f"  fetch_counts over {len(synthetic_data.FACULTY_IDS)} projects (median of {args.repeat}): "
+          f"{old_total * 1000:.1f} ms via ancestors, {new_total * 1000:.1f} ms via CourseProject")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Check read-replica routing against the local primary + replica in benchmarks/replica.
+
+    docker compose -f benchmarks/replica/docker-compose.yml up -d
+    python benchmarks/replica_routing.py
+
+Sets up GTID replication from the primary (port 3307) to the replica (3308) if it is not
+running yet, loads tables/tables.sql and a few marker courses on the primary, and waits for
+them to reach the replica. Then runs the analytics lookups three ways and prints which server
+answered: with replication running (replica), with replication stopped (primary, as the
+replica is no longer current) and with the replica unreachable (primary). Exits 1 when a
+lookup is routed or answered differently than expected.
+"""
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mysql.connector
+
+YEAR = 2099
+PROJECT_ID = 99
+# (OrgUnitId, Code, Term, Department, SectionType, Recorded)
+COURSES = [
+    (990001, f'{YEAR}-FW-D2-S01-TEST-1P01-LEC', 'FW', 'TEST', 'LEC', 1),
+    (990002, f'{YEAR}-FW-D2-S02-TEST-1P01-LEC', 'FW', 'TEST', 'LEC', 0),
+    (990003, f'{YEAR}-FW-D2-S01-TEST-1P02-SEM', 'FW', 'TEST', 'SEM', 0),
+]
+
+
+def root(port, password):
+    return mysql.connector.connect(host='127.0.0.1', port=port, user='root', password=password,
+                                   database='syllabus', autocommit=True)
+
+
+def rows(conn, sql):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(sql)
+    result = cursor.fetchall()
+    cursor.close()
+    return result
+
+
+def setup_replication(primary, replica):
+    if rows(replica, "SHOW REPLICA STATUS"):
+        return
+    cursor = primary.cursor()
+    # Not written to the binlog, so the replica does not replay it
+    cursor.execute("SET SESSION sql_log_bin = 0")
+    cursor.execute("CREATE USER IF NOT EXISTS 'repl'@'%' IDENTIFIED BY 'repl'")
+    cursor.execute("GRANT REPLICATION SLAVE ON *.* TO 'repl'@'%'")
+    cursor.execute("GRANT REPLICATION CLIENT ON *.* TO 'syllabus'@'%'")
+    cursor.close()
+
+    cursor = replica.cursor()
+    cursor.execute("GRANT REPLICATION CLIENT ON *.* TO 'syllabus'@'%'")
+    cursor.execute("CHANGE REPLICATION SOURCE TO SOURCE_HOST='primary', SOURCE_USER='repl', "
+                   "SOURCE_PASSWORD='repl', SOURCE_AUTO_POSITION=1, GET_SOURCE_PUBLIC_KEY=1")
+    cursor.execute("START REPLICA")
+    cursor.close()
+
+
+def load_tables(primary):
+    cursor = primary.cursor()
+    cursor.execute("SHOW TABLES LIKE 'OrganizationalUnits'")
+    if not cursor.fetchall():
+        with open(os.path.join(ROOT, 'tables', 'tables.sql')) as f:
+            for statement in f.read().split(';'):
+                if statement.strip():
+                    cursor.execute(statement)
+
+    cursor.execute("DELETE FROM CourseProject WHERE ProjectId = %s", (PROJECT_ID,))
+    cursor.execute("DELETE FROM OrganizationalUnits WHERE Year = %s", (YEAR,))
+    cursor.executemany(
+        "INSERT INTO OrganizationalUnits (OrgUnitId, Code, Year, Term, Department, SectionType, Recorded, IsDeleted) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, 0)",
+        [(i, code, YEAR, term, dept, section, recorded) for i, code, term, dept, section, recorded in COURSES])
+    cursor.executemany("INSERT INTO CourseProject (OrgUnitId, FacultyId, ProjectId) VALUES (%s, %s, %s)",
+                       [(course[0], 1, PROJECT_ID) for course in COURSES])
+    cursor.close()
+
+
+def wait_for_replica(replica, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        found = rows(replica, f"SELECT COUNT(*) AS n FROM OrganizationalUnits WHERE Year = {YEAR}")
+        if found and found[0]['n'] == len(COURSES):
+            return
+        time.sleep(0.5)
+    raise SystemExit("The marker courses did not reach the replica; check SHOW REPLICA STATUS on port 3308.")
+
+
+def configure(args, replica_port):
+    os.environ.update({
+        'host': '127.0.0.1', 'port': str(args.primary_port),
+        'user': 'syllabus', 'password': 'syllabus', 'database': 'syllabus',
+        'replica_host': '127.0.0.1', 'replica_port': str(replica_port),
+        'replica_check_interval': '0',
+    })
+
+
+def lookups(csv_db):
+    """Run the routed lookups; returns ({lookup: result}, {target: reads}) for this pass."""
+    before = dict(csv_db.db_reads.values)
+    results = {
+        'get_last_three_years': csv_db.get_last_three_years() is not None,
+        'fetch_counts': csv_db.fetch_counts(YEAR, ['FW'], PROJECT_ID),
+        'fetch_department_count': [tuple(map(str, row)) for row in csv_db.fetch_department_count([YEAR], PROJECT_ID)],
+        'fetch_academic_year_courses': len(csv_db.fetch_academic_year_courses(YEAR, ['FW'], PROJECT_ID)),
+    }
+    reads = {key[0]: value - before.get(key, 0) for key, value in csv_db.db_reads.values.items()}
+    return results, {target: n for target, n in reads.items() if n}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check read-replica routing against the local two-instance setup.")
+    parser.add_argument('--primary-port', type=int, default=3307)
+    parser.add_argument('--replica-port', type=int, default=3308)
+    parser.add_argument('--closed-port', type=int, default=3309, help="a port nothing listens on")
+    parser.add_argument('--root-password', default='root')
+    args = parser.parse_args()
+
+    primary = root(args.primary_port, args.root_password)
+    replica = root(args.replica_port, args.root_password)
+    setup_replication(primary, replica)
+    load_tables(primary)
+    wait_for_replica(replica)
+
+    configure(args, args.replica_port)
+    import csv_db
+    from settings import settings
+
+    failures = 0
+    expected = None
+    passes = [('replicating', 'replica', None), ('replication stopped', 'primary', "STOP REPLICA"),
+              ('replica unreachable', 'primary', None)]
+    for name, target, statement in passes:
+        if statement:
+            replica.cursor().execute(statement)
+        if name == 'replica unreachable':
+            replica.cursor().execute("START REPLICA")
+            configure(args, args.closed_port)
+        # Drop the cached settings so the environment above is read again (reload() would re-apply .env)
+        settings.values.clear()
+        results, reads = lookups(csv_db)
+        expected = expected or results
+        ok = set(reads) == {target} and results == expected
+        failures += not ok
+        print(f"{name:<20} reads {reads}  {'ok' if ok else 'UNEXPECTED'}")
+        if not ok:
+            print(f"    {results}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Time and memory-profile the sync pipeline on synthetic data at several scales.
+
+    python benchmarks/run_benchmarks.py --scales 1 10 100
+    python benchmarks/run_benchmarks.py --scales 1 --compare benchmarks/results/<previous>.json
+
+Results are written as JSON to benchmarks/results/<timestamp>-<commit>.json. By default the
+DB stages run against an in-process null connection that accepts writes and answers the schema
+and OrgUnitId lookups from tables/tables.sql, so only the pipeline's own cost is measured.
+--db --db-name <database> writes the synthetic rows to that database on the configured MySQL
+server instead; it must be a scratch copy of the schema, never the database in .env.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+import synthetic_data
+
+
+def table_schemas(path=os.path.join(ROOT, 'tables', 'tables.sql')):
+    """{table: {column: data_type}} parsed from the CREATE TABLE statements."""
+    with open(path) as f:
+        sql = f.read()
+    schemas = {}
+    for table, body in re.findall(r'CREATE TABLE (\w+) \((.*?)\n\)', sql, re.S):
+        columns = {}
+        for line in body.splitlines():
+            match = re.match(r'\s*(\w+)\s+(\w+)', line)
+            if match and match.group(1).upper() not in ('PRIMARY', 'KEY', 'UNIQUE', 'INDEX'):
+                columns[match.group(1)] = match.group(2).lower()
+        schemas[table] = columns
+    return schemas
+
+
+class NullCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self.connection.statements += 1
+        if 'INFORMATION_SCHEMA.COLUMNS' in query:
+            # The schema registry's query: (table, column, type) rows for the requested tables
+            self.result = [(table, column, data_type) for table in params
+                           for column, data_type in self.connection.schemas.get(table, {}).items()]
+        elif re.search(r'SELECT OrgUnitId FROM OrganizationalUnits', query):
+            self.result = [(i,) for i in self.connection.org_unit_ids]
+        else:
+            self.result = []
+
+    def executemany(self, query, rows):
+        self.connection.statements += 1
+        self.connection.rows_written += len(rows)
+        self.rowcount = len(rows)
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def close(self):
+        pass
+
+
+class NullConnection:
+    """Stand-in for a mysql.connector connection that discards writes."""
+
+    def __init__(self, schemas, org_unit_ids=()):
+        self.schemas = schemas
+        self.org_unit_ids = list(org_unit_ids)
+        self.statements = 0
+        self.rows_written = 0
+
+    def cursor(self, *args, **kwargs):
+        return NullCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def measure(name, func, rows=None, repeat=1):
+    """Best wall/CPU time over `repeat` untraced runs, then the peak traced memory of one more run.
+
+    Timing and memory are measured separately because tracemalloc slows allocation-heavy code.
+    """
+    best = None
+    for _ in range(repeat):
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        func()
+        wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+        if best is None or wall < best['seconds']:
+            best = {'seconds': round(wall, 4), 'cpu_seconds': round(cpu, 4)}
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best['peak_mb'] = round(peak / 1e6, 2)
+
+    if rows is not None:
+        best['rows'] = rows
+        best['rows_per_second'] = round(rows / best['seconds']) if best['seconds'] else None
+    print(f"  {name:<32} {best['seconds']:>9.3f}s  {best['peak_mb']:>9.1f} MB peak")
+    return best
+
+
+def run_scale(scale, use_db, work_dir):
+    import csv_db
+    import d2l_functions
+
+    data_dir = os.path.join(work_dir, f"scale-{scale}")
+    print(f"Scale {scale}x: generating data in {data_dir}")
+    frames = synthetic_data.generate(data_dir, scale)
+
+    # Point the pipeline at the synthetic extracts
+    csv_db.file_path = data_dir
+    csv_db.cache_path = f'{data_dir}/cache'
+
+    schemas = table_schemas()
+    course_ids = frames['OrganizationalUnits'].loc[frames['OrganizationalUnits']['OrgUnitTypeId'] == 3, 'OrgUnitId']
+    if not use_db:
+        csv_db.get_db_connection = lambda: NullConnection(schemas, course_ids)
+
+    results = {}
+    codes = frames['OrganizationalUnits']['Code']
+    results['split_code'] = measure('split_code', lambda: codes.apply(csv_db.split_code), rows=len(codes))
+    results['split_codes'] = measure('split_codes', lambda: csv_db.split_codes(codes), rows=len(codes))
+
+    # Cold runs include converting the CSV into the Parquet cache
+    def cold(stage):
+        def run():
+            shutil.rmtree(csv_db.cache_path, ignore_errors=True)
+            stage()
+        return run
+
+    for stage, extract in ((csv_db.setOrganizationalUnits, 'OrganizationalUnits'),
+                           (csv_db.setContentObjects, 'ContentObjects')):
+        rows = len(frames[extract])
+        results[f'{stage.__name__}_cold'] = measure(f'{stage.__name__} (cold)', cold(stage), rows=rows)
+        results[stage.__name__] = measure(stage.__name__, stage, rows=rows)
+
+    ancestors = frames['OrganizationalUnitAncestors']
+    columns = list(schemas['OrganizationalUnitAncestors'])
+    conn = csv_db.get_db_connection()
+    results['write_to_table'] = measure(
+        'write_to_table', lambda: csv_db.write_to_table(conn, 'OrganizationalUnitAncestors', ancestors, columns),
+        rows=len(ancestors))
+
+    html_dir = os.path.join(data_dir, 'html')
+    all_courses = frames['AllCourses']
+    results['generate_syllabus_html'] = measure(
+        'generate_syllabus_html', lambda: d2l_functions.generate_syllabus_html(all_courses, html_dir),
+        rows=len(all_courses))
+
+    locations = frames['ContentObjects']['Location'].tolist()
+    results['classify_location'] = measure(
+        'classify_location', lambda: [d2l_functions.classify_location(loc) for loc in locations],
+        rows=len(locations), repeat=3)
+
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous.get('commit')} ({previous_path}):")
+    for scale, results in current['scales'].items():
+        for name, result in results.items():
+            before = previous.get('scales', {}).get(scale, {}).get(name)
+            if not before:
+                continue
+            change = (result['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0
+            print(f"  {scale}x {name:<32} {before['seconds']:>9.3f}s -> {result['seconds']:>9.3f}s ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sync pipeline on synthetic data.")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10])
+    parser.add_argument('--db', action='store_true', help="run DB stages against MySQL (requires --db-name)")
+    parser.add_argument('--db-name', help="scratch database for --db; must differ from the configured database")
+    parser.add_argument('--output', help="result file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument('--compare', help="previous result file to compare against")
+    args = parser.parse_args()
+
+    if args.db:
+        from settings import settings
+        if not args.db_name:
+            parser.error("--db requires --db-name, a scratch database the synthetic rows may overwrite")
+        if args.db_name == settings.db_name:
+            parser.error(f"--db-name {args.db_name} is the configured database; use a separate scratch database")
+        # The synthetic OrgUnitIds are upserted, so they must never reach the real tables
+        os.environ['database'] = args.db_name
+        settings.values.clear()
+    else:
+        # Configuration the pipeline reads when used; nothing connects to these
+        for key in ('BTGD-Faculty', 'host', 'user', 'password', 'database', 'bspace_url', 'api_route', 'secret_key'):
+            os.environ.setdefault(key, '0' if key == 'BTGD-Faculty' else 'benchmark')
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'db': 'mysql' if args.db else 'null',
+        'scales': {},
+    }
+    work_dir = tempfile.mkdtemp(prefix='syllabus-bench-')
+    try:
+        for scale in args.scales:
+            report['scales'][f"{scale:g}"] = run_scale(scale, args.db, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
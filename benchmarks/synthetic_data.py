@@ -0,0 +1,197 @@
+"""Synthetic Data Hub extracts shaped like ours, for benchmarking the sync pipeline.
+
+Scale 1 is roughly one institution's live data set; larger scales multiply the
+number of course offerings and everything hanging off them.
+
+    python benchmarks/synthetic_data.py --scale 10 --out /tmp/datahub
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# Course offerings at scale 1; the other extracts are sized relative to it
+BASE_COURSES = 20_000
+OTHER_UNITS_RATIO = 0.1
+CONTENT_PER_COURSE = 10
+SYLLABUS_RATE = 0.7
+INVALID_CODE_RATE = 0.02
+DELETED_RATE = 0.01
+
+TERMS = ['FW', 'SP', 'SU']
+DURATIONS = ['D01', 'D02', 'D03', 'D04']
+SECTION_TYPES = ['LEC', 'LEC', 'LEC', 'SEM', 'LAB', 'TUT', 'ASY', 'BLD', 'HYF', 'SYN', 'PRO', 'FLD']
+ADOPTION_STATUSES = ['Complete', 'Not Submitted', 'OER', 'No Titles/Complete', 'In Progress']
+DEPARTMENTS = [
+    'ACTG', 'ADST', 'APCO', 'ASTR', 'BIOL', 'BTEC', 'BTGD', 'CHEM', 'CHYS', 'CLAS', 'COSC', 'DART', 'ECON',
+    'EDUC', 'ENGL', 'ERSC', 'FILM', 'FREN', 'GEOG', 'GERM', 'HIST', 'HLSC', 'IASC', 'ITAL', 'KINE', 'LING',
+    'MATH', 'MARS', 'MUSI', 'NURS', 'PHIL', 'PHYS', 'POLI', 'PSYC', 'RECL', 'SCIE', 'SOCI', 'SPAN', 'SPMA',
+    'TOUR', 'VISA', 'WGST',
+]
+FACULTY_IDS = [6930, 6931, 6932, 6933, 6934, 6935, 6937]
+ROOT_ORG_UNIT = 6606
+
+
+def generate_courses(rng, n, first_id=100_000):
+    """Course offering rows with Code components; a few codes are malformed or deleted."""
+    ids = np.arange(first_id, first_id + n)
+    years = rng.integers(2022, 2026, n)
+    terms = rng.choice(TERMS, n)
+    durations = rng.choice(DURATIONS, n)
+    sections = np.char.add('S', np.char.zfill(rng.integers(1, 12, n).astype(str), 2))
+    departments = rng.choice(DEPARTMENTS, n)
+    course_numbers = np.char.add(np.char.add(rng.integers(1, 5, n).astype(str), rng.choice(['P', 'F', 'V'], n)),
+                                 np.char.zfill(rng.integers(1, 99, n).astype(str), 2))
+    section_types = rng.choice(SECTION_TYPES, n)
+
+    codes = pd.Series(years.astype(str)).str.cat(
+        [pd.Series(terms), pd.Series(durations), pd.Series(sections), pd.Series(departments),
+         pd.Series(course_numbers), pd.Series(section_types)], sep='-')
+    invalid = rng.random(n) < INVALID_CODE_RATE
+    codes[invalid] = codes[invalid].str.slice(0, 20)
+
+    return pd.DataFrame({
+        'OrgUnitId': ids,
+        'Code': codes,
+        'Year': years,
+        'Term': terms,
+        'Duration': durations,
+        'Section': sections,
+        'Department': departments,
+        'CourseNumber': course_numbers,
+        'SectionType': section_types,
+        'ValidCode': ~invalid,
+        'IsDeleted': rng.random(n) < DELETED_RATE,
+        'FacultyId': rng.choice(FACULTY_IDS, n),
+    })
+
+
+def organizational_units(rng, courses):
+    n_other = int(len(courses) * OTHER_UNITS_RATIO)
+    other_ids = np.arange(1, n_other + 1) + ROOT_ORG_UNIT + len(FACULTY_IDS)
+    n = len(courses) + n_other
+    created = pd.Timestamp('2022-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 4 * 365 * 86400, n), unit='s')
+    return pd.DataFrame({
+        'OrgUnitId': np.concatenate([courses['OrgUnitId'].to_numpy(), other_ids]),
+        'Organization': 'Brock University',
+        'Type': ['Course Offering'] * len(courses) + ['Department'] * n_other,
+        'Name': [f"Course {i}" for i in range(n)],
+        'Code': np.concatenate([courses['Code'].to_numpy(), rng.choice(DEPARTMENTS, n_other)]),
+        'StartDate': None,
+        'EndDate': None,
+        'IsActive': rng.random(n) < 0.95,
+        'CreatedDate': created.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'IsDeleted': np.concatenate([courses['IsDeleted'].to_numpy(), np.zeros(n_other, dtype=bool)]),
+        'DeletedDate': None,
+        'RecycledDate': None,
+        'Version': rng.integers(1, 10, n),
+        'OrgUnitTypeId': np.concatenate([np.full(len(courses), 3), np.full(n_other, 2)]),
+    })
+
+
+def content_objects(rng, courses):
+    org_unit_ids = np.repeat(courses['OrgUnitId'].to_numpy(), CONTENT_PER_COURSE)
+    n = len(org_unit_ids)
+    syllabus = (rng.random(n) < SYLLABUS_RATE / CONTENT_PER_COURSE)
+    titles = np.where(syllabus, rng.choice(['Course Syllabus', 'Syllabus', 'Course Outline', 'syllabus (updated)'], n),
+                      rng.choice(['Week 1', 'Assignment 1', 'Lecture Notes', 'Readings', 'Final Exam Info'], n))
+    locations = rng.choice([
+        '/content/enforced/{}-course/syllabus.pdf',
+        '/content/enforced/{}-course/outline.docx',
+        'https://example.com/{}/syllabus',
+        '/d2l/le/content/{}/viewContent/1/View',
+    ], n)
+    locations = [loc.format(org_unit_id) for loc, org_unit_id in zip(locations, org_unit_ids)]
+    modified = pd.Timestamp('2022-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 4 * 365 * 86400, n), unit='s')
+    return pd.DataFrame({
+        'ContentObjectId': np.arange(1, n + 1),
+        'OrgUnitId': org_unit_ids,
+        'Title': titles,
+        'ContentObjectType': np.where(rng.random(n) < 0.8, 'Topic', 'Module'),
+        'ContentObjectTypeId': 1,
+        'Location': locations,
+        'StartDate': None,
+        'EndDate': None,
+        'DueDate': None,
+        'LastModified': modified.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'IsDeleted': rng.random(n) < DELETED_RATE,
+    })
+
+
+def ancestors(courses):
+    ids = courses['OrgUnitId'].to_numpy()
+    return pd.DataFrame({
+        'OrgUnitId': np.concatenate([ids, ids, ids]),
+        'AncestorOrgUnitId': np.concatenate([ids, courses['FacultyId'].to_numpy(), np.full(len(ids), ROOT_ORG_UNIT)]),
+    })
+
+
+def book_list(rng, courses):
+    books = courses.sample(frac=0.8, random_state=int(rng.integers(0, 2**31)))
+    return pd.DataFrame({
+        'Term': books['Term'],
+        'Year': books['Year'],
+        'Department': books['Department'],
+        'CourseNumber': books['CourseNumber'],
+        'Section': books['Section'],
+        'Duration': books['Duration'],
+        'SectionType': books['SectionType'],
+        'LastName': 'Instructor',
+        'FirstName': 'Test',
+        'AdoptionStatus': rng.choice(ADOPTION_STATUSES, len(books)),
+        'Code': books['Code'],
+    })
+
+
+def all_courses(rng, courses, books):
+    """Frame shaped like the all_courses_query result, for the HTML generator."""
+    valid = courses[~courses['IsDeleted'] & courses['ValidCode']]
+    adoption = books.drop_duplicates('Code').set_index('Code')['AdoptionStatus']
+    n = len(valid)
+    return pd.DataFrame({
+        'OrgUnitId': valid['OrgUnitId'].to_numpy(),
+        'Code': valid['Code'].to_numpy(),
+        'Year': valid['Year'].to_numpy(),
+        'Term': valid['Term'].to_numpy(),
+        'Duration': valid['Duration'].to_numpy(),
+        'Section': valid['Section'].to_numpy(),
+        'Department': valid['Department'].to_numpy(),
+        'CourseNumber': valid['CourseNumber'].to_numpy(),
+        'SectionType': valid['SectionType'].to_numpy(),
+        'Recorded': rng.choice([0, 0, 1, 1, 2, 4, 5], n),
+        'Location': rng.choice(['/content/enforced/x/syllabus.pdf', 'https://example.com/syllabus',
+                                '/d2l/le/content/1/View', None], n),
+        'ProjectId': valid['FacultyId'].to_numpy() + 1000,
+        'AdoptionStatus': valid['Code'].map(adoption).to_numpy(),
+    })
+
+
+def generate(out_dir, scale=1, seed=42):
+    """Write the synthetic extracts to out_dir as Data Hub CSVs.
+
+    Returns a dict of the generated frames; 'AllCourses' is not written and is the
+    in-memory input for generate_syllabus_html.
+    """
+    rng = np.random.default_rng(seed)
+    courses = generate_courses(rng, int(BASE_COURSES * scale))
+    frames = {
+        'OrganizationalUnits': organizational_units(rng, courses),
+        'ContentObjects': content_objects(rng, courses),
+        'OrganizationalUnitAncestors': ancestors(courses),
+        'BookList': book_list(rng, courses),
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    for name, df in frames.items():
+        df.to_csv(os.path.join(out_dir, f"{name}.csv"), index=False)
+    frames['AllCourses'] = all_courses(rng, courses, frames['BookList'])
+    return frames
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic Data Hub extracts.")
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='benchmarks/data')
+    args = parser.parse_args()
+    for name, df in generate(args.out, args.scale, args.seed).items():
+        print(f"{name}: {len(df)} rows")
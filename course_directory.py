@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+import csv_db
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# Course code -> course lookups for the active terms, published by main.py and read by syllabus_api.
+# Layout: datahub/directory/<version>.json, with datahub/directory/CURRENT naming the live version.
+# Replacing CURRENT is the version bump that makes running API workers reload the directory.
+directory_path = 'datahub/directory'
+current_file = os.path.join(directory_path, 'CURRENT')
+KEEP_VERSIONS = 3
+
+# year, term and department are the strings extract_info() takes from the code
+Course = namedtuple('Course', ['org_unit_id', 'year', 'term', 'department', 'project_id'])
+
+
+def publish(terms):
+    """Build the directory for the (year, term) pairs from MySQL and make it current. Returns the version name."""
+    courses = {}
+    for _, rows in csv_db.stream_course_directory(terms):
+        for code, org_unit_id, year, term, department, project_id in rows:
+            courses[code] = [int(org_unit_id), str(year), term, department,
+                             None if project_id is None else int(project_id)]
+
+    version = str(time.time_ns())
+    os.makedirs(directory_path, exist_ok=True)
+    tmp_path = os.path.join(directory_path, f".{version}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({"version": version, "terms": [[int(y), str(t)] for y, t in terms], "courses": courses}, f)
+    os.rename(tmp_path, os.path.join(directory_path, f"{version}.json"))
+
+    tmp_current = f"{current_file}.tmp"
+    with open(tmp_current, 'w') as f:
+        f.write(version)
+    os.replace(tmp_current, current_file)
+
+    # Keep the most recent versions only
+    versions = sorted(name for name in os.listdir(directory_path) if name.endswith('.json') and name[:-5].isdigit())
+    for old in versions[:-KEEP_VERSIONS]:
+        try:
+            os.remove(os.path.join(directory_path, old))
+        except OSError:
+            pass
+
+    logger.info(f"Published course directory {version} ({len(courses)} courses).")
+    return version
+
+
+_loaded = {"stamp": None, "courses": {}}
+_load_lock = threading.Lock()
+
+
+def load_version(version):
+    with open(os.path.join(directory_path, f"{version}.json")) as f:
+        return {code: Course(*values) for code, values in json.load(f)['courses'].items()}
+
+
+def current():
+    """Return the live {code: Course}, reloading it when CURRENT has changed; empty if none is published."""
+    try:
+        stat = os.stat(current_file)
+    except FileNotFoundError:
+        return {}
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if _loaded["stamp"] == stamp:
+        return _loaded["courses"]
+
+    with _load_lock:
+        if _loaded["stamp"] != stamp:
+            try:
+                with open(current_file) as f:
+                    version = f.read().strip()
+                _loaded["courses"] = load_version(version)
+                logger.info(f"Loaded course directory {version} ({len(_loaded['courses'])} courses).")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Failed to load course directory: {e}")
+                _loaded["courses"] = {}
+            _loaded["stamp"] = stamp
+    return _loaded["courses"]
+
+
+def lookup(code):
+    """The Course for a code, or None when the directory does not have it so callers fall back to MySQL."""
+    return current().get(code)
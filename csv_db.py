@@ -1,9 +1,20 @@
-import pandas as pd
-import mysql.connector
 import os
 import re
-from logger_config import logger
-import dotenv
+import json
+import time
+import threading
+from logger_config import get_logger
+import run_metrics
+import telemetry
+import pipeline
+from lazy import lazy_import
+from settings import settings
+
+pd = lazy_import('pandas')
+mysql = lazy_import('mysql')
+pyarrow = lazy_import('pyarrow', optional=True)  # parquet engine for pandas
+
+logger = get_logger(__name__)
 
 department_courses_query = f"""
         SELECT 
@@ -11,13 +22,12 @@ department_courses_query = f"""
             ou.Year, ou.Term, ou.Duration, ou.Section, ou.Department, 
             ou.CourseNumber, ou.SectionType, ou.Recorded,
             co.Location, co.IsDeleted,
-            oua.AncestorOrgUnitId AS FacultyId,
-            f.ProjectId,
+            cp.FacultyId,
+            cp.ProjectId,
             bl.AdoptionStatus
         FROM OrganizationalUnits ou
         LEFT JOIN ContentObjects co ON ou.OrgUnitId = co.OrgUnitId
-        LEFT JOIN OrganizationalUnitAncestors oua ON ou.OrgUnitId = oua.OrgUnitId
-        LEFT JOIN Faculty f ON oua.AncestorOrgUnitId = f.FacultyId
+        JOIN CourseProject cp ON ou.OrgUnitId = cp.OrgUnitId
         LEFT JOIN (
             SELECT
                 Code,
@@ -30,54 +40,402 @@ department_courses_query = f"""
         ) bl ON ou.Code = bl.Code
         WHERE ou.Year = %s 
         AND ou.Term = %s 
-        AND ou.Department = %s
-        AND f.ProjectId IS NOT NULL;
+        AND ou.Department = %s;
     """
 
 file_path = 'datahub/'
-os.makedirs(file_path, exist_ok=True)
 
-BTGD = int(os.environ["BTGD-Faculty"])
 
-QUALIFIED_SECTION_TYPES = tuple(
-    s.strip() for s in os.environ.get(
-        "QUALIFIED_SECTION_TYPES",
-        "ASO,ASY,BLD,CLI,HYF,LEC,LL,SYN,SYO"
-    ).split(",")
-)
+def get_db_config():
+    return settings.db_config
 
-IGNORED_SECTION_TYPES = tuple(
-    s.strip() for s in os.environ.get(
-        "IGNORED_SECTION_TYPES",
-        "PRO,SEM,FLD,LAB,INT,ONM,IFT,TUT"
-    ).split(",")
-)
+db_query_seconds = telemetry.Histogram(
+    'syllabus_db_query_duration_seconds', 'Duration of csv_db database calls by function.', ['function'])
+db_connections = telemetry.Counter('syllabus_db_connections_total', 'MySQL connections opened.')
 
+db_prepared_statements = telemetry.Counter(
+    'syllabus_db_prepared_statements_total', 'Prepared statement lookups on pooled connections.', ['result'])
+db_reads = telemetry.Counter(
+    'syllabus_db_reads_total', 'Read-only queries by the server that answered them.', ['target'])
+
+# Set by enable_pool(): main.py while processing terms in parallel, and syllabus_api
+_pool = {"primary": None, "replica": None}
+_pool_lock = threading.Lock()
+# How long get_db_connection waits for a pooled connection to be returned
+POOL_TIMEOUT = 60
+# Pooled connections idle for longer are pinged before reuse, as the server may have dropped them
+POOL_IDLE_CHECK = 60
+
+
+def open_connection(role='primary'):
+    config = settings.db_replica_config if role == 'replica' else settings.db_config
+    # The C extension is used when it is installed, unless db_use_pure is set
+    use_pure = settings.db_use_pure if settings.db_use_pure is not None else not mysql.connector.HAVE_CEXT
+    return mysql.connector.connect(**config, use_pure=use_pure)
+
+
+class PooledConnection:
+    """A connection borrowed from a ConnectionPool; close() gives it back instead of disconnecting."""
+
+    def __init__(self, pool, cnx, statements):
+        self.pool = pool
+        self.cnx = cnx
+        # SQL text -> (prepared cursor, the SQL object it was prepared with), see execute_prepared
+        self.statements = statements
+
+    def __getattr__(self, name):
+        return getattr(self.cnx, name)
+
+    def close(self):
+        if self.cnx is not None:
+            cnx, self.cnx = self.cnx, None
+            self.pool.release(cnx, self.statements)
 
-def get_db_config():
-    return {
-        "host": os.environ["host"],
-        "user": os.environ["user"],
-        "password": os.environ["password"],
-        "database": os.environ["database"], 
-    }
 
-dotenv_file = dotenv.find_dotenv()
-dotenv.load_dotenv(dotenv_file)
+class ConnectionPool:
+    """Up to `size` connections shared by the threads of a process, opened when first needed.
+
+    A returned connection is rolled back, so the next borrower does not read from an old
+    snapshot. One that cannot be reset, e.g. after a stream stopped with unread rows, is
+    closed instead. Connections keep their prepared statements while pooled.
+    """
+
+    def __init__(self, size=None, timeout=POOL_TIMEOUT, role='primary'):
+        self.size = size
+        self.timeout = timeout
+        self.role = role
+        self.reset()
+
+    def reset(self):
+        # Also used in a forked child, which must not share the parent's sockets
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = None
+
+    def acquire(self):
+        with self.lock:
+            if self.slots is None:
+                self.size = self.size or settings.db_pool_size
+                self.slots = threading.BoundedSemaphore(self.size)
+        if not self.slots.acquire(timeout=self.timeout):
+            raise mysql.connector.errors.PoolError(f"No database connection free after {self.timeout}s")
+        try:
+            with self.lock:
+                entry = self.idle.pop() if self.idle else None
+            if entry is not None:
+                cnx, statements, last_used = entry
+                if time.monotonic() - last_used < POOL_IDLE_CHECK or cnx.is_connected():
+                    return PooledConnection(self, cnx, statements)
+            db_connections.inc()
+            return PooledConnection(self, open_connection(self.role), {})
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, cnx, statements):
+        try:
+            cnx.rollback()
+        except mysql.connector.Error:
+            try:
+                cnx.close()
+            except mysql.connector.Error:
+                pass
+        else:
+            with self.lock:
+                self.idle.append((cnx, statements, time.monotonic()))
+        finally:
+            self.slots.release()
+
+
+def enable_pool(size=None):
+    """Hand out connections from shared pools of `size` (db_pool_size by default), one for the
+    primary and one for the read replica, instead of opening one per call. Nothing connects
+    until a connection is first needed."""
+    with _pool_lock:
+        for role in _pool:
+            if _pool[role] is None:
+                _pool[role] = ConnectionPool(size, role=role)
+    return _pool["primary"]
+
+
+def reset_pool_after_fork():
+    for pool in _pool.values():
+        if pool is not None:
+            pool.reset()
+    _replica.update(checked=None, usable=False, checking=False)
+
+
+os.register_at_fork(after_in_child=reset_pool_after_fork)
+
+
+def connect(role='primary', pooled=True):
+    """A connection to the primary or the replica; from its pool when pooling is enabled and `pooled`."""
+    pool = _pool[role]
+    if pool is None or not pooled:
+        db_connections.inc()
+        return open_connection(role)
+    return pool.acquire()
 
-db_config = get_db_config()
 
 # Connect to the database
 def get_db_connection():
-    return mysql.connector.connect(**db_config)
+    return connect('primary')
 
-# Read CSV file
-def readCSV(file_path):
-    if os.path.exists(file_path):
-        return pd.read_csv(file_path, low_memory=False)
+
+# Whether reads may go to the replica, as of the last lag check (see replica_usable)
+_replica = {"checked": None, "usable": False, "checking": False}
+_replica_lock = threading.Lock()
+
+
+def replica_lag(conn):
+    """Seconds the replica is behind its source, or None when replication is not running."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except mysql.connector.errors.ProgrammingError:
+            # MySQL before 8.0.22 and MariaDB
+            cursor.execute("SHOW SLAVE STATUS")
+        channels = cursor.fetchall()
+    finally:
+        cursor.close()
+    lags = [row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master")) for row in channels]
+    if not lags or any(lag is None for lag in lags):
+        return None
+    return max(int(lag) for lag in lags)
+
+
+def set_replica_usable(usable):
+    with _replica_lock:
+        _replica.update(checked=time.monotonic(), usable=usable, checking=False)
+
+
+def replica_usable():
+    """Whether the replica is reachable and within replica_max_lag of the primary.
+
+    The lag is checked at most once per replica_check_interval; in between, and while
+    one thread is checking, the last answer is reused so no reader waits on the check.
+    """
+    with _replica_lock:
+        checked = _replica["checked"]
+        if _replica["checking"] or (checked is not None and
+                                    time.monotonic() - checked < settings.db_replica_check_interval):
+            return _replica["usable"]
+        _replica["checking"] = True
+
+    usable = False
+    try:
+        conn = connect('replica')
+        try:
+            lag = replica_lag(conn)
+        finally:
+            conn.close()
+        if lag is None:
+            logger.warning("Read replica is not replicating; reading from the primary.")
+        elif lag > settings.db_replica_max_lag:
+            logger.warning(f"Read replica is {lag}s behind (limit {settings.db_replica_max_lag}s); reading from the primary.")
+        else:
+            usable = True
+    except mysql.connector.Error as e:
+        logger.warning(f"Read replica check failed, reading from the primary: {e}")
+    finally:
+        set_replica_usable(usable)
+    return usable
+
+
+def get_read_connection(pooled=True):
+    """Connection for read-only queries: the replica when one is configured and current enough,
+    otherwise the primary. Use it only where results may be up to replica_max_lag seconds old."""
+    if settings.db_replica_config is not None and replica_usable():
+        try:
+            conn = connect('replica', pooled)
+        except mysql.connector.Error as e:
+            logger.warning(f"Read replica unavailable, reading from the primary: {e}")
+            set_replica_usable(False)
+        else:
+            db_reads.inc(target='replica')
+            return conn
+    db_reads.inc(target='primary')
+    return connect('primary', pooled)
+
+
+def execute_prepared(conn, sql, params=()):
+    """Execute sql as a server-side prepared statement and return the cursor holding the result.
+
+    On a pooled connection the statement stays prepared, so later calls with the same SQL
+    text only send the parameters. The cursor belongs to the connection: read the whole
+    result and do not close it. An unpooled connection has no later calls to reuse the
+    statement for, so the query runs on a plain buffered cursor and leaves no statement
+    prepared on the server.
+    """
+    if not isinstance(conn, PooledConnection):
+        cursor = conn.cursor(buffered=True)
+        cursor.execute(sql, params)
+        return cursor
+
+    entry = conn.statements.get(sql)
+    if entry is None:
+        db_prepared_statements.inc(result='miss')
+        entry = conn.statements[sql] = (conn.cursor(prepared=True), sql)
     else:
+        db_prepared_statements.inc(result='hit')
+    cursor, prepared_sql = entry
+    # The connector re-prepares unless it is given the very object it prepared
+    cursor.execute(prepared_sql, params)
+    return cursor
+
+
+# Explicit dtypes for each Data Hub extract: only the columns the pipeline uses are read,
+# IDs as nullable 32-bit ints, flags as nullable booleans and low-cardinality text as categories.
+DATAHUB_SCHEMAS = {
+    'OrganizationalUnits': {
+        'dtype': {
+            'OrgUnitId': 'Int32', 'OrgUnitTypeId': 'Int16', 'Name': 'string', 'Code': 'string',
+            'IsActive': 'boolean', 'CreatedDate': 'string', 'IsDeleted': 'boolean',
+        },
+        'dates': ['CreatedDate'],
+    },
+    'ContentObjects': {
+        'dtype': {
+            'ContentObjectId': 'Int32', 'OrgUnitId': 'Int32', 'Title': 'string', 'ContentObjectType': 'category',
+            'Location': 'string', 'LastModified': 'string', 'IsDeleted': 'boolean',
+        },
+        'dates': ['LastModified'],
+    },
+    'OrganizationalUnitAncestors': {
+        'dtype': {'OrgUnitId': 'Int32', 'AncestorOrgUnitId': 'Int32'},
+        'dates': [],
+    },
+}
+
+# Components of an OrganizationalUnits Code and their in-memory types
+CODE_COMPONENTS = {
+    'Year': 'Int16', 'Term': 'category', 'Duration': 'category', 'Section': 'category',
+    'Department': 'category', 'CourseNumber': 'category', 'SectionType': 'category',
+}
+
+
+# Read CSV file
+def readCSV(file_path, schema=None):
+    """Read a Data Hub extract. With a DATAHUB_SCHEMAS entry only its columns are read, with its dtypes."""
+    if schema is None:
+        if os.path.exists(file_path):
+            return pd.read_csv(file_path, low_memory=False)
         return pd.DataFrame()
 
+    dtype = schema['dtype']
+    if not os.path.exists(file_path):
+        return pd.DataFrame({col: pd.Series(dtype=t) for col, t in dtype.items()})
+    df = pd.read_csv(file_path, usecols=list(dtype), dtype=dtype)
+    return convert_datetime_columns(df, schema['dates'])
+
+
+# Columnar cache of the Data Hub extracts: datahub/cache/<Extract>-<version>.parquet, with
+# <Extract>.json recording the live version and the stat of the CSV it was converted from.
+cache_path = f'{file_path}/cache'
+
+
+def csv_stat(csv_path):
+    stat = os.stat(csv_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def cache_extract(name, version=None, row_group_size=100_000):
+    """Convert datahub/<name>.csv once into a typed Parquet file keyed by the extract version.
+
+    version is the extract timestamp from Data Hub; the CSV modification time is used when
+    it is not known. Returns the Parquet path, or None when the cache cannot be built.
+    """
+    csv_path = f'{file_path}/{name}.csv'
+    if pyarrow is None or not os.path.exists(csv_path):
+        return None
+    version = re.sub(r'[^0-9A-Za-z]+', '', str(version)) if version else str(csv_stat(csv_path)[0])
+    parquet_path = f'{cache_path}/{name}-{version}.parquet'
+    manifest_path = f'{cache_path}/{name}.json'
+
+    try:
+        if not os.path.exists(parquet_path):
+            os.makedirs(cache_path, exist_ok=True)
+            df = readCSV(csv_path, DATAHUB_SCHEMAS[name])
+            df.to_parquet(f'{parquet_path}.tmp', index=False, row_group_size=row_group_size)
+            os.replace(f'{parquet_path}.tmp', parquet_path)
+            logger.info(f"Cached {name} extract {version}: {len(df)} rows.")
+
+        with open(f'{manifest_path}.tmp', 'w') as f:
+            json.dump({"version": version, "path": parquet_path, "source": csv_stat(csv_path)}, f)
+        os.replace(f'{manifest_path}.tmp', manifest_path)
+    except Exception as e:
+        # read_extract falls back to the CSV while the manifest does not match it
+        logger.error(f"Caching the {name} extract failed, it will be read from the CSV: {e!r}")
+        for tmp in (f'{parquet_path}.tmp', f'{manifest_path}.tmp'):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return None
+
+    # Older versions of this extract are no longer needed
+    for entry in os.listdir(cache_path):
+        if entry.startswith(f'{name}-') and entry.endswith('.parquet') and f'{cache_path}/{entry}' != parquet_path:
+            os.remove(f'{cache_path}/{entry}')
+    return parquet_path
+
+
+def cached_extract_path(name):
+    """Parquet path for the extract when the cache is current with its CSV (or the CSV is gone), else None."""
+    manifest_path = f'{cache_path}/{name}.json'
+    if pyarrow is None or not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    csv_path = f'{file_path}/{name}.csv'
+    if os.path.exists(csv_path) and csv_stat(csv_path) != manifest["source"]:
+        return None
+    return manifest["path"] if os.path.exists(manifest["path"]) else None
+
+
+def extract_versions():
+    """{extract: version} of the Data Hub extracts on disk: the cached version, else the CSV's stat, else None."""
+    versions = {}
+    for name in DATAHUB_SCHEMAS:
+        csv_path = f'{file_path}/{name}.csv'
+        if cached_extract_path(name):
+            with open(f'{cache_path}/{name}.json') as f:
+                versions[name] = json.load(f)["version"]
+        elif os.path.exists(csv_path):
+            versions[name] = list(csv_stat(csv_path))
+        else:
+            versions[name] = None
+    return versions
+
+
+def read_extract(name, columns=None, filters=None):
+    """Read a Data Hub extract, from the Parquet cache when it is current.
+
+    columns and filters (pyarrow filter tuples, e.g. [('OrgUnitTypeId', '==', 3)]) are pushed
+    down to the Parquet reader; on the CSV fallback they are applied after reading.
+    """
+    parquet_path = cached_extract_path(name)
+    if parquet_path is None:
+        parquet_path = cache_extract(name)
+    if parquet_path is not None:
+        return pd.read_parquet(parquet_path, columns=columns, filters=filters)
+
+    df = readCSV(f'{file_path}/{name}.csv', DATAHUB_SCHEMAS[name])
+    for col, op, value in filters or []:
+        if op != '==':
+            raise ValueError(f"Unsupported filter operator: {op}")
+        df = df[df[col] == value]
+    return df[columns] if columns else df
+
+
+def memory_report(stage, df, baseline=None):
+    """Log the deep memory use of a frame at a pipeline stage, relative to `baseline` bytes when given."""
+    used = int(df.memory_usage(deep=True).sum())
+    message = f"Memory {stage}: {len(df)} rows, {used / 1e6:.1f} MB"
+    if baseline:
+        message += f" ({used / baseline:.0%} of {baseline / 1e6:.1f} MB)"
+    logger.info(message)
+    return used
+
 # Function to split Code into 7 components and validate the format
 def split_code(code):
     if pd.isna(code):  # Check for NaN values
@@ -94,162 +452,282 @@ def split_code(code):
     logger.warning(f"Unexpected code format: {code}")
     return [None] * 7  # Placeholder if the format doesn't match
 
-# Convert datetime columns to MySQL-friendly format
+
+def split_codes(codes):
+    """split_code over a Series: returns a frame of the CODE_COMPONENTS columns, typed,
+    with all components missing where the code is invalid."""
+    codes = codes.astype('string')
+    valid = codes.str.match(r'^\d{4}-[A-Z]{2}-D\d{2}-S\d{2}').fillna(False).astype(bool)
+
+    missing = [None] * len(CODE_COMPONENTS)
+    parts = [code.split('-') if ok else missing for code, ok in zip(codes.tolist(), valid.tolist())]
+    unexpected = [code for code, p in zip(codes.tolist(), parts) if len(p) != len(CODE_COMPONENTS)]
+    if unexpected:
+        logger.warning(f"Unexpected code format in {len(unexpected)} codes, e.g. {unexpected[:5]}")
+        parts = [p if len(p) == len(CODE_COMPONENTS) else missing for p in parts]
+
+    split = pd.DataFrame(parts, index=codes.index, columns=list(CODE_COMPONENTS))
+    split['Year'] = pd.to_numeric(split['Year'])
+    return split.astype(CODE_COMPONENTS)
+
+# Parse datetime columns in place; formatting for MySQL happens when rows are written
 def convert_datetime_columns(df, datetime_columns):
-    df = df.copy()  # Ensure a deep copy to avoid modifying a slice
     for col in datetime_columns:
-        if col in df.columns:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
             df[col] = pd.to_datetime(df[col], errors="coerce")  # Convert to datetime format
             
-            if pd.api.types.is_datetime64_any_dtype(df[col]):
-                df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S")  # Format for MySQL
-            else:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
                 logger.warning(f"Warning: Column {col} contains non-datetime values. Check for invalid formats.")
     return df
 
 
-# Retrieve column names ordered as the ordinal position and their data types from a given table
-def get_table_columns(cursor, table_name):
-    """Retrieve column names and their data types in the correct table order."""
-    query = f"""
-    SELECT COLUMN_NAME, DATA_TYPE
-    FROM INFORMATION_SCHEMA.COLUMNS
-    WHERE TABLE_NAME = '{table_name}'
-    ORDER BY ORDINAL_POSITION;
+# Tables whose columns csv_db writes by name
+MANAGED_TABLES = ('OrganizationalUnits', 'ContentObjects', 'OrganizationalUnitAncestors', 'CourseProject', 'Faculty', 'BookList')
+DATETIME_TYPES = ('datetime', 'timestamp', 'date')
+
+
+class SchemaRegistry:
+    """Column order and data types of the managed tables, read once per process.
+
+    All tables are loaded with one query scoped to the connected database. migrate()
+    invalidates the registry, so the next lookup sees the new columns.
     """
-    cursor.execute(query)
-    return {row[0]: row[1] for row in cursor.fetchall()}
 
+    def __init__(self, tables):
+        self.tables = tuple(tables)
+        self.columns = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        placeholders = ", ".join(["%s"] * len(self.tables))
+        query = f"""
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+            ORDER BY TABLE_NAME, ORDINAL_POSITION;
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, self.tables)
+            columns = {table: {} for table in self.tables}
+            for table, column, data_type in cursor.fetchall():
+                columns[table][column] = data_type.lower()
+        finally:
+            cursor.close()
+            conn.close()
+        return columns
 
-def setOrganizationalUnits():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    def table(self, name):
+        """{column: data_type} in ordinal order."""
+        columns = self.columns
+        if columns is None:
+            with self.lock:
+                if self.columns is None:
+                    self.columns = self.load()
+                columns = self.columns
+        if name not in columns:
+            raise KeyError(f"{name} is not a managed table")
+        return columns[name]
 
-    organizational_units_df = readCSV(f'{file_path}/OrganizationalUnits.csv')
-    
-    # Filter out Course Offerings only
-    organizational_units_df = organizational_units_df[organizational_units_df['OrgUnitTypeId'] == 3]
-    # Select only the needed columns from OrganizationalUnits.csv
-    organizational_units_filtered = organizational_units_df[[
-        'OrgUnitId', 'Name', 'Code', 'IsActive', 'CreatedDate', 'IsDeleted'
-    ]]
+    def column_names(self, name):
+        return list(self.table(name))
 
-    # Extract the split components of Code into separate columns
-    split_columns = organizational_units_filtered['Code'].apply(split_code).apply(pd.Series)
-    split_columns.columns = ['Year', 'Term', 'Duration', 'Section', 'Department', 'CourseNumber', 'SectionType']
+    def datetime_columns(self, name):
+        return [column for column, data_type in self.table(name).items() if data_type in DATETIME_TYPES]
 
-    # Safely add the new columns to the DataFrame
-    organizational_units_filtered = pd.concat([organizational_units_filtered, split_columns], axis=1)
+    def invalidate(self):
+        with self.lock:
+            self.columns = None
 
-    # Filter out records based on blank values and deletion flags 
-    filtered_df = organizational_units_filtered[
-        (organizational_units_filtered['Year'].notna()) &
-        (organizational_units_filtered['Department'].notna()) &
-        (organizational_units_filtered['Term'].notna()) & 
-        (~organizational_units_filtered['IsDeleted'].astype(bool))    # Ensures IsDeleted is False or 0
-    ]
-    
-    table_columns_dict = get_table_columns(cursor, 'OrganizationalUnits')
-    table_columns = list(table_columns_dict.keys())
-    datetime_columns = [col for col, dtype in table_columns_dict.items() if dtype in ("datetime", "timestamp")]
-    
-    filtered_df = filtered_df.copy()
-    if not filtered_df.empty:
-        filtered_df = convert_datetime_columns(filtered_df, datetime_columns)
-        filtered_df = filtered_df.astype(object).where(pd.notnull(filtered_df), None)
-        filtered_df['Recorded'] = 0
-        write_to_table(conn, 'OrganizationalUnits', filtered_df, table_columns)
 
-    cursor.close()
-    conn.close()
+schema = SchemaRegistry(MANAGED_TABLES)
 
 
-def setContentObjects():
+def migrate(statements):
+    """Run DDL statements against the database and refresh the schema registry."""
     conn = get_db_connection()
     cursor = conn.cursor()
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+        schema.invalidate()
 
-    content_objects_df = readCSV(f'{file_path}/ContentObjects.csv')
 
-    # Select only the needed columns from ContentObject.csv
-    content_objects_filtered = content_objects_df[[
-        'ContentObjectId', 'OrgUnitId', 'Title', 'ContentObjectType', 'Location', 'LastModified', 'IsDeleted'
-    ]]
+def read_organizational_units():
+    """Course offerings from the OrganizationalUnits extract with their split Code, ready to write."""
+    # Course Offerings only, filtered in the reader
+    organizational_units_df = read_extract(
+        'OrganizationalUnits',
+        columns=['OrgUnitId', 'Name', 'Code', 'IsActive', 'CreatedDate', 'IsDeleted'],
+        filters=[('OrgUnitTypeId', '==', 3)],
+    )
+    read_bytes = memory_report('OrganizationalUnits read', organizational_units_df)
 
-    # Scanning for 'syllabus' or 'course outline' in the ContentObjects for Topic type only
-    filtered_content_objects = content_objects_filtered[
-        (content_objects_filtered['Title'].str.contains('Syllabus|course outline', case=False, na=False)) &
-        (content_objects_filtered['ContentObjectType'] == 'Topic')
-    ]
+    # Extract the split components of Code into separate columns
+    split_columns = split_codes(organizational_units_df['Code'])
 
-    filtered_content_objects = filtered_content_objects.copy()  # Create a deep copy to ensure no warnings
-    filtered_content_objects.loc[:, 'LastModified'] = pd.to_datetime(filtered_content_objects['LastModified'], errors='coerce')
+    # Filter out records based on blank values and deletion flags 
+    keep = (
+        split_columns['Year'].notna() &
+        split_columns['Department'].notna() &
+        split_columns['Term'].notna() &
+        ~organizational_units_df['IsDeleted'].fillna(False)    # Ensures IsDeleted is False or 0
+    )
+    filtered_df = pd.concat([
+        organizational_units_df.loc[keep, ['OrgUnitId', 'Name', 'Code', 'IsActive', 'CreatedDate', 'IsDeleted']],
+        split_columns[keep],
+    ], axis=1)
+    filtered_df['Recorded'] = 0
+    memory_report('OrganizationalUnits filtered', filtered_df, read_bytes)
+    return filtered_df
 
-    # Group by OrgUnitId and keep the row with the latest LastModified
-    filtered_df = filtered_content_objects.loc[
-        filtered_content_objects.groupby('OrgUnitId')['LastModified'].idxmax()
-    ].reset_index(drop=True)
 
-    # Running ContentObjects
+def write_organizational_units(units):
+    if units.empty:
+        return
+    conn = get_db_connection()
+    try:
+        write_to_table(conn, 'OrganizationalUnits', units)
+    finally:
+        conn.close()
 
-    query_orgunits = "SELECT OrgUnitId FROM OrganizationalUnits;"
-    cursor.execute(query_orgunits)
-    results = cursor.fetchall()
-    orgunit_df = pd.DataFrame(results, columns=['OrgUnitId'])
 
+def read_content_objects():
+    """The latest syllabus-like topic per OrgUnitId from the ContentObjects extract."""
+    # Topic type only, filtered in the reader
+    content_objects_df = read_extract('ContentObjects', filters=[('ContentObjectType', '==', 'Topic')])
+    memory_report('ContentObjects read', content_objects_df)
 
-    filtered_content_objects_df = filtered_df[
-        filtered_df["OrgUnitId"].isin(orgunit_df["OrgUnitId"])
+    # Scanning for 'syllabus' or 'course outline' in the ContentObjects
+    filtered_content_objects = content_objects_df[
+        content_objects_df['Title'].str.contains('Syllabus|course outline', case=False, na=False)
     ]
-    table_columns_dict = get_table_columns(cursor, 'ContentObjects')
-    table_columns = list(table_columns_dict.keys())
-    if 'Recorded' in table_columns:
-        table_columns.remove('Recorded')
-    print(table_columns)
-    datetime_columns = [col for col, dtype in table_columns_dict.items() if dtype in ("datetime", "timestamp")]
-
-    filtered_content_objects_df = filtered_content_objects_df.copy()  # Ensure it's a copy
-    if not filtered_content_objects_df.empty:
-        filtered_content_objects_df = convert_datetime_columns(filtered_content_objects_df, datetime_columns)
-        filtered_content_objects_df = filtered_content_objects_df.astype(object).where(pd.notnull(filtered_content_objects_df), None)
-        write_to_table(conn, 'ContentObjects', filtered_content_objects_df, table_columns)
-    
-    cursor.close()
-    conn.close()
 
+    # Keep the row with the latest LastModified per OrgUnitId (first one on ties)
+    return filtered_content_objects.sort_values(
+        'LastModified', ascending=False, na_position='last', kind='stable'
+    ).drop_duplicates('OrgUnitId')
 
 
-def setAncestors():
+def existing_org_unit_ids(org_unit_ids, chunk_size=1000):
+    """The subset of org_unit_ids present in OrganizationalUnits, looked up by primary key."""
+    ids = sorted({int(i) for i in org_unit_ids})
+    found = set()
+    if not ids:
+        return found
     conn = get_db_connection()
     cursor = conn.cursor()
+    try:
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"SELECT OrgUnitId FROM OrganizationalUnits WHERE OrgUnitId IN ({placeholders})", chunk)
+            found.update(row[0] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
+    return found
 
-    ancestors_df = readCSV(f'{file_path}/OrganizationalUnitAncestors.csv')
-    ancestors_table_columns_dict = get_table_columns(cursor, 'OrganizationalUnitAncestors')
-    ancestors_table_columns = list(ancestors_table_columns_dict.keys())
-    
-    write_to_table(conn, 'OrganizationalUnitAncestors', ancestors_df, ancestors_table_columns)
-    cursor.close()
-    conn.close()
 
-# Sets the temporarly tables and writes daily data to them
-def setDb():
+def filter_content_objects(content, units=None):
+    """Keep the content objects whose unit is in OrganizationalUnits.
+
+    `units` are the units this run writes; they are matched in memory and only the remaining
+    OrgUnitIds (units from earlier runs, e.g. in differential mode) are looked up in the table.
+    """
+    known = set(units['OrgUnitId'].dropna().astype(int)) if units is not None else set()
+    in_run = content['OrgUnitId'].isin(known)
+    known |= existing_org_unit_ids(content.loc[~in_run, 'OrgUnitId'].dropna())
+    filtered_content_objects_df = content[content['OrgUnitId'].isin(known)]
+    memory_report('ContentObjects filtered', filtered_content_objects_df)
+    return filtered_content_objects_df
+
+
+def write_content_objects(content):
+    if content.empty:
+        return
+    # Recorded belongs to OrganizationalUnits; a ContentObjects column of that name is never written
+    columns = [col for col in schema.column_names('ContentObjects') if col != 'Recorded']
+    conn = get_db_connection()
+    try:
+        write_to_table(conn, 'ContentObjects', content, columns)
+    finally:
+        conn.close()
 
-    logger.info('Running OrganizationalUnits...')
-    setOrganizationalUnits()
-    logger.info('OrganizationalUnits tables updated successfully.')
 
-    logger.info('Running ContentObjects...')
-    setContentObjects()
-    logger.info('ContentObjects table updated successfully.')
+def read_ancestors():
+    ancestors_df = read_extract('OrganizationalUnitAncestors')
+    memory_report('OrganizationalUnitAncestors read', ancestors_df)
+    return ancestors_df
 
-    logger.info('Running OrganizationalUnitAncestors...')
-    setAncestors()
-    logger.info('OrganizationalUnitAncestors table updated successfully.')
 
-    update_btgd_ancestor_orgunit()
+def write_ancestors(ancestors):
+    conn = get_db_connection()
+    try:
+        write_to_table(conn, 'OrganizationalUnitAncestors', ancestors)
+    finally:
+        conn.close()
 
 
+def setOrganizationalUnits():
+    units = read_organizational_units()
+    write_organizational_units(units)
+    return units
 
-def write_to_table(conn, table, df, table_columns, batch_size=1000):
+
+def setContentObjects(units=None):
+    write_content_objects(filter_content_objects(read_content_objects(), units))
+
+
+def setAncestors():
+    write_ancestors(read_ancestors())
+
+
+# Sets the temporarly tables and writes daily data to them
+def setDb():
+    """Load the Data Hub extracts into the database as a graph of steps (see pipeline.py).
+
+    The three extracts are read concurrently. ContentObjects are matched against the units
+    read in this run in memory, and each table is written as soon as its frame is ready.
+    The department ancestor overrides run after both tables they join are written, and
+    CourseProject is refreshed from the final ancestors.
+    """
+    pipeline.run([
+        pipeline.Step('read_units', read_organizational_units),
+        pipeline.Step('read_content_objects', read_content_objects),
+        pipeline.Step('read_ancestors', read_ancestors),
+        pipeline.Step('write_units', write_organizational_units, needs=['read_units']),
+        pipeline.Step('filter_content_objects', filter_content_objects, needs=['read_content_objects', 'read_units']),
+        pipeline.Step('write_content_objects', write_content_objects, needs=['filter_content_objects']),
+        pipeline.Step('write_ancestors', write_ancestors, needs=['read_ancestors']),
+        pipeline.Step('remap_department_ancestors', lambda *_: remap_department_ancestors(),
+                      needs=['write_units', 'write_ancestors']),
+        pipeline.Step('refresh_course_project', lambda *_: refresh_course_project(),
+                      needs=['remap_department_ancestors']),
+    ], max_workers=settings.setdb_workers)
+
+
+# Column values as native Python objects for the connector: NA -> None, datetimes formatted for MySQL.
+# as_datetime parses text first, for columns the table declares as DATETIME.
+def column_values(series, as_datetime=False):
+    if as_datetime and not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series, errors="coerce")
+    if pd.api.types.is_datetime64_any_dtype(series):
+        formatted = series.dt.strftime("%Y-%m-%d %H:%M:%S")
+        return formatted.astype(object).where(series.notna(), None).tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def write_to_table(conn, table, df, table_columns=None, batch_size=1000):
+    """Upsert df into table. The columns default to the table's, from the schema registry."""
+    if table_columns is None:
+        table_columns = schema.column_names(table)
+    datetime_columns = set(schema.datetime_columns(table))
     cursor = conn.cursor()
     placeholders = ", ".join(["%s"] * len(table_columns))
     #update_placeholders = ", ".join([f"{col} = VALUES({col})" for col in table_columns])
@@ -264,7 +742,8 @@ def write_to_table(conn, table, df, table_columns, batch_size=1000):
         ON DUPLICATE KEY UPDATE {update_placeholders};
     """
 
-    data = [tuple(row) for _, row in df[table_columns].iterrows()]
+    # Convert column by column instead of materialising an object copy of the whole frame
+    data = list(zip(*(column_values(df[col], col in datetime_columns) for col in table_columns)))
     if not data:
         logger.info(f"Skipping '{table}' as there are no records to insert.")
         cursor.close()
@@ -275,6 +754,7 @@ def write_to_table(conn, table, df, table_columns, batch_size=1000):
             batch = data[i:i + batch_size]
             cursor.executemany(query, batch)
             conn.commit()
+            run_metrics.count('db_rows_written', len(batch))
     except mysql.connector.Error as err:
         logger.error(f"Error inserting into '{table}': {err}")
     finally:
@@ -282,18 +762,9 @@ def write_to_table(conn, table, df, table_columns, batch_size=1000):
 
 
 def get_sylabus(query, term, year):
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
         logger.info("Executing syllabus query...")
-        cursor.execute(query, (year, term))
-        syllabus_results = cursor.fetchall()
-
-        # Fetch column names
-        column_names = [desc[0] for desc in cursor.description]
-        df_syllabus = pd.DataFrame(syllabus_results, columns=column_names)
+        df_syllabus = fetch_frame(query, (year, term), name='get_sylabus')
 
         if df_syllabus.empty:
             logger.warning("No syllabus records found.")
@@ -304,42 +775,87 @@ def get_sylabus(query, term, year):
         logger.error(f"Error executing syllabus query: {err}")
         return pd.DataFrame()  # Return an empty DataFrame instead of None
 
+
+# OrgUnitIds per `WHERE OrgUnitId IN (...)` statement in set_recorded
+RECORDED_CHUNK_SIZE = 1000
+
+
+@telemetry.timed(db_query_seconds)
+def set_recorded(org_unit_ids, values=1):
+    """Set OrganizationalUnits.Recorded for many units in one transaction.
+
+    `org_unit_ids` is any sequence of ids (list, array, Series); `values` is one value for
+    all of them or a sequence of the same length. The units are grouped by value and each
+    group is written with chunked `UPDATE ... WHERE OrgUnitId IN (...)` statements.
+    Returns {value: rows changed}; rows that already had the value are not counted.
+    """
+    ids = [int(i) for i in org_unit_ids]
+    # One value for all units; ids and values usually come from frames, so numpy scalars too
+    if pd.api.types.is_scalar(values):
+        values = [values] * len(ids)
+    groups = {}
+    for org_unit_id, value in zip(ids, values):
+        groups.setdefault(int(value), set()).add(org_unit_id)
+    if not groups:
+        return {}
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    changed = dict.fromkeys(groups, 0)
+    try:
+        for value, group in groups.items():
+            group = sorted(group)
+            for i in range(0, len(group), RECORDED_CHUNK_SIZE):
+                chunk = group[i:i + RECORDED_CHUNK_SIZE]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"UPDATE OrganizationalUnits SET Recorded = %s WHERE OrgUnitId IN ({placeholders})",
+                    (value, *chunk))
+                changed[value] += max(cursor.rowcount, 0)
+        conn.commit()
+        run_metrics.count('db_rows_written', sum(changed.values()))
+        return changed
+
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
 
 
-def update_syllabus_recorded(df, value=1):
-    batch_size=1000
+SET_COURSE_RECORDED_SQL = "UPDATE OrganizationalUnits SET Recorded = %s WHERE OrgUnitId = %s"
+
+
+@telemetry.timed(db_query_seconds)
+def set_course_recorded(org_unit_id, value):
+    """Set Recorded for a single unit, as the upload and exempt endpoints do. Returns rows changed."""
     conn = get_db_connection()
-    cursor = conn.cursor()
+    try:
+        cursor = execute_prepared(conn, SET_COURSE_RECORDED_SQL, (int(value), int(org_unit_id)))
+        conn.commit()
+        run_metrics.count('db_rows_written', max(cursor.rowcount, 0))
+        return cursor.rowcount
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-    update_query = """
-        UPDATE OrganizationalUnits 
-        SET Recorded = %s 
-        WHERE OrgUnitId = %s;
-    """
-    
+
+def update_syllabus_recorded(df, value=1):
+    """Set Recorded = value for every OrgUnitId in df; returns the number of rows changed (0 on failure)."""
     if df.empty:
         logger.info("No rows to update in OrganizationalUnits.")
-        return
-    
-    # Prepare the data as a list of tuples
-    data = [(int(value), int(row['OrgUnitId'])) for _, row in df.iterrows()]
+        return 0
     try:
-        for i in range(0, len(data), batch_size):
-            batch = data[i:i + batch_size]
-            cursor.executemany(update_query, batch)
-            conn.commit()
-
+        return sum(set_recorded(df['OrgUnitId'].to_numpy(), value).values())
     except mysql.connector.Error as err:
         logger.error(f"Error updating OrganizationalUnits with Recorded fields value: {err}")
-        conn.rollback()
-    finally:
-        cursor.close()
-        conn.close()
+        return 0
 
 
+@telemetry.timed(db_query_seconds)
 def upsert_content_object(content_object_id, org_unit_id, title, content_type, location, last_modified, is_deleted):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -366,6 +882,7 @@ def upsert_content_object(content_object_id, org_unit_id, title, content_type, l
     try:
         cursor.execute(query, values)
         conn.commit()
+        run_metrics.count('db_rows_written')
         logger.info(f"Upserted ContentObject for OrgUnitId={org_unit_id}")
     except mysql.connector.Error as err:
         logger.error(f"Error upserting ContentObject: {err}")
@@ -375,38 +892,29 @@ def upsert_content_object(content_object_id, org_unit_id, title, content_type, l
         conn.close()            
 
 
+ORG_UNIT_BY_CODE_SQL = "SELECT OrgUnitId FROM OrganizationalUnits WHERE Code = %s"
+
+
+@telemetry.timed(db_query_seconds)
 def get_orgUnitId_by_code(code):
+    conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        query = "SELECT OrgUnitId FROM OrganizationalUnits WHERE Code = %s"
-        cursor.execute(query, (code,))
-        result = cursor.fetchone()
-        return result[0] if result else None
+        result = execute_prepared(conn, ORG_UNIT_BY_CODE_SQL, (code,)).fetchall()
+        return result[0][0] if result else None
 
     except mysql.connector.Error as err:
-        print(f"Database error: {err}")
+        logger.error(f"Database error: {err}")
         return None
 
     finally:
-        if cursor:
-            cursor.close()
         if conn:
             conn.close()
 
 def get_department_cources(term, year, department):
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
         logger.info("Executing department courses query...")
-        cursor.execute(department_courses_query, (year, term, department))
-        syllabus_results = cursor.fetchall()
-
-        # Fetch column names
-        column_names = [desc[0] for desc in cursor.description]
-        df_syllabus = pd.DataFrame(syllabus_results, columns=column_names)
+        df_syllabus = fetch_frame(department_courses_query, (year, term, department), name='get_department_cources')
 
         if df_syllabus.empty:
             logger.warning("No course records found.")
@@ -417,99 +925,178 @@ def get_department_cources(term, year, department):
         logger.error(f"Error executing syllabus query: {err}")
         return pd.DataFrame()  # Return an empty DataFrame instead of None
 
+
+@telemetry.timed(db_query_seconds)
+def remap_department_ancestors(overrides=None):
+    """File every course of an overridden department under its configured faculty.
+
+    `overrides` maps Department -> faculty OrgUnitId (settings.faculty_overrides by default).
+    Each affected unit ends up with exactly one ancestor row, the configured faculty: one
+    DELETE drops its other ancestor rows and one INSERT ... SELECT adds the mapping where it
+    is missing. Both only touch rows that differ, so a repeated run changes nothing.
+    Returns the number of rows deleted and inserted.
+    """
+    overrides = settings.faculty_overrides if overrides is None else overrides
+    if not overrides:
+        return 0
+
+    # The overrides as a derived table: SELECT %s AS Department, %s AS FacultyId UNION ALL ...
+    override_rows = " UNION ALL ".join(["SELECT %s AS Department, %s AS FacultyId"] * len(overrides))
+    params = tuple(value for item in overrides.items() for value in item)
+    delete_query = f"""
+        DELETE oua
+        FROM OrganizationalUnitAncestors oua
+        JOIN OrganizationalUnits ou ON ou.OrgUnitId = oua.OrgUnitId
+        JOIN ({override_rows}) o ON o.Department = ou.Department
+        WHERE oua.AncestorOrgUnitId <> o.FacultyId;
+    """
+    insert_query = f"""
+        INSERT INTO OrganizationalUnitAncestors (OrgUnitId, AncestorOrgUnitId)
+        SELECT ou.OrgUnitId, o.FacultyId
+        FROM OrganizationalUnits ou
+        JOIN ({override_rows}) o ON o.Department = ou.Department
+        LEFT JOIN OrganizationalUnitAncestors oua
+            ON oua.OrgUnitId = ou.OrgUnitId AND oua.AncestorOrgUnitId = o.FacultyId
+        WHERE oua.OrgUnitId IS NULL;
+    """
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(delete_query, params)
+        deleted = cursor.rowcount
+        cursor.execute(insert_query, params)
+        inserted = cursor.rowcount
+        conn.commit()
+        run_metrics.count('db_rows_written', deleted + inserted)
+        logger.info(f"Department faculty overrides {overrides}: {deleted} ancestor rows removed, {inserted} added.")
+        return deleted + inserted
+    except mysql.connector.Error as err:
+        logger.error(f"Database error: {err}")
+        conn.rollback()
+        return 0
     finally:
         cursor.close()
         conn.close()
 
+COURSE_PROJECT_DDL = """
+    CREATE TABLE IF NOT EXISTS CourseProject (
+        OrgUnitId INT NOT NULL,
+        FacultyId INT NOT NULL,
+        ProjectId INT NOT NULL,
+        PRIMARY KEY (OrgUnitId, FacultyId),
+        KEY idx_course_project_project (ProjectId, OrgUnitId)
+    ) ENGINE=InnoDB CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+"""
+
+
+@telemetry.timed(db_query_seconds)
+def refresh_course_project():
+    """Bring CourseProject in line with OrganizationalUnitAncestors and Faculty.
+
+    The course queries join this table instead of every ancestor of every unit. It holds
+    one row per (course, faculty ancestor with a project). Stale rows are deleted and
+    missing ones inserted, in one transaction, so an unchanged hierarchy writes nothing.
+    Returns the number of rows deleted and inserted.
+    """
+    if not schema.table('CourseProject'):
+        migrate([COURSE_PROJECT_DDL])
+
+    delete_query = """
+        DELETE cp
+        FROM CourseProject cp
+        LEFT JOIN OrganizationalUnitAncestors oua
+            ON oua.OrgUnitId = cp.OrgUnitId AND oua.AncestorOrgUnitId = cp.FacultyId
+        LEFT JOIN Faculty f ON f.FacultyId = cp.FacultyId
+        WHERE oua.OrgUnitId IS NULL OR f.ProjectId IS NULL OR f.ProjectId <> cp.ProjectId;
+    """
+    insert_query = """
+        INSERT INTO CourseProject (OrgUnitId, FacultyId, ProjectId)
+        SELECT ou.OrgUnitId, f.FacultyId, f.ProjectId
+        FROM OrganizationalUnits ou
+        JOIN OrganizationalUnitAncestors oua ON oua.OrgUnitId = ou.OrgUnitId
+        JOIN Faculty f ON f.FacultyId = oua.AncestorOrgUnitId
+        LEFT JOIN CourseProject cp ON cp.OrgUnitId = ou.OrgUnitId AND cp.FacultyId = f.FacultyId
+        WHERE f.ProjectId IS NOT NULL AND cp.OrgUnitId IS NULL;
+    """
 
-def update_btgd_ancestor_orgunit():
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        # Get OrgUnitIds for BTGD department that are not already mapped to AncestorOrgUnitId = 6937
-        select_query = f"""
-            SELECT ou.OrgUnitId 
-            FROM OrganizationalUnits ou
-            WHERE ou.Department = 'BTGD'
-            AND ou.OrgUnitId NOT IN (
-                SELECT OrgUnitId 
-                FROM OrganizationalUnitAncestors 
-                WHERE AncestorOrgUnitId = {BTGD}
-            );
-        """
-        cursor.execute(select_query)
-        orgunit_ids = cursor.fetchall()
-        
-        # Remove any existing record that would conflict
-        delete_query = """
-            DELETE FROM OrganizationalUnitAncestors
-            WHERE OrgUnitId IN (
-                SELECT OrgUnitId FROM OrganizationalUnits WHERE Department = 'BTGD'
-            );
-        """ 
         cursor.execute(delete_query)
-
-        for (orgunit_id,) in orgunit_ids:
-            # Insert the new mapping
-            insert_query = """
-                INSERT INTO OrganizationalUnitAncestors (OrgUnitId, AncestorOrgUnitId)
-                VALUES (%s, %s);
-            """
-            cursor.execute(insert_query, (orgunit_id,BTGD))
-
+        deleted = cursor.rowcount
+        cursor.execute(insert_query)
+        inserted = cursor.rowcount
         conn.commit()
-        logger.info("BTGD ancestor OrgUnit updates applied successfully.")
-    except mysql.connector.Error as err:
-        logger.error(f"Database error: {err}")
-        if conn:
-            conn.rollback()
+        run_metrics.count('db_rows_written', deleted + inserted)
+        logger.info(f"CourseProject refreshed: {deleted} rows removed, {inserted} added.")
+        return deleted + inserted
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
     finally:
-        if cursor:
-            cursor.close()
-    conn.close()
+        cursor.close()
+        conn.close()
+
+
+def ensure_course_project():
+    """Create and fill CourseProject when the database does not have it yet; returns True when it did.
+
+    The course queries of main.py and syllabus_api inner-join CourseProject, so on a database
+    from before it existed they fail until this has run: `python main.py migrate` as a deploy
+    step, or syllabus_api on its first request.
+    """
+    if schema.table('CourseProject'):
+        return False
+    logger.info("CourseProject is missing; creating and filling it.")
+    refresh_course_project()
+    return True
+
+
+LAST_THREE_YEARS_SQL = """
+    SELECT DISTINCT Year 
+    FROM OrganizationalUnits 
+    WHERE IsDeleted = 0 
+    AND Year BETWEEN YEAR(CURDATE()) - 2 AND YEAR(CURDATE());
+"""
+
+
+def in_list(values):
+    """Placeholders for an IN (...) list of len(values) parameters."""
+    return ", ".join(["%s"] * len(values))
+
 
 # Returns the last three years 
+@telemetry.timed(db_query_seconds)
 def get_last_three_years():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    conn = get_read_connection()
     try:
-        last_three_years = f"""
-            SELECT DISTINCT Year 
-            FROM OrganizationalUnits 
-            WHERE IsDeleted = 0 
-            AND Year BETWEEN YEAR(CURDATE()) - 2 AND YEAR(CURDATE());
-        """
-        cursor.execute(last_three_years)
-        years = cursor.fetchall()
-        return years
+        return execute_prepared(conn, LAST_THREE_YEARS_SQL).fetchall()
     finally:
-        cursor.close()
         conn.close()
 
 
+@telemetry.timed(db_query_seconds)
 def fetch_counts(year, terms, project_id=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    qualified = settings.qualified_section_types
+    sql = f"""
+        SELECT
+            COUNT(*) AS total,
+            SUM(ou.Recorded >= 1) AS recorded,
+            SUM(ou.SectionType IN ({in_list(qualified)})) AS qualified_total,
+            SUM((ou.SectionType IN ({in_list(qualified)})) AND (ou.Recorded >= 1)) AS qualified_recorded
+        FROM OrganizationalUnits ou
+        JOIN CourseProject cp ON ou.OrgUnitId = cp.OrgUnitId
+        WHERE ou.IsDeleted = 0
+          AND ou.Year = %s
+          AND ou.Term IN ({in_list(terms)})
+          AND cp.ProjectId = %s;
+    """
+    params = [*qualified, *qualified, str(year), *terms, project_id]
+    conn = get_read_connection()
     try:
-        term_placeholders = ",".join(["%s"] * len(terms))
-        sql = f"""
-            SELECT
-                COUNT(*) AS total,
-                SUM(ou.Recorded >= 1) AS recorded,
-                SUM(ou.SectionType IN {QUALIFIED_SECTION_TYPES}) AS qualified_total,
-                SUM((ou.SectionType IN {QUALIFIED_SECTION_TYPES}) AND (ou.Recorded >= 1)) AS qualified_recorded
-            FROM OrganizationalUnits ou
-            LEFT JOIN OrganizationalUnitAncestors oua ON ou.OrgUnitId = oua.OrgUnitId
-            LEFT JOIN Faculty f ON oua.AncestorOrgUnitId = f.FacultyId
-            WHERE ou.IsDeleted = 0
-              AND ou.Year = %s
-              AND ou.Term IN ({term_placeholders})
-              AND f.ProjectId = {project_id};
-        """
-        params = [str(year)] + list(terms)
-        cursor.execute(sql, params)
-        row = cursor.fetchone() or (0, 0, 0, 0)
-        total, recorded, q_total, q_recorded = row
+        rows = execute_prepared(conn, sql, params).fetchall()
+        total, recorded, q_total, q_recorded = rows[0] if rows else (0, 0, 0, 0)
         return {
             "total": int(total or 0),
             "recorded": int(recorded or 0),
@@ -517,41 +1104,71 @@ def fetch_counts(year, terms, project_id=None):
             "qualified_recorded": int(q_recorded or 0),
         }
     finally:
-        cursor.close()
         conn.close()
 
 
+@telemetry.timed(db_query_seconds)
 def fetch_department_count(years, project_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+    qualified = settings.qualified_section_types
+    sql = f"""
+        SELECT
+            ou.Department AS department,
+            ou.Year AS year,
+        SUM(ou.SectionType IN ({in_list(qualified)})) AS qualified_total,
+        SUM((ou.SectionType IN ({in_list(qualified)})) AND (ou.Recorded >= 1)) AS qualified_recorded
+        FROM OrganizationalUnits ou
+        JOIN CourseProject cp ON ou.OrgUnitId = cp.OrgUnitId
+        WHERE ou.IsDeleted = 0
+            AND ou.Year in ({in_list(years)})
+            AND ou.Term in ('FW','SP','SU')
+            AND ou.Department <> ''
+            AND cp.ProjectId = %s
+        GROUP BY ou.Department, year
+        ORDER BY ou.Department ASC, year ASC;
+    """
+    params = [*qualified, *qualified, *(str(y) for y in years), project_id]
+    conn = get_read_connection()
     try:
-        sql = f"""
-            SELECT
-                ou.Department AS department,
-                ou.Year AS year,
-            SUM(ou.SectionType IN {QUALIFIED_SECTION_TYPES}) AS qualified_total,
-            SUM((ou.SectionType IN {QUALIFIED_SECTION_TYPES}) AND (ou.Recorded >= 1)) AS qualified_recorded
-            FROM OrganizationalUnits ou
-            LEFT JOIN OrganizationalUnitAncestors oua ON ou.OrgUnitId = oua.OrgUnitId
-            LEFT JOIN Faculty f ON oua.AncestorOrgUnitId = f.FacultyId
-            WHERE ou.IsDeleted = 0
-                AND ou.Year in ({",".join(["%s"] * len(years))})
-                AND ou.Term in ('FW','SP','SU')
-                AND ou.Department <> ''
-                AND f.ProjectId = {project_id}
-            GROUP BY ou.Department, year
-            ORDER BY ou.Department ASC, year ASC;
-        """
-        params = [str(y) for y in years]
-        cursor.execute(sql, params)
-        data = cursor.fetchall()
-        return data
+        return execute_prepared(conn, sql, params).fetchall()
     finally:
-        cursor.close()
         conn.close()
 
 
+def academic_year_courses_sql(year, terms, project_id):
+    """Build the course-level academic year query and its parameters."""
+    term_placeholders = ",".join(["%s"] * len(terms))
+
+    sql = f"""
+        SELECT
+            ou.Year,
+            ou.Term,
+            ou.Department,
+            ou.Code,
+            ou.SectionType,
+            ou.Recorded,
+            bl.AdoptionStatus
+        FROM OrganizationalUnits ou
+        JOIN CourseProject cp ON ou.OrgUnitId = cp.OrgUnitId
+        LEFT JOIN (
+                SELECT
+                    Code,
+                    CASE
+                    WHEN SUM(AdoptionStatus = 'Complete') > 0 THEN 'Complete'
+                    ELSE MAX(AdoptionStatus)
+                    END AS AdoptionStatus
+                FROM BookList
+                GROUP BY Code
+        ) bl ON ou.Code = bl.Code
+        WHERE ou.IsDeleted = 0
+          AND ou.Year = %s
+          AND ou.Term IN ({term_placeholders})
+          AND cp.ProjectId = %s
+    """
+
+    params = [str(year)] + [str(t) for t in terms] + [project_id]
+    return sql, params
+
+
 # fetch_academic_year_courses
 def fetch_academic_year_courses(year, terms, project_id):
     """Return course-level rows for an academic year across terms.
@@ -563,64 +1180,175 @@ def fetch_academic_year_courses(year, terms, project_id):
       - ou.IsDeleted = 0
       - ou.Year = year
       - ou.Term in terms
-      - f.ProjectId = project_id
+      - cp.ProjectId = project_id
 
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    sql, params = academic_year_courses_sql(year, terms, project_id)
+    return fetch_frame(sql, params, name='fetch_academic_year_courses', read_only=True)
 
-    try:
-        term_placeholders = ",".join(["%s"] * len(terms))
 
-        sql = f"""
-            SELECT
-                ou.Year,
-                ou.Term,
-                ou.Department,
-                ou.Code,
-                ou.SectionType,
-                ou.Recorded,
-                bl.AdoptionStatus
-            FROM OrganizationalUnits ou
-            LEFT JOIN OrganizationalUnitAncestors oua ON ou.OrgUnitId = oua.OrgUnitId
-            LEFT JOIN Faculty f ON oua.AncestorOrgUnitId = f.FacultyId
-            LEFT JOIN (
-                    SELECT
-                        Code,
-                        CASE
-                        WHEN SUM(AdoptionStatus = 'Complete') > 0 THEN 'Complete'
-                        ELSE MAX(AdoptionStatus)
-                        END AS AdoptionStatus
-                    FROM BookList
-                    GROUP BY Code
-            ) bl ON ou.Code = bl.Code
-            WHERE ou.IsDeleted = 0
-              AND ou.Year = %s
-              AND ou.Term IN ({term_placeholders})
-              AND f.ProjectId = {project_id}
-        """
+def stream_query(sql, params, batch_size=1000, name='stream_query', read_only=False):
+    """Yield (column_names, rows) batches for a query.
 
-        params = [str(year)] + [str(t) for t in terms]
+    Rows are read with an unbuffered cursor in fetchmany batches so only one batch
+    is held in memory at a time. The first batch is always yielded, possibly empty,
+    so callers get the column names for an empty result. Only the time spent in the
+    database is observed under `name`, not the time the consumer holds each batch.
+    read_only queries may be answered by the replica, see get_read_connection.
 
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
+    The stream opens its own connection instead of borrowing a pooled one: an export paced
+    by a slow client holds it for as long as the download lasts, and the pool is sized for
+    short queries.
+    """
+    conn = get_read_connection(pooled=False) if read_only else connect('primary', pooled=False)
+    cursor = conn.cursor(buffered=False)
+    elapsed = 0.0
 
+    try:
+        start = time.perf_counter()
+        cursor.execute(sql, params)
         column_names = [desc[0] for desc in cursor.description]
-        return pd.DataFrame(rows, columns=column_names)
+
+        rows = cursor.fetchmany(batch_size)
+        elapsed += time.perf_counter() - start
+        yield column_names, rows
+        while rows:
+            start = time.perf_counter()
+            rows = cursor.fetchmany(batch_size)
+            elapsed += time.perf_counter() - start
+            if rows:
+                yield column_names, rows
 
     finally:
-        cursor.close()
+        db_query_seconds.observe(elapsed, function=name)
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            # Unread rows are left when the consumer stops early; the connection is dropped anyway
+            pass
         conn.close()
 
 
+# Rows per fetchmany batch when a whole result is built into a frame
+FRAME_BATCH_SIZE = 5000
+
+
+def frame_from_columns(column_names, columns):
+    """DataFrame from per-column value lists, with each column's type inferred over all its values
+    at once, exactly as DataFrame.from_records infers it from the same rows."""
+    frame = pd.DataFrame(dict(enumerate(columns)))
+    frame.columns = list(column_names)
+    return frame
+
+
+def fetch_frame(sql, params, batch_size=FRAME_BATCH_SIZE, name='fetch_frame', read_only=False):
+    """Run a query into a DataFrame, reading it through stream_query.
+
+    Each fetchmany batch is moved into per-column lists and dropped, so the result is never
+    held as row tuples and as a DataFrame at the same time. The frame is built once from the
+    whole columns, so column types do not depend on where the batches were split.
+    """
+    column_names, columns = None, None
+    for names, rows in stream_query(sql, params, batch_size, name, read_only):
+        if columns is None:
+            column_names, columns = names, [[] for _ in names]
+        for column, values in zip(columns, zip(*rows)):
+            column.extend(values)
+    return frame_from_columns(column_names, columns)
+
+
+def stream_academic_year_courses(year, terms, project_id, batch_size=1000):
+    """Streaming form of fetch_academic_year_courses, see stream_query."""
+    sql, params = academic_year_courses_sql(year, terms, project_id)
+    return stream_query(sql, params, batch_size, 'stream_academic_year_courses', read_only=True)
+
+
+COURSE_DIRECTORY_SQL = """
+    SELECT ou.Code, ou.OrgUnitId, ou.Year, ou.Term, ou.Department, MIN(cp.ProjectId) AS ProjectId
+    FROM OrganizationalUnits ou
+    LEFT JOIN CourseProject cp ON cp.OrgUnitId = ou.OrgUnitId
+    WHERE ou.IsDeleted = 0
+      AND ou.Code IS NOT NULL
+      AND (ou.Year, ou.Term) IN ({terms})
+    GROUP BY ou.OrgUnitId, ou.Code, ou.Year, ou.Term, ou.Department;
+"""
+
+
+def stream_course_directory(terms, batch_size=FRAME_BATCH_SIZE):
+    """(Code, OrgUnitId, Year, Term, Department, ProjectId) batches for the (year, term) pairs, see stream_query."""
+    sql = COURSE_DIRECTORY_SQL.format(terms=", ".join(["(%s, %s)"] * len(terms)))
+    params = [value for year, term in terms for value in (int(year), str(term))]
+    return stream_query(sql, params, batch_size, 'stream_course_directory')
+
+
+def stream_department_cources(term, year, department, batch_size=1000):
+    """Streaming form of get_department_cources, see stream_query."""
+    return stream_query(department_courses_query, (year, term, department), batch_size, 'stream_department_cources')
+
+
+
+def fetch_summary_courses(years):
+    """Return one row per (course, project) for the dashboard years.
+
+    Columns: ProjectId, Year, Term, Department, Code, SectionType, Recorded, AdoptionStatus.
+    Same filters as fetch_counts/fetch_department_count without the project and
+    term narrowing, so every dashboard aggregate can be derived from it.
+    """
+    sql = f"""
+        SELECT
+            cp.ProjectId,
+            ou.Year,
+            ou.Term,
+            ou.Department,
+            ou.Code,
+            ou.SectionType,
+            ou.Recorded,
+            bl.AdoptionStatus
+        FROM OrganizationalUnits ou
+        JOIN CourseProject cp ON ou.OrgUnitId = cp.OrgUnitId
+        LEFT JOIN (
+                SELECT
+                    Code,
+                    CASE
+                    WHEN SUM(AdoptionStatus = 'Complete') > 0 THEN 'Complete'
+                    ELSE MAX(AdoptionStatus)
+                    END AS AdoptionStatus
+                FROM BookList
+                GROUP BY Code
+        ) bl ON ou.Code = bl.Code
+        WHERE ou.IsDeleted = 0
+          AND ou.Year IN ({",".join(["%s"] * len(years))})
+          AND ou.Term IN ('FW','SP','SU')
+    """
+    return fetch_frame(sql, [str(y) for y in years], name='fetch_summary_courses')
+
+
+def update_returning_ids(cursor, select_sql, update_sql, params):
+    """Run a set-based UPDATE and return the OrgUnitIds it changed.
+
+    The matching rows are read with SELECT ... FOR UPDATE first, in the same transaction,
+    so they stay locked and the UPDATE changes exactly those rows. The caller commits.
+    """
+    cursor.execute(f"{select_sql} FOR UPDATE", params)
+    ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute(update_sql, params)
+    if cursor.rowcount != len(ids):
+        logger.warning(f"UPDATE changed {cursor.rowcount} rows, {len(ids)} were selected.")
+    return ids
+
+
+@telemetry.timed(db_query_seconds)
 def campus_store_complete(year, term):
-    """Set OrganizationalUnits.Recorded = 4 when Campus Store adoption is complete (exact code match)."""
+    """Set OrganizationalUnits.Recorded = 4 when Campus Store adoption is complete (exact code match).
+
+    Returns the OrgUnitIds that were changed.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        sql = """
-            UPDATE OrganizationalUnits ou
+        tables = """
+            OrganizationalUnits ou
             JOIN (
                 SELECT
                     Code,
@@ -631,16 +1359,21 @@ def campus_store_complete(year, term):
                 FROM BookList
                 GROUP BY Code
             ) bl ON ou.Code = bl.Code
-            SET ou.Recorded = 4
+        """
+        where = """
             WHERE ou.Recorded = 0
               AND bl.AdoptionStatus = 'Complete'
               AND ou.Year = %s
-              AND ou.Term = %s;
+              AND ou.Term = %s
         """
         logger.info("Updating OrganizationalUnits.Recorded from 0 to 4 using exact code match")
-        cursor.execute(sql, (str(year), str(term)))
+        changed = update_returning_ids(
+            cursor, f"SELECT ou.OrgUnitId FROM {tables} {where}", f"UPDATE {tables} SET ou.Recorded = 4 {where}",
+            (str(year), str(term)))
         conn.commit()
-        logger.info(f"Updated {cursor.rowcount} rows.")
+        run_metrics.count('db_rows_written', len(changed))
+        logger.info(f"Updated {len(changed)} rows.")
+        return changed
 
     except mysql.connector.Error as err:
         logger.error(f"campus_store_complete failed: {err}")
@@ -651,29 +1384,34 @@ def campus_store_complete(year, term):
         cursor.close()
         conn.close()
 
+@telemetry.timed(db_query_seconds)
 def mark_ignored_sections(year, term):
     """
     Set OrganizationalUnits.Recorded = 5 for ignored section types
     when they are currently unrecorded (Recorded = 0).
+    Returns the OrgUnitIds that were changed.
     """
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        sql = f"""
-            UPDATE OrganizationalUnits
-            SET Recorded = 5
+        ignored = settings.ignored_section_types
+        where = f"""
             WHERE Recorded = 0
-              AND SectionType IN {IGNORED_SECTION_TYPES}
+              AND SectionType IN ({in_list(ignored)})
               AND Year = %s
-              AND Term = %s;
+              AND Term = %s
         """
         logger.info(
             "Updating OrganizationalUnits.Recorded from 0 to 5 for IGNORED_SECTION_TYPES"
         )
-        cursor.execute(sql, (str(year), str(term)))
+        changed = update_returning_ids(
+            cursor, f"SELECT OrgUnitId FROM OrganizationalUnits {where}",
+            f"UPDATE OrganizationalUnits SET Recorded = 5 {where}", (*ignored, str(year), str(term)))
         conn.commit()
-        logger.info(f"Updated {cursor.rowcount} rows (ignored sections).")
+        run_metrics.count('db_rows_written', len(changed))
+        logger.info(f"Updated {len(changed)} rows (ignored sections).")
+        return changed
 
     except mysql.connector.Error as err:
         logger.error(f"mark_ignored_sections failed: {err}")
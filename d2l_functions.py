@@ -4,23 +4,55 @@ import os
 import zipfile
 import urllib.parse
 import mimetypes
-from logger_config import logger
-import dotenv
-import pandas as pd
+from logger_config import get_logger
 import api_auth
 import re
+import time
+import run_metrics
+import d2l_stats
+from lazy import lazy_import
+from settings import settings
 
+pd = lazy_import('pandas')
 
-dotenv_file = dotenv.find_dotenv()
-dotenv.load_dotenv(dotenv_file)
-bspace_url = os.environ["bspace_url"]
-api_route = os.environ["api_route"]
+logger = get_logger(__name__)
+
+
+
+class InstrumentedSession(requests.Session):
+    """Session that times every Brightspace call and records it per route (d2l_stats) and per run stage (run_metrics)."""
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            # Returns once the body has been read unless stream=True
+            response = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            d2l_stats.record(method, url, type(e).__name__, time.perf_counter() - start)
+            run_metrics.count('http_calls')
+            raise
+        seconds = time.perf_counter() - start
+
+        body = response.request.body
+        sent = len(body) if isinstance(body, (bytes, str)) else 0
+        if kwargs.get('stream'):
+            received = int(response.headers.get('Content-Length') or 0)
+        else:
+            received = len(response.content)
+        d2l_stats.record(method, url, response.status_code, seconds, sent, received)
+        run_metrics.count('http_calls')
+        run_metrics.count('http_bytes', sent + received)
+        return response
+
+
+# One session for all calls so connections to Brightspace are reused
+session = InstrumentedSession()
 
 # Gets access (7200 seconds) and refresh tokens. Calls put_config() to update the refresh token in file.
 def trade_in_refresh_token(config):
     try:
-        response = requests.post(
-            'https://auth.brightspace.com/core/connect/token',
+        response = session.post(
+            settings.auth_url,
             data={
                 'grant_type': 'refresh_token',
                 'refresh_token': config['refresh_token'],
@@ -40,22 +72,15 @@ def trade_in_refresh_token(config):
 
 
 def set_refresh_token(refresh_token, access_token, timestamp):
-    os.environ["refresh_token"] = refresh_token
-    dotenv.set_key(dotenv_file, "refresh_token", os.environ["refresh_token"])
-
-    os.environ["access_token"] = access_token
-    dotenv.set_key(dotenv_file, "access_token", os.environ["access_token"])
-
-    os.environ["timestamp"] = timestamp
-    dotenv.set_key(dotenv_file, "timestamp", os.environ["timestamp"])
-
-    dotenv.load_dotenv(dotenv_file)
+    settings.save("refresh_token", refresh_token)
+    settings.save("access_token", access_token)
+    settings.save("timestamp", timestamp)
 
 # d2l GET call
 def get_with_auth(endpoint, access_token):
     try:
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.get(endpoint, headers=headers)
+        response = session.get(endpoint, headers=headers)
         response.raise_for_status()
         return response
     except requests.exceptions.RequestException as e:
@@ -69,10 +94,10 @@ def post_with_auth(endpoint, access_token, data=None, json_data=False):
 
         if json_data:
             headers['Content-Type'] = 'application/json'
-            response = requests.post(endpoint, headers=headers, json=data)  # Use `json=`
+            response = session.post(endpoint, headers=headers, json=data)  # Use `json=`
         else:
             headers['Content-Type'] = 'application/x-www-form-urlencoded'
-            response = requests.post(endpoint, headers=headers, data=data)  # Use `data=`
+            response = session.post(endpoint, headers=headers, data=data)  # Use `data=`
         
         response.raise_for_status()
         return response
@@ -114,7 +139,7 @@ def save_file(url, access_token, download_path, code=None):
                 for chunk in response.iter_content(chunk_size=8192):
                     if chunk:
                         f.write(chunk)
-            logger.info(f"File saved successfully at {download_path}")
+            logger.debug("File saved successfully at %s", download_path)
             return filename  # Return the extracted filename
 
         else:
@@ -156,7 +181,7 @@ def initiate_resumable_upload(base, upload_url, access_token, file_path, chunk_s
     }
 
     # Send the PUT request with file data included
-    response = requests.post(upload_url, headers=headers, allow_redirects=False)
+    response = session.post(upload_url, headers=headers, allow_redirects=False)
     file_key = None
     if response.status_code == 308:
         with open(file_path, "rb") as file:
@@ -176,34 +201,139 @@ def initiate_resumable_upload(base, upload_url, access_token, file_path, chunk_s
                     logger.error("Upload URL not found in headers.")
                     return None
                 file_key = os.path.basename(upload_url)
-                response = requests.post(f"{base}{upload_url}", headers=headers, data=chunk, allow_redirects=False)
+                response = session.post(f"{base}{upload_url}", headers=headers, data=chunk, allow_redirects=False)
                 if response.status_code == 308:  # Resume Incomplete
                     start_byte = int(response.headers.get("Range", f"bytes={end_byte}").split("-")[1]) + 1
+                    if start_byte <= end_byte:
+                        # Part of the chunk was not acknowledged and is sent again
+                        d2l_stats.record_retry("POST", upload_url)
 
     # Check response
     if response.status_code in [200, 201, 204]:  # Success status codes
-        logger.info(f"Upload successful for {file_name}.")
+        logger.debug("Upload successful for %s.", file_name)
         return file_key
     else:
         logger.error(f"Error: Unexpected response {response.status_code} - {response.text}")
     return None
 
 
+def read_chunk(stream, size):
+    """Read up to `size` bytes from `stream`, looping over short reads until the chunk is full or the stream ends."""
+    parts = []
+    remaining = size
+    while remaining > 0:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b"".join(parts)
+
+
+# Forwards a file to the resumable upload endpoint while it is still being read from `stream`.
+# Each chunk is sent as soon as it arrives; when copy_path is given the chunk is also written there,
+# so the local copy is a side effect of the transfer instead of a step before it.
+def stream_resumable_upload(base, upload_url, access_token, stream, file_name, file_size, copy_path=None, chunk_size = 1024 * 1024):
+    mime_type = "application/octet-stream"
+
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": f"multipart/form-data;",
+        "X-Upload-File-Name": file_name,
+        "X-Upload-Content-Type": mime_type,
+        "X-Upload-Content-Length": str(file_size),
+    }
+    response = session.post(upload_url, headers=headers, allow_redirects=False)
+    if response.status_code != 308:
+        logger.error(f"Error: Unexpected response {response.status_code} - {response.text}")
+        return None
+
+    copy = None
+    if copy_path:
+        os.makedirs(os.path.dirname(copy_path), exist_ok=True)
+        copy = open(copy_path, "wb")
+
+    file_key = None
+    completed = False
+    try:
+        start_byte = 0
+        while start_byte < file_size:
+            chunk = read_chunk(stream, min(chunk_size, file_size - start_byte))
+            if not chunk:
+                logger.error(f"Upload stream for {file_name} ended at byte {start_byte} of {file_size}.")
+                return None
+            if copy:
+                copy.write(chunk)
+
+            # Re-send only the part of the chunk the server has not acknowledged yet
+            offset = 0
+            while offset < len(chunk):
+                upload_url = response.headers.get("Location")
+                if not upload_url:
+                    logger.error("Upload URL not found in headers.")
+                    return None
+                file_key = os.path.basename(upload_url)
+                first_byte = start_byte + offset
+                end_byte = start_byte + len(chunk) - 1
+                headers = {
+                    "Authorization": f"Bearer {access_token}",
+                    "Content-Type": mime_type,
+                    "Content-Range": f"bytes {first_byte}-{end_byte}/{file_size}"
+                }
+                response = session.post(f"{base}{upload_url}", headers=headers, data=chunk[offset:], allow_redirects=False)
+                if response.status_code != 308:
+                    break
+                received = int(response.headers.get("Range", f"bytes=0-{end_byte}").split("-")[1]) + 1
+                if received <= first_byte:
+                    logger.error(f"Upload of {file_name} made no progress at byte {first_byte}.")
+                    return None
+                offset = received - start_byte
+                if offset < len(chunk):
+                    d2l_stats.record_retry("POST", upload_url)
+
+            if response.status_code != 308:
+                break
+            start_byte += len(chunk)
+
+        if response.status_code in [200, 201, 204]:
+            logger.debug("Upload successful for %s.", file_name)
+            completed = True
+            return file_key
+        logger.error(f"Error: Unexpected response {response.status_code} - {response.text}")
+        return None
+    finally:
+        if copy:
+            copy.close()
+            # A partial local copy is worse than none
+            if not completed:
+                os.remove(copy_path)
+
+
+def save_uploaded_file(orgUnitId, file_key, relative_path, access_token):
+    save_file_payload = {"fileKey": file_key,
+                         "relativePath": relative_path}
+    return post_with_auth(f"{settings.bspace_url}/d2l/api/lp/1.47/{orgUnitId}/managefiles/file/save?overwriteFile=true", access_token, data=save_file_payload, json_data=False)
+
+
+# Returns the names of the extracted files, or an empty list on failure
 def unzip_file(download_path, extract_to):
     try:
         # Extract the zip file
         with zipfile.ZipFile(download_path, 'r') as zip_ref:
+            names = zip_ref.namelist()
             zip_ref.extractall(extract_to)
             logger.info(f"File extracted to {extract_to}")
 
         # Delete the zip file after extraction
         os.remove(download_path)
         logger.info(f"Deleted zip file {download_path}")
+        return names
 
     except IOError as e:
         logger.error(f"Error extracting file: {e}")
     except zipfile.BadZipFile:
         logger.error("Error: The file is not a valid zip archive.")
+    return []
 
 
 def save_and_unzip_file(url, access_token, download_path):
@@ -212,7 +342,8 @@ def save_and_unzip_file(url, access_token, download_path):
 
     if filename:
         full_path = os.path.join(os.path.dirname(download_path), filename)
-        unzip_file(full_path, download_path)
+        return unzip_file(full_path, download_path)
+    return []
 
 def is_folder_exists(url, access_token, folder):
     response = get_with_auth(url, access_token)
@@ -224,6 +355,7 @@ def is_folder_exists(url, access_token, folder):
     else:
         return False
 
+# Returns True once the file is saved in the project (or there is nothing to upload for a link)
 def upload_syllabus(row, filetype, access_token):
     try:
         # Construct the URL with the row's Location value
@@ -233,24 +365,44 @@ def upload_syllabus(row, filetype, access_token):
         year = str(row['Year'])
         term = str(row['Term'])
 
-        upload_url = f"{bspace_url}/d2l/api/lp/1.47/{orgUnitId}/managefiles/file/upload"
+        upload_url = f"{settings.bspace_url}/d2l/api/lp/1.47/{orgUnitId}/managefiles/file/upload"
         #file_name = os.path.basename(location)
         if filetype=='Link':
-            pass
+            return True
         else:
             _, file_extension = os.path.splitext(os.path.basename(location))
             if (filetype=='d2l'): file_extension = '.html'
             file_name = f"syllabus_{row['Code']}{file_extension}"
             file_path = f"downloads/{department}/{year}/{term}/{file_name}"
-            file_key = initiate_resumable_upload(bspace_url, upload_url, access_token, file_path)
+            file_key = initiate_resumable_upload(settings.bspace_url, upload_url, access_token, file_path)
             if (file_key):
-                save_file_payload = {"fileKey":file_key,
-                                    "relativePath": f"{department}/{year}/{term}"}
-                post_with_auth(f"{bspace_url}/d2l/api/lp/1.47/{orgUnitId}/managefiles/file/save?overwriteFile=true", access_token, data=save_file_payload, json_data=False)
+                return save_uploaded_file(orgUnitId, file_key, f"{department}/{year}/{term}", access_token) is not None
+            return False
 
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+        return False
+
+
+# Streaming counterpart of upload_syllabus: the file body is read from `stream` and forwarded to
+# Brightspace as it arrives, with the copy under downloads/ written along the way.
+def upload_syllabus_stream(row, stream, file_size, access_token):
+    orgUnitId = row['ProjectId']
+    department = str(row['Department'])
+    year = str(row['Year'])
+    term = str(row['Term'])
+
+    upload_url = f"{settings.bspace_url}/d2l/api/lp/1.47/{orgUnitId}/managefiles/file/upload"
+    _, file_extension = os.path.splitext(os.path.basename(str(row['Location'])))
+    file_name = f"syllabus_{row['Code']}{file_extension}"
+    file_path = f"downloads/{department}/{year}/{term}/{file_name}"
+
+    file_key = stream_resumable_upload(settings.bspace_url, upload_url, access_token, stream, file_name, file_size, copy_path=file_path)
+    if not file_key:
+        return None
+    response = save_uploaded_file(orgUnitId, file_key, f"{department}/{year}/{term}", access_token)
+    return file_path if response is not None else None
 
 
 def upload_content_html(df, year, term, access_token):
@@ -261,14 +413,12 @@ def upload_content_html(df, year, term, access_token):
     for index, row in grouped.iterrows():
         orgUnitId = row['ProjectId']
         department = row['Department']
-        upload_url = f"{bspace_url}/d2l/api/lp/1.47/{orgUnitId}/managefiles/file/upload"
+        upload_url = f"{settings.bspace_url}/d2l/api/lp/1.47/{orgUnitId}/managefiles/file/upload"
         file_name = f"syllabus_table_{str(department)}_{str(year)}_{str(term)}.html"
         file_path = f"downloads/{department}/{year}/{term}/{file_name}"
-        file_key = initiate_resumable_upload(bspace_url, upload_url, access_token, file_path)
+        file_key = initiate_resumable_upload(settings.bspace_url, upload_url, access_token, file_path)
         if (file_key):
-            save_file_payload = {"fileKey":file_key,
-                                 "relativePath": f"{department}/{year}/{term}"}
-            post_with_auth(f"{bspace_url}/d2l/api/lp/1.47/{orgUnitId}/managefiles/file/save?overwriteFile=true", access_token, data=save_file_payload, json_data=False)
+            save_uploaded_file(orgUnitId, file_key, f"{department}/{year}/{term}", access_token)
 
 
 
@@ -298,7 +448,7 @@ def generate_syllabus_html(df, base_output_dir):
         <head>
             <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.7.1/jquery.min.js"></script>
             <link rel="stylesheet" href="https://cdn.datatables.net/2.2.2/css/dataTables.dataTables.css" />
-            <link rel="stylesheet" href="{bspace_url}/shared/Widgets/SyllabusUpload/css/syllabus_collection_styles.css" />
+            <link rel="stylesheet" href="{settings.bspace_url}/shared/Widgets/SyllabusUpload/css/syllabus_collection_styles.css" />
             <script src="https://cdn.datatables.net/2.2.2/js/dataTables.js"></script>    
             <title>Syllabus Table for {department} - {year} - {term}</title>
         </head>
@@ -324,7 +474,7 @@ def generate_syllabus_html(df, base_output_dir):
                 </div>
             </div>
 
-            <p><a href="https://cpi.brocku.ca/{api_route}/report?department={department}&year={year}&term={term}&token={api_auth.generate_token(f'{department}-{year}-{term}')}" class="download-report">Download Report</a></p>
+            <p><a href="https://cpi.brocku.ca/{settings.api_route}/report?department={department}&year={year}&term={term}&token={api_auth.generate_token(f'{department}-{year}-{term}')}" class="download-report">Download Report</a></p>
             <table id="{department}-{year}-{term}" class="display">
                 <thead>
                     <tr>
@@ -337,9 +487,10 @@ def generate_syllabus_html(df, base_output_dir):
         """
 
         # Add table rows
+        missing_codes = 0
         for _, row in group.iterrows():
             if pd.isna(row['Code']):
-                logger.warning("Missing course Code; skipping row.")
+                missing_codes += 1
                 continue
             exempt_value = 'exempt'
             # Handle NaN values in Recorded
@@ -371,8 +522,8 @@ def generate_syllabus_html(df, base_output_dir):
 
 
             url_token = api_auth.generate_token(row['Code'])
-            upload_url = f"https://cpi.brocku.ca/{api_route}/upload?course={row['Code']}&token={url_token}&projectId={row['ProjectId']}"
-            exempt_url = f"https://cpi.brocku.ca/{api_route}/exempt?course={row['Code']}&token={url_token}&action={exempt_value}"
+            upload_url = f"https://cpi.brocku.ca/{settings.api_route}/upload?course={row['Code']}&token={url_token}&projectId={row['ProjectId']}"
+            exempt_url = f"https://cpi.brocku.ca/{settings.api_route}/exempt?course={row['Code']}&token={url_token}&action={exempt_value}"
 
             html_content += f"""
                 <tr class="{row_class}">
@@ -385,6 +536,9 @@ def generate_syllabus_html(df, base_output_dir):
                 </tr>
             """
 
+        if missing_codes:
+            logger.warning("Skipped %d rows with a missing course Code in %s %s %s.", missing_codes, department, year, term)
+
         # Close HTML tags
         html_content += f"""
                 </tbody>
@@ -422,7 +576,7 @@ def generate_syllabus_html(df, base_output_dir):
                 ]
             }});
             </script>
-            <script src="{bspace_url}/shared/Widgets/SyllabusUpload/js/syllabus_collection.js"></script>
+            <script src="{settings.bspace_url}/shared/Widgets/SyllabusUpload/js/syllabus_collection.js"></script>
         </body>
         </html>
         """
@@ -437,7 +591,7 @@ def create_blank_syllabus(path):
     <html>
     <head>
         <title>Unavailable Syllabus</title>
-        <link rel="stylesheet" href="{bspace_url}/shared/Widgets/SyllabusUpload/css/syllabus_collection_styles.css" />
+        <link rel="stylesheet" href="{settings.bspace_url}/shared/Widgets/SyllabusUpload/css/syllabus_collection_styles.css" />
     </head>
     <body>
             <h3>Unavailable Syllabus.</h3>
@@ -0,0 +1,155 @@
+import re
+import threading
+import urllib.parse
+
+# Per-route accounting of Brightspace calls made by this process (main.py run or API worker).
+# d2l_functions records every request here; run_metrics dumps it at the end of a run and
+# syllabus_api serves it from /api/d2l/stats.
+
+# Latency histogram bucket upper bounds in seconds (Prometheus style, +Inf implied)
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Path segments that vary per call, most specific first
+ROUTE_PATTERNS = [
+    (re.compile(r'/datasets/bds/[^/]+/plugins/[^/]+'), '/datasets/bds/{schemaId}/plugins/{pluginId}'),
+    (re.compile(r'/d2l/upload/[^/]+'), '/d2l/upload/{fileKey}'),
+    (re.compile(r'/modules/\d+'), '/modules/{moduleId}'),
+    (re.compile(r'/\d+(\.\d+)+(?=/|$)'), '/{v}'),
+    (re.compile(r'/\d+(?=/|$)'), '/{orgUnitId}'),
+    (re.compile(r'/[0-9a-fA-F-]{16,}(?=/|$)'), '/{id}'),
+]
+
+
+def route_template(method, url):
+    """'GET https://host/d2l/api/lp/1.47/123/managefiles/file?path=x' -> 'GET /d2l/api/lp/{v}/{orgUnitId}/managefiles/file'"""
+    path = urllib.parse.urlsplit(url).path or '/'
+    for pattern, replacement in ROUTE_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return f"{method.upper()} {path}"
+
+
+class EndpointStats:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.statuses = {}
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def observe(self, status, seconds, sent, received):
+        self.calls += 1
+        self.seconds += seconds
+        self.buckets[next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))] += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_sent += sent
+        self.bytes_received += received
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th call; None when it is past the last bound."""
+        if not self.calls:
+            return None
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= q * self.calls:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'seconds': round(self.seconds, 3),
+            'mean_seconds': round(self.seconds / self.calls, 3) if self.calls else None,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], self.buckets)),
+            'statuses': {str(k): v for k, v in self.statuses.items()},
+            'retries': self.retries,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+        }
+
+
+_routes = {}
+_lock = threading.Lock()
+
+
+def _stats(route):
+    stats = _routes.get(route)
+    if stats is None:
+        stats = _routes.setdefault(route, EndpointStats())
+    return stats
+
+
+def record(method, url, status, seconds, sent=0, received=0):
+    """Record one call. status is the HTTP status code, or the exception name when no response arrived."""
+    route = route_template(method, url)
+    with _lock:
+        _stats(route).observe(status, seconds, sent, received)
+
+
+def record_retry(method, url):
+    route = route_template(method, url)
+    with _lock:
+        _stats(route).retries += 1
+
+
+def snapshot():
+    """{route: stats dict}, slowest total time first."""
+    with _lock:
+        items = sorted(_routes.items(), key=lambda item: item[1].seconds, reverse=True)
+        return {route: stats.as_dict() for route, stats in items}
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+def summary_table(stats=None):
+    stats = snapshot() if stats is None else stats
+    if not stats:
+        return "No Brightspace calls."
+    width = max(len(route) for route in stats)
+    lines = [f"{'Route':<{width}}  {'Calls':>6}  {'Total s':>8}  {'Mean s':>7}  {'p95 s':>6}  {'Retries':>7}  {'Bytes':>11}  Statuses"]
+    for route, s in stats.items():
+        p95 = '>60' if s['p95_seconds'] is None else f"{s['p95_seconds']:g}"
+        statuses = ' '.join(f"{k}:{v}" for k, v in sorted(s['statuses'].items()))
+        lines.append(
+            f"{route:<{width}}  {s['calls']:>6}  {s['seconds']:>8.2f}  {s['mean_seconds'] or 0:>7.3f}  {p95:>6}  "
+            f"{s['retries']:>7}  {s['bytes_sent'] + s['bytes_received']:>11}  {statuses}"
+        )
+    return '\n'.join(lines)
+
+
+def prometheus_lines(prefix='d2l', stats=None, labels=None):
+    """Histogram, status and byte series for every route in the Prometheus text format."""
+    stats = snapshot() if stats is None else stats
+    extra = ''.join(f',{k}="{v}"' for k, v in (labels or {}).items())
+    lines = [
+        f"# HELP {prefix}_request_duration_seconds Brightspace request latency by route template.",
+        f"# TYPE {prefix}_request_duration_seconds histogram",
+    ]
+    for route, s in stats.items():
+        cumulative = 0
+        for bound, n in s['buckets'].items():
+            cumulative += n
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{route="{route}"{extra},le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_request_duration_seconds_sum{{route="{route}"{extra}}} {s["seconds"]}')
+        lines.append(f'{prefix}_request_duration_seconds_count{{route="{route}"{extra}}} {s["calls"]}')
+
+    lines += [f"# HELP {prefix}_responses_total Brightspace responses by route and status.",
+              f"# TYPE {prefix}_responses_total counter"]
+    for route, s in stats.items():
+        for status, n in s['statuses'].items():
+            lines.append(f'{prefix}_responses_total{{route="{route}"{extra},status="{status}"}} {n}')
+
+    for field, help_text in (('retries', 'Re-sent upload chunks'),
+                             ('bytes_sent', 'Request bytes sent'),
+                             ('bytes_received', 'Response bytes received')):
+        lines += [f"# HELP {prefix}_{field}_total {help_text} by route.", f"# TYPE {prefix}_{field}_total counter"]
+        for route, s in stats.items():
+            lines.append(f'{prefix}_{field}_total{{route="{route}"{extra}}} {s[field]}')
+    return lines
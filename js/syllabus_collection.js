@@ -104,12 +104,14 @@ $(document).on('click', '.upload', function () {
     pendingFileDialogs--;
     activeRequests++;
 
-    const formData = new FormData();
-    formData.append('file', file);
+    // Streaming mode: the raw file is the request body, so the server can forward it
+    // to Brightspace while it is still arriving instead of buffering it first.
+    const streamUrl = `${uploadUrl}&stream=1&filename=${encodeURIComponent(file.name)}`;
 
-    fetch(uploadUrl, {
+    fetch(streamUrl, {
       method: 'POST',
-      body: formData
+      headers: { 'Content-Type': 'application/octet-stream' },
+      body: file
     })
     .then(res => res.json())
     .then(data => {
@@ -0,0 +1,45 @@
+import sys
+import importlib
+import importlib.util
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        module = self._load()
+        try:
+            return getattr(module, attr)
+        except AttributeError:
+            # A submodule that has not been imported yet, e.g. mysql.connector
+            if importlib.util.find_spec(f"{self._name}.{attr}") is None:
+                raise
+            return importlib.import_module(f"{self._name}.{attr}")
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name, optional=False):
+    """Defer importing a heavy dependency until it is first used: `pd = lazy_import('pandas')`.
+
+    With optional=True, None is returned when the module is not installed, matching the
+    try/except ImportError idiom used for optional dependencies.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if optional and importlib.util.find_spec(name.partition('.')[0]) is None:
+        return None
+    return LazyModule(name)
@@ -1,20 +1,213 @@
 import os
+import copy
+import json
+import queue
+import fcntl
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from settings import settings
+
+# Records are put on a queue by the calling thread and written to the log file by a
+# background listener, so logging never waits on the disk. The file handler rotates under
+# an fcntl lock, so main.py and every API worker process can share one log file. The file
+# and the listener are set up when the first record arrives.
+#
+# Settings (see settings.py):
+#   log_level   level for all application modules (default INFO)
+#   log_levels  per-module overrides, e.g. "csv_db=DEBUG,d2l_functions=WARNING"
+#   log_format  "text" (default) or "json" for one JSON object per line
 
 # Define the log file path
 log_file = 'datahub/application.log'
+MAX_BYTES = 5_000_000
+BACKUP_COUNT = 5
+# Records waiting for the writer; beyond this records below WARNING are dropped instead of blocking the caller
+QUEUE_SIZE = 10_000
 
-# Ensure that the directory for the log file exists
 log_dir = os.path.dirname(log_file)
-os.makedirs(log_dir, exist_ok=True)
 
-# Set up the RotatingFileHandler
-handler = RotatingFileHandler(log_file, maxBytes=5_000_000, backupCount=5)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
-handler.setFormatter(formatter)
+# Attributes every LogRecord has; anything else was passed through `extra=`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that several processes can append to.
+
+    Each write, and the rollover check before it, happens under an exclusive lock on
+    <log>.lock. A handle to a file another process has already rotated away is reopened.
+    """
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.lock_file = open(f"{self.baseFilename}.lock", 'a')
+
+    def reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(self.stream.fileno()).st_ino:
+            self.stream.close()
+            self.stream = self._open()
+
+    def emit(self, record):
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            self.reopen_if_rotated()
+            if self.stream is not None:
+                # Other processes append too; size the file by its real end
+                self.stream.seek(0, os.SEEK_END)
+            super().emit(record)
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def close(self):
+        super().close()
+        self.lock_file.close()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'line': record.lineno,
+            'process': record.process,
+            'message': record.getMessage(),
+        }
+        data.update({k: v for k, v in vars(record).items() if k not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def parse_levels(spec):
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+log_queue = queue.Queue(QUEUE_SIZE)
+# Opened by start() on the first record, so importing this module touches no files
+_writer = {"handler": None, "listener": None, "starting": False}
+_writer_lock = threading.RLock()
+
+
+# How long a WARNING or worse waits for room in a full queue before it is dropped
+BLOCKING_PUT_TIMEOUT = 5
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records below WARNING when the writer has fallen behind instead of blocking.
+
+    Warnings and errors wait up to BLOCKING_PUT_TIMEOUT for the writer, since failures are
+    mostly handled by logging them and carrying on.
+    """
 
-# Create a logger instance and attach the handler
+    dropped = 0
+
+    def handle(self, record):
+        if _writer["listener"] is None:
+            start()
+            # The configured levels may be stricter than the defaults the record passed
+            if not logging.getLogger(record.name).isEnabledFor(record.levelno):
+                return False
+        return super().handle(record)
+
+    def prepare(self, record):
+        """A copy of the record for the queue, left for the listener's handler to format.
+
+        QueueHandler.prepare() formats on the calling thread and drops exc_info, which
+        flattened tracebacks into the message and left JsonFormatter's 'exception' empty.
+        Only msg % args is merged here, so later changes to the arguments do not show.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=BLOCKING_PUT_TIMEOUT)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+queue_handler = DroppingQueueHandler(log_queue)
+
+# Create the application logger; modules log through children of it (see get_logger)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-logger.addHandler(handler)
+logger.addHandler(queue_handler)
+logger.propagate = False
+
+
+def get_logger(name):
+    """Logger for a module, e.g. get_logger(__name__). Its level can be set through log_levels."""
+    return logger.getChild(name)
+
+
+def start():
+    """Open the log file, apply the configured levels and start the background writer."""
+    with _writer_lock:
+        if _writer["listener"] is not None or _writer["starting"]:
+            return
+        _writer["starting"] = True
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            handler = SharedRotatingFileHandler(log_file, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+            if settings.log_format == 'json':
+                handler.setFormatter(JsonFormatter())
+            else:
+                handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(filename)s - %(message)s'))
+
+            logger.setLevel(settings.log_level)
+            for name, level in parse_levels(settings.log_levels).items():
+                logger.getChild(name).setLevel(level)
+
+            listener = QueueListener(log_queue, handler, respect_handler_level=True)
+            listener.start()
+            _writer["handler"] = handler
+            _writer["listener"] = listener
+        finally:
+            _writer["starting"] = False
+
+
+def restart_listener():
+    # A forked worker inherits neither the listener thread nor a usable queue (its locks may
+    # have been held at the fork), and it must take the rotation lock on its own file description
+    global log_queue
+    log_queue = queue.Queue(QUEUE_SIZE)
+    queue_handler.queue = log_queue
+    handler = _writer["handler"]
+    if handler is None:
+        return
+    handler.lock_file = open(f"{handler.baseFilename}.lock", 'a')
+    _writer["listener"] = QueueListener(log_queue, handler, respect_handler_level=True)
+    _writer["listener"].start()
+
+
+def stop_listener():
+    # Flush whatever is still queued before the process exits
+    if _writer["listener"] is None:
+        return
+    _writer["listener"].stop()
+    if queue_handler.dropped:
+        _writer["handler"].handle(logger.makeRecord(
+            logger.name, logging.WARNING, __file__, 0,
+            f"Dropped {queue_handler.dropped} log records while the writer was behind.", None, None))
+
+
+os.register_at_fork(after_in_child=restart_listener)
+atexit.register(stop_listener)
@@ -1,12 +1,22 @@
 import os
 import d2l_functions
 import csv_db
-import dotenv
+import snapshots
+import course_directory
+from settings import settings
 import pandas as pd
 from datetime import date
-from logger_config import logger
+from logger_config import get_logger
 import sys
 import time
+import atexit
+import threading
+import run_metrics
+import run_journal
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = get_logger("main")
 
 
 syllabus_query = f"""
@@ -15,15 +25,13 @@ syllabus_query = f"""
             ou.Year, ou.Term, ou.Duration, ou.Section, ou.Department, 
             ou.CourseNumber, ou.SectionType, ou.Recorded,
             co.Location, co.IsDeleted,
-            oua.AncestorOrgUnitId AS FacultyId,
-            f.ProjectId
+            cp.FacultyId,
+            cp.ProjectId
         FROM OrganizationalUnits ou
         LEFT JOIN ContentObjects co ON ou.OrgUnitId = co.OrgUnitId
-        LEFT JOIN OrganizationalUnitAncestors oua ON ou.OrgUnitId = oua.OrgUnitId
-        LEFT JOIN Faculty f ON oua.AncestorOrgUnitId = f.FacultyId
+        JOIN CourseProject cp ON ou.OrgUnitId = cp.OrgUnitId
         WHERE ou.Year = %s 
         AND ou.Term = %s 
-        AND f.ProjectId IS NOT NULL
         AND ou.Recorded = 0
         AND co.IsDeleted = 0
         AND co.Location IS NOT NULL
@@ -35,13 +43,12 @@ all_courses_query = f"""
             ou.Year, ou.Term, ou.Duration, ou.Section, ou.Department, 
             ou.CourseNumber, ou.SectionType, ou.Recorded,
             co.Location, co.IsDeleted,
-            oua.AncestorOrgUnitId AS FacultyId,
-            f.ProjectId,
+            cp.FacultyId,
+            cp.ProjectId,
             bl.AdoptionStatus
         FROM OrganizationalUnits ou
         LEFT JOIN ContentObjects co ON ou.OrgUnitId = co.OrgUnitId
-        LEFT JOIN OrganizationalUnitAncestors oua ON ou.OrgUnitId = oua.OrgUnitId
-        LEFT JOIN Faculty f ON oua.AncestorOrgUnitId = f.FacultyId
+        JOIN CourseProject cp ON ou.OrgUnitId = cp.OrgUnitId
         LEFT JOIN (
                 SELECT
                     Code,
@@ -53,8 +60,7 @@ all_courses_query = f"""
                 GROUP BY Code
                 ) bl ON ou.Code = bl.Code
         WHERE ou.Year = %s 
-        AND ou.Term = %s 
-        AND f.ProjectId IS NOT NULL;
+        AND ou.Term = %s;
     """
 
 def get_config(mode):
@@ -106,12 +112,19 @@ def get_data_hub_reports():
         # Check if the request was successful
         if create_bds_extract.status_code == 200:
             try:
-                download_link = create_bds_extract.json().get('Objects', [{}])[0].get('DownloadLink')
+                extract = create_bds_extract.json().get('Objects', [{}])[0]
+                download_link = extract.get('DownloadLink')
                 if not download_link:
                     raise KeyError("DownloadLink missing in response.")
 
                 logger.info(f"Download link for Schema ID {schema_id}, Plugin ID {plugin_id}: {download_link}")
-                d2l_functions.save_and_unzip_file(download_link, access_token, datahub_path)
+                extracted = d2l_functions.save_and_unzip_file(download_link, access_token, datahub_path)
+
+                # Convert the extract once into the typed Parquet cache the DB stages read from
+                for name in extracted:
+                    extract_name, extension = os.path.splitext(os.path.basename(name))
+                    if extension == '.csv' and extract_name in csv_db.DATAHUB_SCHEMAS:
+                        csv_db.cache_extract(extract_name, extract.get('CreatedDate'))
 
             except (IndexError, KeyError) as e:
                 logger.error(f"Error: No valid download link found for Schema ID {schema_id}, Plugin ID {plugin_id}. Details: {e}")
@@ -119,13 +132,18 @@ def get_data_hub_reports():
             logger.error(f"Failed to retrieve extract for Schema ID {schema_id}, Plugin ID {plugin_id}. "
                 f"Status code: {create_bds_extract.status_code}")
 
-def download_upload_syllabus(df):
+def download_upload_syllabus(df, journal_key):
     try:
         # Loop through each row in the CSV
         for index, row in df.iterrows():
+            # Transfers an interrupted run finished are not repeated on --resume
+            inputs = {'location': row['Location'], 'project': row['ProjectId']}
+            if journal.transferred(journal_key, row['OrgUnitId'], inputs):
+                continue
             filetype = d2l_functions.classify_location(row['Location'])
-            download_syllabus(row, filetype)
-            d2l_functions.upload_syllabus(row, filetype, access_token)
+            ok = download_syllabus(row, filetype)
+            ok = d2l_functions.upload_syllabus(row, filetype, access_token) and ok
+            journal.record_transfer(journal_key, row['OrgUnitId'], inputs, ok)
     except Exception as e:
         logger.error(f"An error occurred: {e}")
 
@@ -146,7 +164,7 @@ def download_syllabus(row, filetype):
         os.makedirs(download_path, exist_ok=True)  # Ensure the directory exists
             
         # Call save_file function to download and save the file
-        logger.info(f"Processing: {file_url} -> {download_path}")
+        logger.debug("Processing: %s -> %s", file_url, download_path)
         
         if (filetype=='d2l'):
             path = os.path.join(download_path, f"syllabus_{orgUnitCode}.html")
@@ -157,11 +175,25 @@ def download_syllabus(row, filetype):
             filename = d2l_functions.save_file(file_url, access_token, download_path, orgUnitCode)
                 
             if filename:
-                logger.info(f"File saved successfully: {filename}")
+                logger.debug("File saved successfully: %s", filename)
             else:
                 logger.error(f"Failed to save file for {orgUnitId}")
+                return False
+        return True
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+        return False
+
+
+# Terms processed in parallel share each project's department folder and modules; creating
+# them is serialized per (project, department) so two terms do not both create the same one.
+structure_locks = defaultdict(threading.Lock)
+structure_locks_guard = threading.Lock()
+
+
+def structure_lock(orgUnitId, department):
+    with structure_locks_guard:
+        return structure_locks[(orgUnitId, department)]
 
 
 def create_BS_folders(df, year, term):
@@ -176,13 +208,14 @@ def create_BS_folders(df, year, term):
         create_folder_url = f"{config['bspace_url']}/d2l/api/lp/1.47/{orgUnitId}/managefiles/folder"
         check_folder_url = f"{config['bspace_url']}/d2l/api/lp/1.47/{orgUnitId}/managefiles/"
 
-        if not (d2l_functions.is_folder_exists(check_folder_url, access_token, department)):
-            create_folder_payload = {"RelativePath": f"{department}"}
-            d2l_functions.post_with_auth(create_folder_url, access_token, data=(create_folder_payload), json_data=True)
+        with structure_lock(orgUnitId, department):
+            if not (d2l_functions.is_folder_exists(check_folder_url, access_token, department)):
+                create_folder_payload = {"RelativePath": f"{department}"}
+                d2l_functions.post_with_auth(create_folder_url, access_token, data=(create_folder_payload), json_data=True)
 
-        if not (d2l_functions.is_folder_exists(f"{check_folder_url}?path={department}", access_token, str(year))):
-            create_folder_payload = {"RelativePath": f"{department}/{year}"}
-            d2l_functions.post_with_auth(create_folder_url, access_token, data=(create_folder_payload), json_data=True)
+            if not (d2l_functions.is_folder_exists(f"{check_folder_url}?path={department}", access_token, str(year))):
+                create_folder_payload = {"RelativePath": f"{department}/{year}"}
+                d2l_functions.post_with_auth(create_folder_url, access_token, data=(create_folder_payload), json_data=True)
 
         if not (d2l_functions.is_folder_exists(f"{check_folder_url}?path={department}/{year}", access_token, term)):
             create_folder_payload = {"RelativePath": f"{department}/{year}/{term}"}
@@ -271,20 +304,21 @@ def add_content_module(df, year, term):
             "Duration": None
         }
 
-        toc = d2l_functions.get_with_auth(f"{config['bspace_url']}/d2l/api/le/1.80/{orgUnitId}/content/toc", access_token)
-        toc_json = toc.json()
-        
-        # checking if Department module exists, create if not
-        root_module_id = check_root_module(toc_json, department)
-        if  root_module_id is None:
-            root_module_call = d2l_functions.post_with_auth(f"{config['bspace_url']}/d2l/api/le/1.80/{orgUnitId}/content/root/", access_token, data=(root_module_payload), json_data=True)
-            root_module_id = root_module_call.json()['Id']
-        
-        # checking if Year module exists in given Department module, create if not
-        child_module_id =  check_child_module(toc_json, department, str(year))
-        if child_module_id is None:
-            child_module_call = d2l_functions.post_with_auth(f"{config['bspace_url']}/d2l/api/le/1.80/{orgUnitId}/content/modules/{root_module_id}/structure/", access_token, data=(child_module_payload), json_data=True)
-            child_module_id = child_module_call.json()['Id']
+        with structure_lock(orgUnitId, department):
+            toc = d2l_functions.get_with_auth(f"{config['bspace_url']}/d2l/api/le/1.80/{orgUnitId}/content/toc", access_token)
+            toc_json = toc.json()
+
+            # checking if Department module exists, create if not
+            root_module_id = check_root_module(toc_json, department)
+            if  root_module_id is None:
+                root_module_call = d2l_functions.post_with_auth(f"{config['bspace_url']}/d2l/api/le/1.80/{orgUnitId}/content/root/", access_token, data=(root_module_payload), json_data=True)
+                root_module_id = root_module_call.json()['Id']
+
+            # checking if Year module exists in given Department module, create if not
+            child_module_id =  check_child_module(toc_json, department, str(year))
+            if child_module_id is None:
+                child_module_call = d2l_functions.post_with_auth(f"{config['bspace_url']}/d2l/api/le/1.80/{orgUnitId}/content/modules/{root_module_id}/structure/", access_token, data=(child_module_payload), json_data=True)
+                child_module_id = child_module_call.json()['Id']
 
         # check if topic html file exists in given Department and Year, if not create topic linked to an existing html file in the Course File Management 
         topic_id = check_topic_in_module(toc_json, department, str(year), f"Term - {term}")
@@ -292,32 +326,172 @@ def add_content_module(df, year, term):
             topic_call = d2l_functions.post_with_auth(f"{config['bspace_url']}/d2l/api/le/1.80/{orgUnitId}/content/modules/{child_module_id}/structure/", access_token, data=(topic_payload), json_data=True)
 
 
+def run_term(each):
+    with run_metrics.stage('term', term=each['term'], year=each['year']):
+        process_term(each['year'], each['term'])
+
+
+def run_terms(term_year):
+    """Process the terms, in parallel when term_workers allows; fail after all have finished."""
+    workers = min(settings.term_workers, len(term_year))
+    if workers <= 1:
+        for each in term_year:
+            run_term(each)
+        return
+
+    # The terms share the HTTP session's connection pool and a pool of DB connections
+    csv_db.enable_pool(workers * 2)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='term') as executor:
+        futures = [run_metrics.run_in_context(executor, run_term, each) for each in term_year]
+    failed = []
+    for each, future in zip(term_year, futures):
+        if future.exception() is not None:
+            logger.error(f"Term {each['term']} {each['year']} failed: {future.exception()!r}")
+            failed.append(future.exception())
+    if failed:
+        raise failed[0]
+
+
+def apply_recorded(all_courses, org_unit_ids, value):
+    """Set Recorded for the given units in the term's frame; returns the departments whose rows changed."""
+    if all_courses.empty:
+        return set()
+    changed = all_courses['OrgUnitId'].isin(list(org_unit_ids)) & (all_courses['Recorded'] != value)
+    all_courses.loc[changed, 'Recorded'] = value
+    return set(all_courses.loc[changed, 'Department'])
+
+
+def courses_fingerprint(df):
+    """Hash of a term's course rows; the journaled term stages are redone when it changes."""
+    return str(int(pd.util.hash_pandas_object(df, index=False).sum()))
+
+
+def process_term(year, term):
+    #create folders in the Brightspace
+    logger.info(f'Request for all course data initiated for given term: {term} and year: {year}.')
+    with run_metrics.stage('fetch_all_courses', term=term, year=year) as stage:
+        all_courses = csv_db.get_sylabus(all_courses_query, term, year)
+        stage.add_rows(len(all_courses))
+
+    # With --resume, the stages below that completed for the same courses are skipped
+    journal_key = f'{year}-{term}'
+    inputs = {'courses': courses_fingerprint(all_courses)}
+
+    logger.info('Creating folders in the BS')
+    if journal.pending(f'{journal_key}:create_folders', inputs):
+        with run_metrics.stage('create_folders', term=term, year=year):
+            create_BS_folders(all_courses, year, term)
+        journal.complete(f'{journal_key}:create_folders', inputs)
+
+    logger.info('Generating folders in the server and html per Department->Year->Term.')
+    if journal.pending(f'{journal_key}:render_html', inputs):
+        with run_metrics.stage('render_html', term=term, year=year) as stage:
+            d2l_functions.generate_syllabus_html(all_courses,base)
+            stage.add_rows(len(all_courses))
+        journal.complete(f'{journal_key}:render_html', inputs)
+
+    logger.info('Uploading html files into Course Management area before creating modules.')
+    if journal.pending(f'{journal_key}:upload_html', inputs):
+        with run_metrics.stage('upload_html', term=term, year=year):
+            d2l_functions.upload_content_html(all_courses, year, term, access_token)
+        journal.complete(f'{journal_key}:upload_html', inputs)
+
+    logger.info('Checking if Content Modules and Topics exists for given Departments->Years-Terms')
+    if journal.pending(f'{journal_key}:content_modules', inputs):
+        with run_metrics.stage('content_modules', term=term, year=year):
+            add_content_module(all_courses, year, term)
+        journal.complete(f'{journal_key}:content_modules', inputs)
+
+    # Upload todays Sylabusses
+    logger.info('Requesting syllabus data that are not been pushed to BS for given year and term.')
+    with run_metrics.stage('fetch_pending', term=term, year=year) as stage:
+        syllabus_to_run = csv_db.get_sylabus(syllabus_query, term, year)
+        stage.add_rows(len(syllabus_to_run))
+    logger.info('Downloading syllabuses and uploading them into Project sites.')
+    with run_metrics.stage('transfer_syllabi', term=term, year=year) as stage:
+        download_upload_syllabus(syllabus_to_run, journal_key)
+        stage.add_rows(len(syllabus_to_run))
+
+    logger.info('Updating Recorded field in DB.')
+    changed_departments = set()
+    with run_metrics.stage('update_recorded', term=term, year=year) as stage:
+        updated = csv_db.update_syllabus_recorded(syllabus_to_run)
+        if updated:
+            changed_departments |= apply_recorded(all_courses, syllabus_to_run['OrgUnitId'], 1)
+        stage.add_rows(updated)
+
+    logger.info('Setting Recorded=4 if Campus store status Complete')
+    with run_metrics.stage('campus_store', term=term, year=year) as stage:
+        changed = csv_db.campus_store_complete(year, term)
+        changed_departments |= apply_recorded(all_courses, changed, 4)
+        stage.add_rows(len(changed))
+
+    logger.info('Setting Recorded=5 if the section type is in IGNORED_SECTION_TYPES')
+    with run_metrics.stage('ignored_sections', term=term, year=year) as stage:
+        changed = csv_db.mark_ignored_sections(year, term)
+        changed_departments |= apply_recorded(all_courses, changed, 5)
+        stage.add_rows(len(changed))
+
+    if not changed_departments:
+        logger.info('No Recorded changes; html files are up to date.')
+        return
+
+    # all_courses now carries the Recorded values written above, so only the departments
+    # with changed rows need their html files rendered and uploaded again
+    changed_courses = all_courses[all_courses['Department'].isin(changed_departments)]
+    logger.info(f'Generating html files again for {len(changed_departments)} departments with new records.')
+    with run_metrics.stage('rerender_html', term=term, year=year) as stage:
+        d2l_functions.generate_syllabus_html(changed_courses, base)
+        stage.add_rows(len(changed_courses))
+
+    logger.info('Uploading updated html files to BS')
+    with run_metrics.stage('reupload_html', term=term, year=year):
+        d2l_functions.upload_content_html(changed_courses, year, term, access_token)
+
+
 # ******** main.py ********
 
 # get configs
 logger.info("Started...")
 
-if len(sys.argv) != 2:
-    print("Usage: python run_mode.py [full|differential]")
-    logger.error("Terminating, incorrect run. Usage: python3 main.py [full|differential]")
+# --resume: skip the work an interrupted run of the same mode finished, see run_journal
+args = sys.argv[1:]
+resume = '--resume' in args
+if resume:
+    args.remove('--resume')
+
+if len(args) != 1:
+    print("Usage: python main.py [full|differential|migrate] [--resume]")
+    logger.error("Terminating, incorrect run. Usage: python3 main.py [full|differential|migrate] [--resume]")
     sys.exit(1)
 
-mode = sys.argv[1].lower()
+mode = args[0].lower()
 
-if mode not in ['full', 'differential']:
-    print("Error: Invalid argument. Only 'full' or 'differential' are allowed.")
-    logger.error("Terminating: Invalid argument. Only 'full' or 'differential' are allowed.")
+if mode not in ['full', 'differential', 'migrate']:
+    print("Error: Invalid argument. Only 'full', 'differential' or 'migrate' are allowed.")
+    logger.error("Terminating: Invalid argument. Only 'full', 'differential' or 'migrate' are allowed.")
     sys.exit(1)
+
+# Deploy step: bring the database schema up to date (CourseProject) before the API serves requests
+if mode == 'migrate':
+    created = csv_db.ensure_course_project()
+    logger.info('CourseProject created and filled.' if created else 'Database schema is up to date.')
+    sys.exit(0)
     
-dotenv_file = dotenv.find_dotenv()
-dotenv.load_dotenv(dotenv_file)
+settings.load()
 config = get_config(mode)
 base = 'downloads'
 os.makedirs(base, exist_ok=True)
 
+# Per-stage timings and volumes, written when the run ends (also on failure)
+run_report = run_metrics.start(mode)
+atexit.register(run_report.finish)
+journal = run_journal.start(mode, resume)
+
 # Get access token and update the refresh token in environment variables
 now = time.time()
-authorize_to_d2l = d2l_functions.trade_in_refresh_token(config)
+with run_metrics.stage('tokens'):
+    authorize_to_d2l = d2l_functions.trade_in_refresh_token(config)
 access_token = authorize_to_d2l['access_token']
 refresh_token = authorize_to_d2l['refresh_token']
 
@@ -332,62 +506,45 @@ logger.info('Tokens are set.')
 # Download and extract data hub reports
 datahub_path = 'datahub/'
 os.makedirs(datahub_path, exist_ok=True)
-logger.info('Downloading reports.')
-get_data_hub_reports()
-logger.info('Reports are downloaded.')
+# A resumed run reuses the extracts downloaded before the interruption while they are still on disk
+datasets = config['datasets']
+if journal.pending('download_reports', {'datasets': datasets, 'extracts': csv_db.extract_versions()}):
+    logger.info('Downloading reports.')
+    with run_metrics.stage('download_reports'):
+        get_data_hub_reports()
+    journal.complete('download_reports', {'datasets': datasets, 'extracts': csv_db.extract_versions()})
+    logger.info('Reports are downloaded.')
 
 
 # Get database configuration
-logger.info('Pushing reports into Database')
-csv_db.setDb()
-logger.info('Database updated.')
+extracts = {'extracts': csv_db.extract_versions()}
+if journal.pending('setDb', extracts):
+    logger.info('Pushing reports into Database')
+    with run_metrics.stage('setDb'):
+        csv_db.setDb()
+    journal.complete('setDb', extracts)
+    logger.info('Database updated.')
 
 today = date.today()
 term_year = get_academic_term(today)
 
 logger.info('Current term identified.')
-for each in term_year:
-    year = each['year']
-    term = each['term']
-
-    #create folders in the Brightspace
-    logger.info(f'Request for all course data initiated for given term: {term} and year: {year}.')
-    all_courses = csv_db.get_sylabus(all_courses_query, term, year)
-
-    logger.info('Creating folders in the BS')
-    create_BS_folders(all_courses, year, term)
-
-    logger.info('Generating folders in the server and html per Department->Year->Term.')
-    d2l_functions.generate_syllabus_html(all_courses,base)
-    
-    logger.info('Uploading html files into Course Management area before creating modules.')
-    d2l_functions.upload_content_html(all_courses, year, term, access_token)
-
-    logger.info('Checking if Content Modules and Topics exists for given Departments->Years-Terms')
-    add_content_module(all_courses, year, term)
-
-    # Upload todays Sylabusses
-    logger.info('Requesting syllabus data that are not been pushed to BS for given year and term.')
-    syllabus_to_run = csv_db.get_sylabus(syllabus_query, term, year)
-    logger.info('Downloading syllabuses and uploading them into Project sites.')
-    download_upload_syllabus(syllabus_to_run)
-
-    logger.info('Updating Recorded field in DB.')
-    csv_db.update_syllabus_recorded(syllabus_to_run)
-
-    logger.info('Setting Recorded=4 if Campus store status Complete')
-    csv_db.campus_store_complete(year, term)
-
-    logger.info('Setting Recorded=5 if the section type is in IGNORED_SECTION_TYPES')
-    csv_db.mark_ignored_sections(year, term)
-
-    logger.info('Requesting new all courses data for given term and year.')
-    all_courses = csv_db.get_sylabus(all_courses_query,  term, year)
-    logger.info('Generating folders and html files in the server again to update the html files with new records.')
-    d2l_functions.generate_syllabus_html(all_courses, base)
-
-    logger.info('Uploading updated html files to BS')
-    d2l_functions.upload_content_html(all_courses, year, term, access_token)
-
+# The upload and exempt endpoints look course codes up here instead of in MySQL
+try:
+    with run_metrics.stage('publish_directory'):
+        course_directory.publish([(each['year'], each['term']) for each in term_year])
+except Exception as e:
+    logger.error(f"Publishing the course directory failed: {e}")
+
+run_terms(term_year)
+
+logger.info('Publishing summary snapshots for the dashboard and reports.')
+try:
+    with run_metrics.stage('publish_snapshots'):
+        snapshots.publish_snapshots()
+except Exception as e:
+    logger.error(f"Publishing summary snapshots failed: {e}")
+
+journal.finish()
 logger.info('End.')
 
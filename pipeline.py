@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from logger_config import get_logger
+import run_metrics
+
+logger = get_logger(__name__)
+
+# A small dependency graph of steps. Each step starts as soon as the steps it needs have
+# finished and is called with their results, so data moves between steps in memory and
+# independent steps (e.g. reading two extracts) run at the same time.
+
+
+class Step:
+    def __init__(self, name, func, needs=()):
+        self.name = name
+        self.func = func
+        self.needs = tuple(needs)
+
+
+def run_step(step, inputs):
+    start = time.perf_counter()
+    with run_metrics.stage(step.name):
+        result = step.func(*inputs)
+    logger.info(f"Step {step.name} finished in {time.perf_counter() - start:.1f}s.")
+    return result
+
+
+def run(steps, max_workers=3):
+    """Run the steps in dependency order, independent ones concurrently; returns {name: result}.
+
+    func is called with the results of `needs`, in that order. Each step is recorded as a
+    run_metrics stage nested under the caller's. When a step fails no further steps are
+    started, and its error is raised once the running ones have finished.
+    """
+    steps = {step.name: step for step in steps}
+    for step in steps.values():
+        unknown = [name for name in step.needs if name not in steps]
+        if unknown:
+            raise ValueError(f"Step {step.name} needs unknown steps: {', '.join(unknown)}")
+
+    results = {}
+    pending = dict(steps)
+    running = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='step') as executor:
+        while True:
+            if error is None:
+                for name, step in list(pending.items()):
+                    if all(need in results for need in step.needs):
+                        del pending[name]
+                        inputs = [results[need] for need in step.needs]
+                        running[run_metrics.run_in_context(executor, run_step, step, inputs)] = name
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logger.error(f"Step {name} failed: {e!r}")
+                    error = error or e
+
+    if error is not None:
+        raise error
+    if pending:
+        raise ValueError(f"Dependency cycle between steps: {', '.join(pending)}")
+    return results
@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import threading
+from logger_config import get_logger
+from settings import settings
+
+logger = get_logger(__name__)
+
+# Progress of a main.py run, so that `main.py <mode> --resume` after a crash skips the work the
+# interrupted run finished. The journal is a JSON-lines file: a header naming the run, then a
+# record per completed stage and per syllabus transfer, appended as they happen. Each record
+# carries the inputs it was done with (extract versions, a fingerprint of a term's courses, a
+# syllabus Location) and only counts when the resumed run has the same inputs.
+
+
+def normalize(inputs):
+    """inputs as they read back from the journal (tuples become lists, keys strings)."""
+    return json.loads(json.dumps(inputs, default=str))
+
+
+class RunJournal:
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.started = time.time()
+        self.stages = {}      # stage -> inputs
+        self.transfers = {}   # (key, org unit id) -> (inputs, ok)
+        self.lock = threading.Lock()
+        self.file = None
+
+    def replay(self, records):
+        header, *records = records
+        self.started = header['started']
+        for record in records:
+            if 'stage' in record:
+                self.stages[record['stage']] = record['inputs']
+            elif 'transfer' in record:
+                self.transfers[(record['transfer'], str(record['org_unit_id']))] = (record['inputs'], record['ok'])
+
+    def open(self, records):
+        """Start the file over with `records` (the header and what is being resumed) and keep it open for appending."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(f"{self.path}.tmp", 'w') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+        os.replace(f"{self.path}.tmp", self.path)
+        self.file = open(self.path, 'a')
+
+    def append(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record, default=str) + '\n')
+            self.file.flush()
+
+    def pending(self, stage, inputs):
+        """False when the stage already completed with the same inputs, else True."""
+        if self.stages.get(stage) == normalize(inputs):
+            logger.info(f"Skipping {stage}: completed with the same inputs before the run was interrupted.")
+            return False
+        return True
+
+    def complete(self, stage, inputs):
+        self.stages[stage] = normalize(inputs)
+        self.append({'stage': stage, 'inputs': inputs, 'at': time.time()})
+
+    def transferred(self, key, org_unit_id, inputs):
+        """Whether this course's syllabus was transferred successfully with the same inputs."""
+        return self.transfers.get((key, str(org_unit_id))) == (normalize(inputs), True)
+
+    def record_transfer(self, key, org_unit_id, inputs, ok):
+        self.transfers[(key, str(org_unit_id))] = (normalize(inputs), bool(ok))
+        self.append({'transfer': key, 'org_unit_id': str(org_unit_id), 'inputs': inputs, 'ok': bool(ok)})
+
+    def finish(self):
+        """Mark the run complete; a later --resume then starts a new run."""
+        self.append({'finished': time.time()})
+        self.file.close()
+
+
+def read(path):
+    """The journal's records, up to a line cut short by a crash."""
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def start(mode, resume=False, path=None):
+    """Open the journal for a run, resuming the last one when asked and it was interrupted in the same mode."""
+    journal = RunJournal(path or settings.run_journal_path, mode)
+    records = read(journal.path) if resume else []
+    if records and (records[0].get('mode') != mode or any('finished' in r for r in records)):
+        logger.info("Nothing to resume: the last run finished or ran in another mode. Starting a new run.")
+        records = []
+
+    if records:
+        journal.replay(records)
+        logger.info(f"Resuming the run started {time.ctime(journal.started)}: "
+                    f"{len(journal.stages)} stages and {sum(ok for _, ok in journal.transfers.values())} transfers done.")
+    else:
+        records = [{'mode': mode, 'started': journal.started}]
+    journal.open(records)
+    return journal
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import socket
+import threading
+import contextvars
+from contextlib import contextmanager
+from logger_config import get_logger
+import d2l_stats
+from settings import settings
+
+logger = get_logger(__name__)
+
+# Process-wide counters bumped by d2l_functions (HTTP) and csv_db (DB writes).
+# Each increment is also added to the stages open in the calling context, so stages
+# running in parallel (e.g. one term per thread) are not charged for each other's work.
+COUNTERS = ('http_calls', 'http_bytes', 'db_rows_written')
+
+_counters = dict.fromkeys(COUNTERS, 0)
+_counters_lock = threading.Lock()
+# Stages open in the current thread or task, outermost first
+_open_stages = contextvars.ContextVar('open_stages', default=())
+
+
+def count(name, value=1):
+    with _counters_lock:
+        _counters[name] += value
+        for stage in _open_stages.get():
+            stage.deltas[name] += value
+
+
+def counters():
+    with _counters_lock:
+        return dict(_counters)
+
+
+class Stage:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.rows = 0
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.deltas = dict.fromkeys(COUNTERS, 0)
+        self.status = 'running'
+
+    def add_rows(self, n):
+        self.rows += int(n)
+
+    def as_dict(self):
+        return {
+            'stage': self.name,
+            **self.labels,
+            'status': self.status,
+            'wall_seconds': round(self.wall_seconds or 0, 3),
+            'cpu_seconds': round(self.cpu_seconds or 0, 3),
+            'rows': self.rows,
+            **self.deltas,
+        }
+
+
+class RunReport:
+    """Timings and volumes for every stage of a main.py run."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.started = time.time()
+        self.finished = None
+        self.stages = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """Time a block and record its counter deltas. Labels (e.g. term, year) tell iterations apart.
+
+        Work done in another thread is only counted when it runs in a copy of this context,
+        see run_in_context.
+        """
+        stage = Stage(name, {k: str(v) for k, v in labels.items()})
+        with self.lock:
+            self.stages.append(stage)
+        token = _open_stages.set(_open_stages.get() + (stage,))
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+            stage.status = 'ok'
+        except BaseException:
+            stage.status = 'failed'
+            raise
+        finally:
+            stage.wall_seconds = time.perf_counter() - start_wall
+            stage.cpu_seconds = time.process_time() - start_cpu
+            _open_stages.reset(token)
+            logger.info(
+                f"Stage {name} {labels or ''}: {stage.wall_seconds:.1f}s wall, {stage.cpu_seconds:.1f}s cpu, "
+                f"{stage.rows} rows, {stage.deltas['http_calls']} HTTP calls, "
+                f"{stage.deltas['http_bytes']} bytes, {stage.deltas['db_rows_written']} DB rows"
+            )
+
+    def as_dict(self):
+        return {
+            'mode': self.mode,
+            'host': socket.gethostname(),
+            'started': self.started,
+            'finished': self.finished,
+            'duration_seconds': round((self.finished or time.time()) - self.started, 3),
+            'totals': counters(),
+            'stages': [s.as_dict() for s in self.stages],
+            'd2l': d2l_stats.snapshot(),
+        }
+
+    def write_json(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def write_prometheus(self, path):
+        """Write the report in the node_exporter textfile collector format (atomically, as it requires)."""
+        metrics = [
+            ('wall_seconds', 'Wall time of the stage in seconds.'),
+            ('cpu_seconds', 'Process CPU time spent in the stage in seconds.'),
+            ('rows', 'Rows processed by the stage.'),
+            ('http_calls', 'Brightspace HTTP calls made during the stage.'),
+            ('http_bytes', 'Bytes sent and received from Brightspace during the stage.'),
+            ('db_rows_written', 'Database rows written during the stage.'),
+        ]
+        lines = []
+        for field, help_text in metrics:
+            name = f"syllabus_run_stage_{field}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for stage in self.stages:
+                labels = {'stage': stage.name, 'mode': self.mode, 'term': '', 'year': '', **stage.labels}
+                label_text = ','.join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+                value = stage.as_dict()[field]
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        duration = (self.finished or time.time()) - self.started
+        lines += [
+            "# HELP syllabus_run_duration_seconds Duration of the last main.py run.",
+            "# TYPE syllabus_run_duration_seconds gauge",
+            f'syllabus_run_duration_seconds{{mode="{self.mode}"}} {duration:.3f}',
+            "# HELP syllabus_run_last_finished_timestamp_seconds End of the last main.py run.",
+            "# TYPE syllabus_run_last_finished_timestamp_seconds gauge",
+            f'syllabus_run_last_finished_timestamp_seconds{{mode="{self.mode}"}} {self.finished or time.time():.0f}',
+        ]
+        lines += d2l_stats.prometheus_lines('syllabus_run_d2l', labels={'mode': self.mode})
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(f"{path}.tmp", 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(f"{path}.tmp", path)
+
+    def finish(self, json_file=None, prometheus_file=None):
+        json_file = json_file or settings.run_report_path
+        prometheus_file = prometheus_file or settings.prometheus_textfile
+        self.finished = time.time()
+        logger.info(f"Brightspace calls this run:\n{d2l_stats.summary_table()}")
+        self.write_json(json_file)
+        self.write_prometheus(prometheus_file)
+        logger.info(f"Run report written to {json_file} and {prometheus_file}")
+
+
+# The report of the running main.py, if any; library code records stages through stage() below
+_active = {"report": None}
+
+
+def start(mode):
+    _active["report"] = RunReport(mode)
+    return _active["report"]
+
+
+@contextmanager
+def stage(name, **labels):
+    """Record a stage on the active run report; a no-op outside a main.py run (e.g. in the API)."""
+    report = _active["report"]
+    if report is None:
+        yield Stage(name, labels)
+        return
+    with report.stage(name, **labels) as s:
+        yield s
+
+
+def run_in_context(executor, fn, *args):
+    """Submit fn to an executor so its stages and counters nest under the caller's open stages."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def last_report():
+    """The report of the last finished main.py run, or None."""
+    try:
+        with open(settings.run_report_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,170 @@
+import os
+import threading
+from lazy import lazy_import
+
+dotenv = lazy_import('dotenv')
+
+REQUIRED = object()
+
+
+def comma_list(value):
+    return tuple(s.strip() for s in value.split(","))
+
+
+def flag(value):
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def department_map(value):
+    pairs = (item.partition("=") for item in comma_list(value) if item)
+    return {department.strip(): int(faculty) for department, _, faculty in pairs}
+
+
+class env:
+    """A setting read from the environment (after .env is loaded) on first access and then cached."""
+
+    def __init__(self, key, default=REQUIRED, cast=None):
+        self.key = key
+        self.default = default
+        self.cast = cast
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, settings, owner=None):
+        if settings is None:
+            return self
+        try:
+            return settings.values[self.name]
+        except KeyError:
+            pass
+        settings.load()
+        if self.key in os.environ:
+            value = os.environ[self.key]
+        elif self.default is REQUIRED:
+            raise KeyError(self.key)
+        else:
+            value = self.default
+        if self.cast is not None and value is not None:
+            value = self.cast(value)
+        settings.values[self.name] = value
+        return value
+
+
+class Settings:
+    """Configuration for main.py and syllabus_api, loaded from .env and the environment when first used.
+
+    Nothing is read at import, so importing a module costs no file access and a missing
+    variable only fails the code path that needs it.
+    """
+
+    bspace_url = env("bspace_url")
+    api_route = env("api_route")
+    # Overridable so runs can target a local stand-in (benchmarks/fake_brightspace.py)
+    auth_url = env("auth_url", "https://auth.brightspace.com/core/connect/token")
+    secret_key = env("secret_key")
+
+    db_host = env("host")
+    db_user = env("user")
+    db_password = env("password")
+    db_name = env("database")
+    db_port = env("port", None, cast=int)
+    # Optional read replica for the dashboard and report queries; the replica_* settings
+    # that are not set default to the primary's
+    db_replica_host = env("replica_host", None)
+    db_replica_port = env("replica_port", None, cast=int)
+    db_replica_user = env("replica_user", None)
+    db_replica_password = env("replica_password", None)
+    db_replica_name = env("replica_database", None)
+    # Reads go to the primary while the replica is further behind than this, in seconds
+    db_replica_max_lag = env("replica_max_lag", 300, cast=int)
+    # How often the replica's lag is checked, in seconds
+    db_replica_check_interval = env("replica_check_interval", 30, cast=int)
+    # Seconds to wait for a replica connection before reading from the primary instead
+    db_replica_connect_timeout = env("replica_connect_timeout", 2, cast=int)
+    # Connections per process when pooled (syllabus_api, parallel terms in main.py)
+    db_pool_size = env("db_pool_size", 5, cast=int)
+    # Force the pure-Python MySQL driver (true) or the C extension (false); unset picks the C extension when installed
+    db_use_pure = env("db_use_pure", None, cast=flag)
+
+    # Departments whose courses are filed under a fixed faculty instead of the one in the
+    # Data Hub ancestors: BTGD-Faculty for BTGD, plus "DEPT=FacultyId,..." for any others
+    btgd_faculty = env("BTGD-Faculty", None, cast=int)
+    department_faculty_overrides = env("DEPARTMENT_FACULTY_OVERRIDES", "", cast=department_map)
+    qualified_section_types = env("QUALIFIED_SECTION_TYPES", "ASO,ASY,BLD,CLI,HYF,LEC,LL,SYN,SYO", cast=comma_list)
+    ignored_section_types = env("IGNORED_SECTION_TYPES", "PRO,SEM,FLD,LAB,INT,ONM,IFT,TUT", cast=comma_list)
+
+    # Terms main.py processes at once (spring runs SP and SU); 1 processes them in turn
+    term_workers = env("term_workers", 2, cast=int)
+
+    # setDb steps run at once, e.g. reading the three extracts; more workers use more memory
+    setdb_workers = env("setdb_workers", 3, cast=int)
+
+    run_report_path = env("run_report_path", "datahub/run_report.json")
+    # Completed stages and transfers of the current main.py run, read by --resume
+    run_journal_path = env("run_journal_path", "datahub/run_journal.jsonl")
+    prometheus_textfile = env("prometheus_textfile", "datahub/metrics/syllabus_run.prom")
+
+    log_level = env("log_level", "INFO", cast=str.upper)
+    log_levels = env("log_levels", "")
+    log_format = env("log_format", "text", cast=str.lower)
+
+    def __init__(self):
+        self.values = {}
+        self.dotenv_file = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.loaded:
+            return
+        with self.lock:
+            if not self.loaded:
+                self.dotenv_file = dotenv.find_dotenv()
+                dotenv.load_dotenv(self.dotenv_file)
+                self.loaded = True
+
+    def reload(self):
+        """Re-read .env over the environment, e.g. after another process refreshed the tokens."""
+        self.load()
+        dotenv.load_dotenv(self.dotenv_file, override=True)
+        self.values.clear()
+
+    def save(self, key, value):
+        """Set a variable in this process and persist it to .env."""
+        self.load()
+        os.environ[key] = value
+        dotenv.set_key(self.dotenv_file, key, value)
+
+    @property
+    def faculty_overrides(self):
+        overrides = {} if self.btgd_faculty is None else {"BTGD": self.btgd_faculty}
+        overrides.update(self.department_faculty_overrides)
+        return overrides
+
+    @property
+    def db_config(self):
+        config = {
+            "host": self.db_host,
+            "user": self.db_user,
+            "password": self.db_password,
+            "database": self.db_name,
+        }
+        if self.db_port is not None:
+            config["port"] = self.db_port
+        return config
+
+    @property
+    def db_replica_config(self):
+        """Connection settings for the read replica, or None when none is configured."""
+        if not self.db_replica_host:
+            return None
+        config = dict(self.db_config, host=self.db_replica_host, connection_timeout=self.db_replica_connect_timeout)
+        for key, value in (("port", self.db_replica_port), ("user", self.db_replica_user),
+                           ("password", self.db_replica_password), ("database", self.db_replica_name)):
+            if value is not None:
+                config[key] = value
+        return config
+
+
+settings = Settings()
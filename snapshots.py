@@ -0,0 +1,388 @@
+import os
+import copy
+import json
+import time
+import shutil
+import fcntl
+import threading
+from contextlib import contextmanager
+import csv_db
+from logger_config import get_logger
+from lazy import lazy_import
+from settings import settings
+
+pd = lazy_import('pandas')
+pyarrow = lazy_import('pyarrow', optional=True)  # parquet engine for pandas
+
+logger = get_logger(__name__)
+
+# Versioned summary snapshots published by main.py and read by syllabus_api.
+# Layout: datahub/snapshots/<version>/{courses,counts,departments}.parquet + manifest.json,
+# with datahub/snapshots/CURRENT naming the live version. Recorded changes made through the
+# API after a version was published are appended to its status.jsonl, one {"code", "value"}
+# line each, and applied on top of the Parquet files when the version is read; the next
+# publish folds them into its own files.
+snapshot_path = 'datahub/snapshots'
+current_file = os.path.join(snapshot_path, 'CURRENT')
+lock_file = os.path.join(snapshot_path, '.lock')
+STATUS_FILE = 'status.jsonl'
+KEEP_VERSIONS = 5
+
+COURSE_COLUMNS = ['Year', 'Term', 'Department', 'Code', 'SectionType', 'Recorded', 'AdoptionStatus']
+COUNT_FIELDS = ['total', 'recorded', 'qualified_total', 'qualified_recorded']
+
+
+def summarize(courses):
+    """Aggregate course rows into faculty x year x term counts and department x year qualified counts."""
+    df = courses.assign(
+        recorded=courses['Recorded'].fillna(0).astype(int) >= 1,
+        qualified=courses['SectionType'].isin(settings.qualified_section_types),
+    )
+    df['qualified_recorded'] = df['recorded'] & df['qualified']
+
+    counts = df.groupby(['ProjectId', 'Year', 'Term']).agg(
+        total=('Code', 'size'),
+        recorded=('recorded', 'sum'),
+        qualified_total=('qualified', 'sum'),
+        qualified_recorded=('qualified_recorded', 'sum'),
+    ).reset_index()
+
+    departments = df[df['Department'].fillna('') != ''].groupby(['ProjectId', 'Department', 'Year']).agg(
+        qualified_total=('qualified', 'sum'),
+        qualified_recorded=('qualified_recorded', 'sum'),
+    ).reset_index()
+
+    return counts, departments
+
+
+class Snapshot:
+    """In-memory form of a published version, indexed for constant-time lookups."""
+
+    def __init__(self, version, years, courses, counts, departments):
+        self.version = version
+        self.years = [int(y) for y in years]
+
+        self.courses = courses.sort_values(['ProjectId', 'Year'], kind='stable').reset_index(drop=True)
+        self.course_slices = {}
+        self.codes = {}
+        for i, (project_id, year, code) in enumerate(zip(self.courses['ProjectId'], self.courses['Year'], self.courses['Code'])):
+            key = (int(project_id), int(year))
+            start, _ = self.course_slices.get(key, (i, i))
+            self.course_slices[key] = (start, i + 1)
+            self.codes.setdefault(code, []).append(i)
+
+        self.counts = {
+            (int(r.ProjectId), int(r.Year), r.Term): [int(getattr(r, f)) for f in COUNT_FIELDS]
+            for r in counts.itertuples(index=False)
+        }
+        self.departments = {}
+        for r in departments.itertuples(index=False):
+            self.departments.setdefault((int(r.ProjectId), int(r.Year)), {})[r.Department] = [
+                int(r.qualified_total), int(r.qualified_recorded)
+            ]
+
+    def with_status(self, changes):
+        """A new Snapshot with the Recorded changes [(code, value)] applied; this one is left as it is.
+
+        Only the Recorded column and the count lists that change are copied, so readers
+        holding this snapshot never see a partly applied change.
+        """
+        snap = copy.copy(self)
+        recorded = self.courses['Recorded'].copy()
+        snap.counts = dict(self.counts)
+        snap.departments = dict(self.departments)
+        copied = set()
+
+        def counts_for(key):
+            if ('counts', key) not in copied:
+                snap.counts[key] = list(snap.counts[key])
+                copied.add(('counts', key))
+            return snap.counts[key]
+
+        def department_for(key, department):
+            if ('departments', key) not in copied:
+                snap.departments[key] = dict(snap.departments[key])
+                copied.add(('departments', key))
+            if ('departments', key, department) not in copied:
+                snap.departments[key][department] = list(snap.departments[key][department])
+                copied.add(('departments', key, department))
+            return snap.departments[key][department]
+
+        for code, value in changes:
+            value = int(value)
+            for i in self.codes.get(code, ()):
+                old = recorded.iat[i]
+                delta = int(value >= 1) - int(not pd.isna(old) and int(old) >= 1)
+                recorded.iat[i] = value
+                if not delta:
+                    continue
+
+                project_id, year = int(self.courses['ProjectId'].iat[i]), int(self.courses['Year'].iat[i])
+                counts = counts_for((project_id, year, self.courses['Term'].iat[i]))
+                counts[1] += delta
+                if self.courses['SectionType'].iat[i] in settings.qualified_section_types:
+                    counts[3] += delta
+                    department = self.courses['Department'].iat[i]
+                    if not pd.isna(department) and department != '':
+                        department_for((project_id, year), department)[1] += delta
+
+        snap.courses = self.courses.assign(Recorded=recorded)
+        return snap
+
+
+_loaded = {"stamp": None, "snapshot": None, "version": None, "offset": 0}
+_load_lock = threading.Lock()
+
+
+@contextmanager
+def publish_lock():
+    """Exclusive lock across processes for read-modify-publish cycles."""
+    os.makedirs(snapshot_path, exist_ok=True)
+    with open(lock_file, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_version(years, courses, counts, departments):
+    """Write a new snapshot version and make it current. Returns the version name."""
+    version = str(time.time_ns())
+    tmp_dir = os.path.join(snapshot_path, f".{version}.tmp")
+    os.makedirs(tmp_dir)
+
+    courses.to_parquet(os.path.join(tmp_dir, 'courses.parquet'), index=False)
+    counts.to_parquet(os.path.join(tmp_dir, 'counts.parquet'), index=False)
+    departments.to_parquet(os.path.join(tmp_dir, 'departments.parquet'), index=False)
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump({"version": version, "years": [int(y) for y in years], "created": time.time()}, f)
+
+    os.rename(tmp_dir, os.path.join(snapshot_path, version))
+    tmp_current = f"{current_file}.tmp"
+    with open(tmp_current, 'w') as f:
+        f.write(version)
+    os.replace(tmp_current, current_file)
+
+    # Keep the most recent versions only
+    versions = sorted(d for d in os.listdir(snapshot_path) if d.isdigit())
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(snapshot_path, old), ignore_errors=True)
+
+    return version
+
+
+def live_version():
+    try:
+        with open(current_file) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def status_path(version):
+    return os.path.join(snapshot_path, version, STATUS_FILE)
+
+
+def status_size(version):
+    try:
+        return os.path.getsize(status_path(version))
+    except (FileNotFoundError, TypeError):
+        return 0
+
+
+def read_status(version, offset=0):
+    """([(code, value)], end offset) for the complete status lines of a version from offset on."""
+    try:
+        with open(status_path(version), 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    # A line still being written is left for the next read
+    data = data[:data.rfind(b'\n') + 1]
+    changes = [(r['code'], r['value']) for r in map(json.loads, data.splitlines())]
+    return changes, offset + len(data)
+
+
+def apply_status(courses, changes):
+    """Set Recorded in fetched course rows from (code, value) changes, the last one for a code winning."""
+    latest = dict(changes)
+    if latest:
+        changed = courses['Code'].isin(latest)
+        courses.loc[changed, 'Recorded'] = courses.loc[changed, 'Code'].map(latest).astype('Int64')
+    return courses
+
+
+def publish_snapshots():
+    """Rebuild all summary snapshots from MySQL. Called at the end of main.py."""
+    if pyarrow is None:
+        logger.warning("pyarrow is not installed; summary snapshots are not published.")
+        return None
+
+    years = [y[0] for y in csv_db.get_last_three_years()]
+    if not years:
+        logger.warning("No years to snapshot.")
+        return None
+
+    # Status changes recorded from here on may be missing from the fetch; they are re-applied
+    # below rather than holding the lock, and so blocking uploads, for the whole query
+    with publish_lock():
+        base = live_version()
+        offset = status_size(base)
+
+    courses = csv_db.fetch_summary_courses(years)
+    courses['ProjectId'] = courses['ProjectId'].astype(int)
+    courses['Year'] = courses['Year'].astype(int)
+    courses['Recorded'] = courses['Recorded'].astype('Int64')
+
+    with publish_lock():
+        changes, _ = read_status(base, offset) if base else ([], 0)
+        live = live_version()
+        if live and live != base:
+            changes += read_status(live)[0]
+        counts, departments = summarize(apply_status(courses, changes))
+        version = write_version(years, courses, counts, departments)
+    logger.info(f"Published summary snapshot {version} ({len(courses)} course rows, years {years}).")
+    return version
+
+
+def load_version(version):
+    version_dir = os.path.join(snapshot_path, version)
+    with open(os.path.join(version_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    return Snapshot(
+        version,
+        manifest['years'],
+        pd.read_parquet(os.path.join(version_dir, 'courses.parquet')),
+        pd.read_parquet(os.path.join(version_dir, 'counts.parquet')),
+        pd.read_parquet(os.path.join(version_dir, 'departments.parquet')),
+    )
+
+
+def current():
+    """Return the live Snapshot, reloading it when CURRENT has changed, or None if there is none."""
+    if pyarrow is None:
+        return None
+    try:
+        stat = os.stat(current_file)
+    except FileNotFoundError:
+        return None
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if _loaded["stamp"] == stamp and status_size(_loaded["version"]) == _loaded["offset"]:
+        return _loaded["snapshot"]
+
+    with _load_lock:
+        if _loaded["stamp"] != stamp:
+            try:
+                version = live_version()
+                snap = load_version(version)
+                changes, offset = read_status(version)
+                _loaded.update(snapshot=snap.with_status(changes) if changes else snap, version=version, offset=offset)
+                logger.info(f"Loaded summary snapshot {version} with {len(changes)} status changes.")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Failed to load summary snapshot: {e}")
+                _loaded.update(snapshot=None, version=None, offset=0)
+            _loaded["stamp"] = stamp
+        elif _loaded["snapshot"] is not None and status_size(_loaded["version"]) != _loaded["offset"]:
+            # Swap in a new Snapshot rather than changing the one other threads are reading
+            try:
+                changes, offset = read_status(_loaded["version"], _loaded["offset"])
+                _loaded.update(snapshot=_loaded["snapshot"].with_status(changes), offset=offset)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Failed to apply summary snapshot status changes: {e}")
+                _loaded.update(snapshot=None, version=None, offset=0)
+    return _loaded["snapshot"]
+
+
+def covered(snap, project_id, years):
+    """Return (project_id, [years]) as ints when the snapshot covers them, otherwise None."""
+    if snap is None:
+        return None
+    try:
+        project_id = int(project_id)
+        years = [int(y) for y in years]
+    except (TypeError, ValueError):
+        return None
+    if any(y not in snap.years for y in years):
+        return None
+    return project_id, years
+
+
+# Lookups below return None on a miss so callers fall back to MySQL
+
+def get_last_three_years():
+    snap = current()
+    if snap is None:
+        return None
+    return [(y,) for y in snap.years]
+
+
+def get_counts(year, terms, project_id):
+    snap = current()
+    key = covered(snap, project_id, [year])
+    if key is None:
+        return None
+    project_id, (year,) = key
+    totals = [0] * len(COUNT_FIELDS)
+    for term in terms:
+        for i, value in enumerate(snap.counts.get((project_id, year, term), ())):
+            totals[i] += value
+    return dict(zip(COUNT_FIELDS, totals))
+
+
+def get_department_count(years, project_id):
+    snap = current()
+    key = covered(snap, project_id, years)
+    if key is None:
+        return None
+    project_id, years = key
+    rows = [
+        (dept, year, q_total, q_recorded)
+        for year in years
+        for dept, (q_total, q_recorded) in snap.departments.get((project_id, year), {}).items()
+    ]
+    return sorted(rows, key=lambda r: (r[0], r[1]))
+
+
+def stream_academic_year_courses(year, terms, project_id, batch_size=1000):
+    """Snapshot counterpart of csv_db.stream_academic_year_courses, or None on a miss."""
+    snap = current()
+    key = covered(snap, project_id, [year])
+    if key is None:
+        return None
+    project_id, (year,) = key
+    start, stop = snap.course_slices.get((project_id, year), (0, 0))
+    courses = snap.courses.iloc[start:stop]
+    courses = courses[courses['Term'].isin(terms)][COURSE_COLUMNS]
+
+    def batches():
+        columns = [[None if pd.isna(v) else v for v in courses[c].tolist()] for c in COURSE_COLUMNS]
+        rows = list(zip(*columns))
+        yield COURSE_COLUMNS, rows[:batch_size]
+        for i in range(batch_size, len(rows), batch_size):
+            yield COURSE_COLUMNS, rows[i:i + batch_size]
+
+    return batches()
+
+
+def record_status(code, value):
+    """Record a Recorded change for one course code against the live snapshot version.
+
+    The change is appended to the version's status.jsonl, and every API worker applies it
+    on its next lookup, so a single upload writes one line instead of a new version. Call
+    it after the change is committed to MySQL: publish_snapshots re-applies changes recorded
+    while it was reading.
+    """
+    if pyarrow is None:
+        return
+    try:
+        with publish_lock():
+            version = live_version()
+            snap = current()
+            if version is None or snap is None or snap.version != version or code not in snap.codes:
+                return
+            with open(status_path(version), 'a') as f:
+                f.write(json.dumps({"code": code, "value": int(value)}) + '\n')
+    except Exception as e:
+        logger.error(f"Failed to update summary snapshot for {code}: {e}")
@@ -1,24 +1,40 @@
-from flask import Flask, request, jsonify, abort, send_file
-from flask_cors import CORS
+from flask import Flask, request, jsonify, abort, Response, stream_with_context, g
 import api_auth
-import dotenv
 import os
-from logger_config import logger
+from logger_config import get_logger
 import csv_db
 import d2l_functions
-import pandas as pd
+import snapshots
+import course_directory
+import run_metrics
+import d2l_stats
+import telemetry
+import xlsx_stream
+from lazy import lazy_import
+from settings import settings
 import time
-import requests
+import queue
+import threading
 import io
+import csv
+import itertools
+import contextlib
 
+# Heavy dependencies are imported on first use so workers start fast
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow', optional=True)
+pq = lazy_import('pyarrow.parquet', optional=True)
 
-dotenv_file = dotenv.find_dotenv()
-dotenv.load_dotenv(dotenv_file)
-origin = os.environ["bspace_url"]
+logger = get_logger(__name__)
+
+# Requests share pooled connections with their prepared statements; nothing connects until first use
+csv_db.enable_pool()
+# Load the course directory when the worker starts rather than on its first upload
+course_directory.current()
 
 
 def get_config():
-    dotenv.load_dotenv(dotenv_file, override=True)
+    settings.reload()
     return {
         "bspace_url": os.environ["bspace_url"],
         "client_id": os.environ["client_id"],
@@ -49,12 +65,66 @@ def get_access_token():
         refresh_token = authorize_to_d2l["refresh_token"]
         d2l_functions.set_refresh_token(refresh_token, access_token, str(now))
 
-        dotenv.load_dotenv(dotenv_file, override=True)
+        settings.reload()
         return access_token
 
     return config["access_token"]
 
 
+# Served from /api/metrics; DB query timings are recorded by csv_db and D2L calls by d2l_stats
+request_seconds = telemetry.Histogram(
+    'syllabus_api_request_duration_seconds',
+    'API request latency by route (to the first byte for streamed responses).',
+    ['route', 'method', 'status'])
+requests_in_flight = telemetry.Gauge('syllabus_api_requests_in_flight', 'API requests being handled.')
+upload_bytes = telemetry.Counter('syllabus_api_upload_bytes_total', 'Syllabus bytes received by /api/upload.', ['mode'])
+snapshot_lookups = telemetry.Counter(
+    'syllabus_api_snapshot_lookups_total', 'Summary lookups by whether the snapshot answered them.',
+    ['lookup', 'result'])
+
+
+directory_lookups = telemetry.Counter(
+    'syllabus_api_directory_lookups_total', 'Course code lookups by whether the course directory answered them.',
+    ['result'])
+
+
+def from_snapshot(lookup, value):
+    snapshot_lookups.inc(lookup=lookup, result='hit' if value is not None else 'miss')
+    return value
+
+
+# Dashboard and report aggregates are served from the published snapshots and
+# fall back to MySQL when the snapshot does not cover the request.
+def get_last_three_years():
+    years = from_snapshot('last_three_years', snapshots.get_last_three_years())
+    return years if years is not None else csv_db.get_last_three_years()
+
+
+def fetch_counts(year, terms, project_id):
+    counts = from_snapshot('counts', snapshots.get_counts(year, terms, project_id))
+    return counts if counts is not None else csv_db.fetch_counts(year, terms, project_id)
+
+
+def fetch_department_count(years, project_id):
+    data = from_snapshot('department_count', snapshots.get_department_count(years, project_id))
+    return data if data is not None else csv_db.fetch_department_count(years, project_id)
+
+
+def stream_academic_year_courses(year, terms, project_id):
+    batches = from_snapshot('academic_year_courses', snapshots.stream_academic_year_courses(year, terms, project_id))
+    return batches if batches is not None else csv_db.stream_academic_year_courses(year, terms, project_id)
+
+
+def find_course(course_code):
+    """The course_directory.Course for a code, looked up in MySQL when the directory does not have it."""
+    course = course_directory.lookup(course_code)
+    directory_lookups.inc(result='hit' if course is not None else 'miss')
+    if course is not None:
+        return course
+    year, term, department = extract_info(course_code)
+    return course_directory.Course(csv_db.get_orgUnitId_by_code(course_code), year, term, department, None)
+
+
 def pct(n, d):
     if not d:
         return 0.0
@@ -62,7 +132,7 @@ def pct(n, d):
 
 
 def make_stats_row(year, terms, faculty_id, label):
-    c = csv_db.fetch_counts(year, terms, faculty_id)
+    c = fetch_counts(year, terms, faculty_id)
     return {
         "label": label,
         "raw_collected": c["recorded"],
@@ -74,12 +144,88 @@ def make_stats_row(year, terms, faculty_id, label):
     }
 
 
+# Formats the report endpoints stream straight from the DB cursor
+STREAM_FORMATS = ("csv", "parquet")
+PARQUET_INT_COLUMNS = {"Year"}
+
+
 app = Flask(__name__)
-# CORS(app, resources={r"/api/*": {"origins": origin}})
-logger.info(f"Origin: {origin}")
+# CORS(app, resources={r"/api/*": {"origins": settings.bspace_url}})  # needs flask_cors
 app.config["MAX_CONTENT_LENGTH"] = 2 * 1024 * 1024 * 1024  # 2 GB
 
 
+_schema_ready = {"done": False}
+_schema_lock = threading.Lock()
+
+
+@app.before_request
+def ensure_schema():
+    # The course queries join CourseProject, which deployments from before it existed lack
+    # until `python main.py migrate` or the next nightly run; create it on the first request
+    if _schema_ready["done"]:
+        return
+    with _schema_lock:
+        if not _schema_ready["done"]:
+            try:
+                csv_db.ensure_course_project()
+                _schema_ready["done"] = True
+            except Exception as e:
+                logger.error(f"Creating CourseProject failed, retrying on the next request: {e}")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    requests_in_flight.inc()
+
+
+@app.after_request
+def observe_request(response):
+    if "request_started" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        request_seconds.observe(time.perf_counter() - g.request_started,
+                                route=route, method=request.method, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def end_request(exc=None):
+    if g.pop("request_started", None) is not None:
+        requests_in_flight.dec()
+
+
+@telemetry.register_collector
+def cache_and_pool_lines():
+    """Snapshot cache and Brightspace connection pool state, read at scrape time."""
+    lines = [
+        "# HELP syllabus_api_snapshot_age_seconds Age of the summary snapshot the API is serving.",
+        "# TYPE syllabus_api_snapshot_age_seconds gauge",
+    ]
+    snap = snapshots.current()
+    if snap is not None:
+        lines.append(f"syllabus_api_snapshot_age_seconds {time.time() - int(snap.version) / 1e9:.0f}")
+
+    lines += [
+        "# HELP syllabus_api_d2l_pool_connections Connections opened by each Brightspace connection pool.",
+        "# TYPE syllabus_api_d2l_pool_connections gauge",
+        "# HELP syllabus_api_d2l_pool_idle Idle connections kept by each Brightspace connection pool.",
+        "# TYPE syllabus_api_d2l_pool_idle gauge",
+    ]
+    for adapter in d2l_functions.session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = telemetry.escape(f"{pool.scheme}://{pool.host}:{pool.port}")
+            # The pool queue is pre-filled with None placeholders; only real connections are idle ones
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+            lines.append(f'syllabus_api_d2l_pool_connections{{host="{host}"}} {pool.num_connections}')
+            lines.append(f'syllabus_api_d2l_pool_idle{{host="{host}"}} {idle}')
+
+    return lines + d2l_stats.prometheus_lines("syllabus_api_d2l")
+
+
 @app.route("/api/stats", methods=["GET"])
 def api_stats():
     faculty_id = request.args.get("facultyId")
@@ -88,7 +234,7 @@ def api_stats():
         logger.error("api/stats: Invalid or missing signature")
         abort(403, "Invalid or missing signature")
 
-    years = [y[0] for y in csv_db.get_last_three_years()]
+    years = [y[0] for y in get_last_three_years()]
     sections = {"full_year": [], "fw": [], "sp": [], "su": []}
 
     for y in years:
@@ -108,8 +254,8 @@ def api_stats_by_department():
         logger.error("api/stats/by-department: Invalid or missing signature")
         abort(403, "Invalid or missing signature")
 
-    years = [y[0] for y in csv_db.get_last_three_years()]
-    data = csv_db.fetch_department_count(years, faculty_id)
+    years = [y[0] for y in get_last_three_years()]
+    data = fetch_department_count(years, faculty_id)
 
     # pivot to: Department | year1 | year2 | year3
     by_dept = {}
@@ -142,23 +288,30 @@ def upload():
         course_code = request.args.get("course")
         token = request.args.get("token")
         projectId = request.args.get("projectId")
+        # stream=1: the request body is the raw file and is forwarded to Brightspace as it arrives
+        stream_mode = request.args.get("stream") == "1"
 
         if not course_code or not token or not api_auth.verify_token(course_code, token):
             logger.error("api/upload: Invalid or missing signature")
             abort(403, "Invalid or missing signature")
 
-        uploaded_file = request.files.get("file")
-        if not uploaded_file:
-            abort(400, "No file uploaded")
-
-        year, term, department = extract_info(course_code)
+        if stream_mode:
+            original_filename = request.args.get("filename")
+            file_size = request.content_length
+            if not file_size:
+                abort(411, "Content-Length is required for streaming uploads")
+        else:
+            uploaded_file = request.files.get("file")
+            if not uploaded_file:
+                abort(400, "No file uploaded")
+            original_filename = uploaded_file.filename
+
+        orgUnitId, year, term, department, course_project = find_course(course_code)
         logger.debug(f"year: {year}, term: {term}, department: {department}")
-        orgUnitId = csv_db.get_orgUnitId_by_code(course_code)
         if orgUnitId is None:
             logger.error(f"orgUnitId not found for course_code: {course_code}")
             abort(400, f"Course code not found in database: {course_code}")
 
-        original_filename = uploaded_file.filename
         if not original_filename:
             abort(400, "Uploaded file has no filename")
         _, file_extension = os.path.splitext(original_filename)
@@ -168,22 +321,30 @@ def upload():
         upload_folder = f"downloads/{department}/{year}/{term}"
         os.makedirs(upload_folder, exist_ok=True)
         file_path = os.path.join(upload_folder, new_filename)
-        uploaded_file.save(file_path)
 
         access_token = get_access_token()
         row = {
-            "ProjectId": projectId,
+            "ProjectId": projectId or course_project,
             "Code": course_code,
             "Location": original_filename,
             "Department": department,
             "Year": year,
             "Term": term,
         }
-        logger.info(f"Received file: {uploaded_file.filename}, type: {uploaded_file.mimetype}")
-        d2l_functions.upload_syllabus(row, None, access_token)
-
-        upload_df = pd.DataFrame([{ "OrgUnitId": orgUnitId }])
-        csv_db.update_syllabus_recorded(upload_df)
+        if stream_mode:
+            logger.info(f"Streaming file: {original_filename}, {file_size} bytes")
+            upload_bytes.inc(file_size, mode="stream")
+            if not d2l_functions.upload_syllabus_stream(row, request.stream, file_size, access_token):
+                logger.error(f"Streaming upload failed for course {course_code}")
+                return jsonify({"status": "error", "message": f"{course_code} syllabus upload to Brightspace failed."}), 502
+        else:
+            uploaded_file.save(file_path)
+            upload_bytes.inc(os.path.getsize(file_path), mode="form")
+            logger.info(f"Received file: {uploaded_file.filename}, type: {uploaded_file.mimetype}")
+            d2l_functions.upload_syllabus(row, None, access_token)
+
+        csv_db.set_course_recorded(orgUnitId, 1)
+        snapshots.record_status(course_code, 1)
         csv_db.upsert_content_object(None, orgUnitId, new_filename, "Topic", new_filename, None, 0)
 
         department_courses_df = csv_db.get_department_cources(term, year, department)
@@ -208,14 +369,14 @@ def exempt():
         logger.error("api/exempt: Invalid or missing signature")
         abort(403, "Invalid or missing signature")
 
-    year, term, department = extract_info(course_code)
-    orgUnitId = csv_db.get_orgUnitId_by_code(course_code)
+    orgUnitId, year, term, department, _ = find_course(course_code)
 
-    exempt_df = pd.DataFrame([{ "OrgUnitId": orgUnitId }])
     if exempt_value == "exempt":
-        csv_db.update_syllabus_recorded(exempt_df, 2)
+        csv_db.set_course_recorded(orgUnitId, 2)
+        snapshots.record_status(course_code, 2)
     elif exempt_value == "unexempt":
-        csv_db.update_syllabus_recorded(exempt_df, 0)
+        csv_db.set_course_recorded(orgUnitId, 0)
+        snapshots.record_status(course_code, 0)
 
     department_courses_df = csv_db.get_department_cources(term, year, department)
     d2l_functions.generate_syllabus_html(department_courses_df, "downloads")
@@ -236,6 +397,7 @@ def getReport():
     year = request.args.get("year")
     term = request.args.get("term")
     token = request.args.get("token")
+    report_format = request.args.get("format", "json").lower()
 
     if (
         not department
@@ -247,20 +409,21 @@ def getReport():
         logger.error("api/exempt: Invalid or missing signature")
         abort(403, "Invalid or missing signature")
 
+    if report_format not in ("json",) + STREAM_FORMATS:
+        abort(400, f"Unsupported format: {report_format}")
+
+    if report_format != "json":
+        batches = reshape_report_batches(
+            csv_db.stream_department_cources(term, year, department),
+            preferred=["Code", "Recorded", "AdoptionStatus"],
+            include_rest=False,
+        )
+        logger.info(f"Streaming {report_format} report for {department}-{year}-{term}")
+        return stream_report(batches, report_format, f"syllabus_report_{department}_{year}_{term}")
+
     department_courses_df = csv_db.get_department_cources(term, year, department)
     report_data = department_courses_df[["Code", "Recorded", "AdoptionStatus"]].copy()
 
-    def map_recorded_status(value):
-        if value == 1:
-            return "Uploaded"
-        if value == 2:
-            return "User Exempted"
-        if value == 4:
-            return "Campus Store Complete"
-        if value == 5:
-            return "Auto Exempted"
-        return ""
-
     report_data["Recorded"] = report_data["Recorded"].apply(map_recorded_status)
     logger.info(f"Report is sent to front-end for {department}-{year}-{term}")
     return jsonify(report_data.to_dict(orient="records")), 200
@@ -280,10 +443,19 @@ def api_report_academic_year():
     if not year:
         abort(400, 'Missing required parameter: year')
 
+    report_format = request.args.get('format', 'xlsx').lower()
+    if report_format not in ('xlsx',) + STREAM_FORMATS:
+        abort(400, f'Unsupported format: {report_format}')
+
     terms = ('FW', 'SP', 'SU')
 
-    full_counts = csv_db.fetch_counts(year, terms, faculty_id)
-    full_year_df = pd.DataFrame([{
+    # CSV and Parquet carry only the course rows, streamed from the cursor
+    if report_format != 'xlsx':
+        batches = academic_year_course_batches(stream_academic_year_courses(year, terms, faculty_id))
+        return stream_report(batches, report_format, f"syllabus_report_{year}")
+
+    full_counts = fetch_counts(year, terms, faculty_id)
+    full_year_rows = [{
         'Academic Year': str(year),
         'Terms': 'FW+SP+SU',
         # 'Raw Collected': int(full_counts.get('recorded', 0) or 0),
@@ -292,11 +464,11 @@ def api_report_academic_year():
         'Qualified Collected': int(full_counts.get('qualified_recorded', 0) or 0),
         'Qualified Total Courses': int(full_counts.get('qualified_total', 0) or 0),
         'Qualified % Complete': pct(int(full_counts.get('qualified_recorded', 0) or 0), int(full_counts.get('qualified_total', 0) or 0)),
-    }])
+    }]
 
     by_term_rows = []
     for t in terms:
-        c = csv_db.fetch_counts(year, (t,), faculty_id)
+        c = fetch_counts(year, (t,), faculty_id)
         by_term_rows.append({
             'Academic Year': str(year),
             'Term': t,
@@ -307,10 +479,9 @@ def api_report_academic_year():
             'Qualified Total Courses': int(c.get('qualified_total', 0) or 0),
             'Qualified % Complete': pct(int(c.get('qualified_recorded', 0) or 0), int(c.get('qualified_total', 0) or 0)),
         })
-    by_term_df = pd.DataFrame(by_term_rows)
 
     dept_rows = []
-    for dept, y, q_total, q_recorded in csv_db.fetch_department_count([year], faculty_id):
+    for dept, y, q_total, q_recorded in fetch_department_count([year], faculty_id):
         q_total = int(q_total or 0)
         q_recorded = int(q_recorded or 0)
         dept_rows.append({
@@ -320,84 +491,270 @@ def api_report_academic_year():
             'Qualified Total Courses': q_total,
             'Qualified % Complete': pct(q_recorded, q_total),
         })
-    by_dept_df = pd.DataFrame(dept_rows)
 
-    courses_df = csv_db.fetch_academic_year_courses(year, terms, faculty_id)
+    summaries = [
+        ('Full Year (FW+SP+SU)', full_year_rows),
+        ('By Term', by_term_rows),
+        ('By Department', dept_rows),
+    ]
+    course_batches = stream_academic_year_courses(year, terms, faculty_id)
 
-    def map_recorded_status(v):
-        try:
-            v = int(v)
-        except Exception:
-            return ''
-        if v == 1:
-            return 'Uploaded'
-        if v == 2:
-            return 'User Exempted'
-        if v == 4:
-            return 'Campus Store Complete'
-        if v == 5:
-            return 'Auto Exempted'
-        return ''
+    filename = f"syllabus_report_{year}.xlsx"
+    body = prime(xlsx_stream.stream_sheet(academic_year_workbook_rows(summaries, course_batches), 'report'))
+    return Response(
+        stream_with_context(body),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
 
-    if not courses_df.empty and 'Recorded' in courses_df.columns:
-        courses_df['SyllabusStatus'] = courses_df['Recorded'].apply(map_recorded_status)
 
-    # Rename AdoptionStatus column for report clarity
-    if 'AdoptionStatus' in courses_df.columns:
-        courses_df = courses_df.rename(columns={'AdoptionStatus': 'Book Store Status'})
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """Prometheus exposition of this API process's metrics."""
+    token = request.args.get("token")
+    auth = request.headers.get("Authorization", "")
+    if auth.startswith("Bearer "):
+        token = auth[len("Bearer "):]
+    if not token or not api_auth.verify_token("metrics", token):
+        abort(403, "Invalid or missing signature")
+    return Response(telemetry.render(), mimetype="text/plain; version=0.0.4")
 
-    # Do not include 'Recorded' in the report output
-    preferred = ['Year', 'Term', 'Department', 'Code', 'Book Store Status', 'SyllabusStatus']
 
-    course_cols = [c for c in preferred if c in courses_df.columns] + \
-                  [c for c in courses_df.columns if c not in preferred and c != 'Recorded']
+@app.route("/api/d2l/stats", methods=["GET"])
+def api_d2l_stats():
+    """Brightspace call accounting per route: this API process live, and the last main.py run."""
+    token = request.args.get("token")
+    if not token or not api_auth.verify_token("d2l-stats", token):
+        logger.error("api/d2l/stats: Invalid or missing signature")
+        abort(403, "Invalid or missing signature")
 
-    courses_df = courses_df[course_cols] if not courses_df.empty else pd.DataFrame(columns=preferred)
+    last_run = run_metrics.last_report()
+    if request.args.get("format") == "text":
+        text = f"API process:\n{d2l_stats.summary_table()}\n"
+        if last_run:
+            text += f"\nLast run ({last_run.get('mode')}, finished {time.ctime(last_run.get('finished') or 0)}):\n"
+            text += f"{d2l_stats.summary_table(last_run.get('d2l', {}))}\n"
+        return Response(text, mimetype="text/plain")
+
+    return jsonify({
+        "api": d2l_stats.snapshot(),
+        "last_run": None if last_run is None else {
+            "mode": last_run.get("mode"),
+            "finished": last_run.get("finished"),
+            "d2l": last_run.get("d2l", {}),
+        },
+    })
+
+
+def map_recorded_status(v):
+    try:
+        v = int(v)
+    except Exception:
+        return ''
+    if v == 1:
+        return 'Uploaded'
+    if v == 2:
+        return 'User Exempted'
+    if v == 4:
+        return 'Campus Store Complete'
+    if v == 5:
+        return 'Auto Exempted'
+    return ''
+
+
+def reshape_report_batches(batches, preferred, renames=None, include_rest=True):
+    """Reshape (column_names, rows) batches from csv_db into report columns.
+
+    Columns are renamed through `renames`, ordered with `preferred` first and, when
+    include_rest is set, the remaining columns after them. The source 'Recorded'
+    column is mapped to its status label. Yields (header, rows) with the header
+    only on the first batch and None afterwards.
+    """
+    renames = renames or {}
+    columns = None
+    for column_names, rows in batches:
+        header = None
+        if columns is None:
+            names = [renames.get(c, c) for c in column_names]
+            header = [c for c in preferred if c in names]
+            if include_rest:
+                header += [c for c in names if c not in preferred]
+            columns = [(names.index(c), column_names[names.index(c)] == 'Recorded') for c in header]
+        yield header, [
+            [map_recorded_status(row[i]) if is_recorded else row[i] for i, is_recorded in columns]
+            for row in rows
+        ]
+
+
+def academic_year_course_batches(course_batches):
+    # Rename AdoptionStatus column for report clarity and do not include 'Recorded' in the report output
+    return reshape_report_batches(
+        course_batches,
+        preferred=['Year', 'Term', 'Department', 'Code', 'Book Store Status', 'SyllabusStatus'],
+        renames={'AdoptionStatus': 'Book Store Status', 'Recorded': 'SyllabusStatus'},
+    )
 
-    filename = f"syllabus_report_{year}.xlsx"
 
-    bio = io.BytesIO()
-    with pd.ExcelWriter(bio, engine='openpyxl') as writer:
-        sheet = 'report'
-
-        # Section 1: Full Year
-        startrow = 1
-        full_year_df.to_excel(writer, index=False, sheet_name=sheet, startrow=startrow)
-        ws = writer.sheets[sheet]
-        ws.cell(row=startrow, column=1, value='Full Year (FW+SP+SU)')
-
-        # Section 2: By Term
-        startrow = startrow + len(full_year_df) + 4
-        by_term_df.to_excel(writer, index=False, sheet_name=sheet, startrow=startrow)
-        ws.cell(row=startrow, column=1, value='By Term')
-
-        # Section 3: By Department
-        startrow = startrow + len(by_term_df) + 4
-        by_dept_df.to_excel(writer, index=False, sheet_name=sheet, startrow=startrow)
-        ws.cell(row=startrow, column=1, value='By Department')
-
-        # Section 4: Courses
-        startrow = startrow + len(by_dept_df) + 4
-        courses_df.to_excel(writer, index=False, sheet_name=sheet, startrow=startrow)
-        ws.cell(row=startrow, column=1, value='Courses')
-
-        # Freeze the first row
-        ws.freeze_panes = 'A2'
-
-        # Remove the default empty sheet created by openpyxl (commonly named 'Sheet')
-        for name in list(writer.book.sheetnames):
-            if name != sheet and name.lower().startswith('sheet'):
-                del writer.book[name]
-
-    bio.seek(0)
-    return send_file(
-        bio,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename,
+def csv_report_body(batches):
+    """Yield the report as CSV text, one chunk per cursor batch."""
+    for header, rows in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header is not None:
+            writer.writerow(header)
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def write_parquet_report(sink, batches):
+    """Write the report into `sink` as Parquet, one row group per cursor batch."""
+    schema = None
+    with contextlib.ExitStack() as stack:
+        for header, rows in batches:
+            if schema is None:
+                schema = pa.schema([(c, pa.int32() if c in PARQUET_INT_COLUMNS else pa.string()) for c in header])
+                writer = stack.enter_context(pq.ParquetWriter(sink, schema))
+            if not rows:
+                continue
+            arrays = [
+                [None if v is None else (int(v) if c in PARQUET_INT_COLUMNS else str(v)) for v in values]
+                for c, values in zip(schema.names, zip(*rows))
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def stream_report(batches, report_format, basename):
+    """Streamed CSV or Parquet response for reshaped report batches."""
+    if report_format == 'csv':
+        body = csv_report_body(batches)
+        mimetype = 'text/csv'
+    else:
+        if pa is None:
+            abort(501, 'Parquet export requires pyarrow')
+        body = stream_from_writer(lambda sink: write_parquet_report(sink, batches))
+        mimetype = 'application/vnd.apache.parquet'
+    return Response(
+        stream_with_context(prime(body)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={basename}.{report_format}'},
     )
 
 
+def academic_year_workbook_rows(summaries, course_batches):
+    """Yield the academic year report sheet as batches of rows for xlsx_stream.stream_sheet.
+
+    summaries is a list of (title, rows) sections written above the course list;
+    course_batches yields (column_names, rows) straight from the DB cursor, so
+    course rows go into the sheet without being collected first. The summary
+    sections come with the first course batch.
+    """
+    # Each section: title row, header row, data rows, then two blank rows
+    sheet_rows = []
+    for title, rows in summaries:
+        sheet_rows.append([title])
+        if rows:
+            sheet_rows.append(list(rows[0].keys()))
+            sheet_rows.extend(list(r.values()) for r in rows)
+        sheet_rows += [[], []]
+    sheet_rows.append(['Courses'])
+
+    for header, rows in academic_year_course_batches(course_batches):
+        if header is not None:
+            sheet_rows.append(header)
+        sheet_rows.extend(rows)
+        yield sheet_rows
+        sheet_rows = []
+    if sheet_rows:
+        yield sheet_rows
+
+
+def prime(body):
+    """Produce the first chunk of a streamed body before the response starts.
+
+    A report that fails before any of it is written (no database, a bad query) then
+    fails the request with a 500 instead of sending an empty 200. A failure after the
+    first chunk is raised out of the body, which drops the connection before the end
+    of the chunked response, so the client sees an incomplete download rather than a
+    complete-looking truncated file.
+    """
+    first = next(body, None)
+    return body if first is None else itertools.chain([first], body)
+
+
+class QueueWriter:
+    """Write-only file object that hands buffered chunks to a bounded queue."""
+
+    closed = False
+
+    def __init__(self, chunks, stopped, buffer_size=64 * 1024):
+        self.chunks = chunks
+        self.stopped = stopped
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        while True:
+            if self.stopped.is_set():
+                raise IOError("Response stream closed by the client.")
+            try:
+                self.chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+
+def stream_from_writer(produce, max_pending=16):
+    """Run produce(file_obj) in a worker thread and yield what it writes as it is written.
+
+    At most max_pending chunks are buffered, so a slow client throttles the producer
+    instead of letting the whole body pile up in memory. An error in produce is raised
+    from the generator after the chunks written before it.
+    """
+    chunks = queue.Queue(maxsize=max_pending)
+    stopped = threading.Event()
+    done = object()
+    failure = []
+
+    def run():
+        writer = QueueWriter(chunks, stopped)
+        try:
+            produce(writer)
+            writer.flush()
+        except Exception as e:
+            logger.error(f"Streaming response failed: {e}")
+            failure.append(e)
+        finally:
+            while not stopped.is_set():
+                try:
+                    chunks.put(done, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        stopped.set()
+    # Raised to the server rather than ending the body as if it were complete, see prime()
+    if failure:
+        raise failure[0]
+
+
 def extract_info(string):
     parts = string.split('-')
     if len(parts) < 5:
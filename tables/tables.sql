@@ -35,6 +35,16 @@ CREATE TABLE OrganizationalUnitAncestors (
     PRIMARY KEY (OrgUnitId, AncestorOrgUnitId)
 ) ENGINE=InnoDB CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 
+-- Each course's faculty and project, flattened from OrganizationalUnitAncestors and Faculty.
+-- Rebuilt by csv_db.refresh_course_project during setDb (which also creates it when missing).
+CREATE TABLE CourseProject (
+    OrgUnitId INT NOT NULL,
+    FacultyId INT NOT NULL,
+    ProjectId INT NOT NULL,
+    PRIMARY KEY (OrgUnitId, FacultyId),
+    KEY idx_course_project_project (ProjectId, OrgUnitId)
+) ENGINE=InnoDB CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
 CREATE TABLE Faculty (
      FacultyId INT PRIMARY KEY,
      Name VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci,
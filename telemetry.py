@@ -0,0 +1,140 @@
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+# In-process counters, gauges and histograms rendered in the Prometheus text format.
+# syllabus_api serves them from /api/metrics; recording is a dict update under a lock,
+# so it is cheap enough for every request and query.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_metrics = []
+_collectors = []
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def label_text(names, values, extra=''):
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+    def lines(self):
+        with self.lock:
+            values = dict(self.values)
+        return self.header() + [f"{self.name}{label_text(self.label_names, k)} {v}" for k, v in values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # [count per bucket (+Inf last), sum, count]
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def lines(self):
+        with self.lock:
+            values = {k: (list(v[0]), v[1], v[2]) for k, v in self.values.items()}
+        lines = self.header()
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ('+Inf',), counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{label_text(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{label_text(self.label_names, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{label_text(self.label_names, key)} {count}")
+        return lines
+
+
+def timed(histogram, **labels):
+    """Decorator observing each call's duration in `histogram`, labelled function=<name>."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(function=func.__name__, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_collector(collect):
+    """Add a callable returning exposition lines computed at scrape time (e.g. cache and pool state)."""
+    _collectors.append(collect)
+    return collect
+
+
+def render():
+    lines = []
+    for metric in list(_metrics):
+        lines += metric.lines()
+    for collect in list(_collectors):
+        lines += collect()
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import csv_db
+
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        self.executed.append((sql, params))
+        self.rowcount = len(params) - 1
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+        self.committed = False
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self.executed)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(csv_db, 'get_db_connection', lambda: conn)
+    return conn
+
+
+@pytest.mark.parametrize('value', [1, np.int64(1), np.int32(1), np.float64(1.0), '1'])
+def test_set_recorded_takes_one_value_for_all_units(conn, value):
+    ids = pd.Series([3, 1, 2], dtype='int64')
+    assert csv_db.set_recorded(ids, value) == {1: 3}
+    assert conn.executed == [
+        ("UPDATE OrganizationalUnits SET Recorded = %s WHERE OrgUnitId IN (%s, %s, %s)", (1, 1, 2, 3))
+    ]
+    assert conn.committed
+
+
+def test_set_recorded_groups_per_unit_values(conn):
+    result = csv_db.set_recorded(np.array([5, 6, 7]), pd.Series([1, 0, 1]))
+    assert result == {1: 2, 0: 1}
+    assert [params for _, params in conn.executed] == [(1, 5, 7), (0, 6)]
+
+
+def stream_batches(column_names, *batches):
+    return lambda sql, params, batch_size, name, read_only: iter([(column_names, list(b)) for b in batches])
+
+
+def test_fetch_frame_types_do_not_depend_on_the_batches(monkeypatch):
+    names = ['OrgUnitId', 'Department', 'Recorded', 'AdoptionStatus']
+    rows = [(1, 'MATH', 1, None), (2, 'MATH', None, None), (3, 'CHEM', 0, 'Complete')]
+    monkeypatch.setattr(csv_db, 'stream_query', stream_batches(names, rows[:2], rows[2:]))
+
+    frame = csv_db.fetch_frame('SELECT', ())
+
+    expected = pd.DataFrame.from_records(rows, columns=names)
+    pd.testing.assert_frame_equal(frame, expected)
+
+
+def test_fetch_frame_keeps_the_columns_of_an_empty_result(monkeypatch):
+    monkeypatch.setattr(csv_db, 'stream_query', stream_batches(['OrgUnitId', 'Code'], []))
+    frame = csv_db.fetch_frame('SELECT', ())
+    assert frame.empty and list(frame.columns) == ['OrgUnitId', 'Code']
+
+
+class RecordingConnection(FakeConnection):
+    def __init__(self):
+        super().__init__()
+        self.cursors = []
+
+    def cursor(self, **kwargs):
+        self.cursors.append(kwargs)
+        return FakeCursor(self.executed)
+
+
+def test_execute_prepared_keeps_statements_on_pooled_connections_only():
+    cnx = RecordingConnection()
+    pooled = csv_db.PooledConnection(None, cnx, {})
+    for code in ('A', 'B'):
+        csv_db.execute_prepared(pooled, csv_db.ORG_UNIT_BY_CODE_SQL, (code,))
+    assert cnx.cursors == [{'prepared': True}]
+    assert list(pooled.statements) == [csv_db.ORG_UNIT_BY_CODE_SQL]
+
+    unpooled = RecordingConnection()
+    for code in ('A', 'B'):
+        csv_db.execute_prepared(unpooled, csv_db.ORG_UNIT_BY_CODE_SQL, (code,))
+    assert unpooled.cursors == [{'buffered': True}] * 2
@@ -0,0 +1,43 @@
+import pytest
+
+import d2l_stats
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    d2l_stats.reset()
+    yield
+    d2l_stats.reset()
+
+
+@pytest.mark.parametrize('method, url, route', [
+    ('get', 'https://bs.example.com/d2l/api/lp/1.47/123456/managefiles/file?path=x',
+     'GET /d2l/api/lp/{v}/{orgUnitId}/managefiles/file'),
+    ('POST', 'https://bs.example.com/d2l/api/le/1.74/6606/content/modules/98765/structure/',
+     'POST /d2l/api/le/{v}/{orgUnitId}/content/modules/{moduleId}/structure/'),
+    ('PUT', 'https://bs.example.com/d2l/upload/a1b2c3d4', 'PUT /d2l/upload/{fileKey}'),
+    ('GET', 'https://bs.example.com/d2l/api/lp/1.47/datasets/bds/0f3e7a/plugins/9bc1/extracts',
+     'GET /d2l/api/lp/{v}/datasets/bds/{schemaId}/plugins/{pluginId}/extracts'),
+])
+def test_route_template_collapses_ids(method, url, route):
+    assert d2l_stats.route_template(method, url) == route
+
+
+def test_latency_and_status_accounting():
+    url = 'https://bs.example.com/d2l/api/lp/1.47/1/managefiles/file'
+    for seconds in (0.04, 0.2, 0.2, 0.9, 70):
+        d2l_stats.record('GET', url, 200, seconds, sent=10, received=100)
+    d2l_stats.record('GET', url, 'ConnectionError', 0.01)
+    d2l_stats.record_retry('GET', url)
+
+    stats = d2l_stats.snapshot()['GET /d2l/api/lp/{v}/{orgUnitId}/managefiles/file']
+    assert stats['calls'] == 6
+    assert stats['statuses'] == {'200': 5, 'ConnectionError': 1}
+    assert stats['p50_seconds'] == 0.25
+    # The slowest call is past the last bucket
+    assert stats['p95_seconds'] is None
+    assert stats['retries'] == 1 and stats['bytes_received'] == 500
+
+    lines = d2l_stats.prometheus_lines('d2l', labels={'mode': 'full'})
+    assert 'd2l_request_duration_seconds_bucket{route="GET /d2l/api/lp/{v}/{orgUnitId}/managefiles/file",mode="full",le="+Inf"} 6' in lines
+    assert '>60' in d2l_stats.summary_table()
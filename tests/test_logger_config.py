@@ -0,0 +1,33 @@
+import sys
+import json
+import logging
+
+import logger_config
+
+
+def failed_record(args):
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        return logging.getLogger('logger_config.test').makeRecord(
+            'logger_config.test', logging.ERROR, __file__, 1, "Sync failed for %s", args, sys.exc_info())
+
+
+def test_prepare_leaves_the_traceback_for_the_listener_to_format():
+    codes = ['2024-FW-D2-S01-MATH-1P01-LEC']
+    record = failed_record((codes,))
+    prepared = logger_config.queue_handler.prepare(record)
+    codes.append('changed after logging')
+
+    assert prepared is not record and record.args == (codes,)
+    assert prepared.msg == "Sync failed for ['2024-FW-D2-S01-MATH-1P01-LEC']" and prepared.args is None
+    assert prepared.exc_info is record.exc_info
+
+    data = json.loads(logger_config.JsonFormatter().format(prepared))
+    assert data['message'] == prepared.msg
+    assert 'ZeroDivisionError: division by zero' in data['exception']
+    assert data['exception'].startswith('Traceback')
+
+    text = logging.Formatter('%(levelname)s - %(message)s').format(logger_config.queue_handler.prepare(record))
+    assert text.splitlines()[0] == f"ERROR - Sync failed for {codes!r}"
+    assert text.splitlines()[-1] == 'ZeroDivisionError: division by zero'
@@ -0,0 +1,48 @@
+import run_journal
+
+
+def interrupted_run(path):
+    journal = run_journal.start('full', path=path)
+    journal.complete('2024-FW:create_folders', {'courses': '123'})
+    journal.record_transfer('2024-FW', 6606, {'location': '/content/a.pdf'}, True)
+    journal.record_transfer('2024-FW', 6607, {'location': '/content/b.pdf'}, False)
+    journal.file.close()
+    return journal
+
+
+def test_resume_skips_only_work_done_with_the_same_inputs(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    interrupted_run(path)
+
+    journal = run_journal.start('full', resume=True, path=path)
+    assert not journal.pending('2024-FW:create_folders', {'courses': '123'})
+    assert journal.pending('2024-FW:create_folders', {'courses': '456'})
+    assert journal.pending('2024-FW:render_html', {'courses': '123'})
+    assert journal.transferred('2024-FW', '6606', {'location': '/content/a.pdf'})
+    assert not journal.transferred('2024-FW', 6606, {'location': '/content/new.pdf'})
+    assert not journal.transferred('2024-FW', 6607, {'location': '/content/b.pdf'})
+
+
+def test_a_line_cut_short_by_a_crash_is_ignored(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    interrupted_run(path)
+    with open(path, 'a') as f:
+        f.write('{"stage": "2024-FW:render_ht')
+
+    journal = run_journal.start('full', resume=True, path=path)
+    assert not journal.pending('2024-FW:create_folders', {'courses': '123'})
+    journal.complete('2024-FW:render_html', {'courses': '123'})
+    assert [r.get('stage') for r in run_journal.read(path) if 'stage' in r] == [
+        '2024-FW:create_folders', '2024-FW:render_html']
+
+
+def test_a_finished_run_or_another_mode_starts_over(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    interrupted_run(path)
+    journal = run_journal.start('differential', resume=True, path=path)
+    assert journal.pending('2024-FW:create_folders', {'courses': '123'})
+    journal.finish()
+
+    journal = run_journal.start('differential', resume=True, path=path)
+    assert journal.stages == {} and journal.transfers == {}
+    assert run_journal.read(path) == [{'mode': 'differential', 'started': journal.started}]
@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import run_metrics
+
+
+def test_parallel_stages_are_charged_only_for_their_own_work():
+    report = run_metrics.RunReport('full')
+    ready = threading.Barrier(2)
+
+    def run_term(term, calls):
+        with report.stage('transfer_syllabi', term=term) as stage:
+            ready.wait()
+            for _ in range(calls):
+                run_metrics.count('http_calls')
+            stage.add_rows(calls)
+
+    with report.stage('process_terms'):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [run_metrics.run_in_context(executor, run_term, term, calls)
+                       for term, calls in (('FW', 3), ('SP', 5))]
+            for future in futures:
+                future.result()
+
+    stages = {(s['stage'], s.get('term')): s for s in report.as_dict()['stages']}
+    assert stages[('transfer_syllabi', 'FW')]['http_calls'] == 3
+    assert stages[('transfer_syllabi', 'SP')]['http_calls'] == 5
+    assert stages[('process_terms', None)]['http_calls'] == 8
+    assert stages[('transfer_syllabi', 'SP')]['rows'] == 5
+
+
+def test_a_failing_stage_is_recorded_as_failed(tmp_path):
+    report = run_metrics.RunReport('differential')
+    with pytest.raises(RuntimeError):
+        with report.stage('fetch_all_courses', term='FW', year=2024):
+            raise RuntimeError('database went away')
+    assert report.as_dict()['stages'][0]['status'] == 'failed'
+
+    path = tmp_path / 'metrics' / 'run.prom'
+    report.write_prometheus(str(path))
+    text = path.read_text()
+    assert 'syllabus_run_stage_rows{stage="fetch_all_courses",mode="differential",term="FW",year="2024"} 0' in text
+    assert not (tmp_path / 'metrics' / 'run.prom.tmp').exists()
+
+
+def test_stage_outside_a_run_is_a_no_op(monkeypatch):
+    monkeypatch.setitem(run_metrics._active, 'report', None)
+    with run_metrics.stage('render_html') as stage:
+        stage.add_rows(2)
+    assert stage.rows == 2 and stage.status == 'running'
@@ -0,0 +1,62 @@
+import sys
+
+import pytest
+
+import lazy
+from settings import Settings, comma_list, department_map
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    # A fresh instance with .env treated as already loaded, so only the environment below counts
+    fresh = Settings()
+    fresh.loaded = True
+    for key in ('host', 'port', 'QUALIFIED_SECTION_TYPES', 'DEPARTMENT_FACULTY_OVERRIDES', 'log_level'):
+        monkeypatch.delenv(key, raising=False)
+    return fresh
+
+
+def test_values_are_read_on_first_use_and_cached(settings, monkeypatch):
+    monkeypatch.setenv('host', 'db.example.com')
+    monkeypatch.setenv('port', '3307')
+    assert settings.db_host == 'db.example.com'
+    assert settings.db_port == 3307
+
+    monkeypatch.setenv('host', 'other.example.com')
+    assert settings.db_host == 'db.example.com'
+    settings.values.clear()
+    assert settings.db_host == 'other.example.com'
+
+
+def test_defaults_casts_and_required_values(settings, monkeypatch):
+    assert settings.db_port is None
+    assert settings.log_level == 'INFO'
+    assert 'LEC' in settings.qualified_section_types
+    with pytest.raises(KeyError):
+        settings.db_host
+
+    monkeypatch.setenv('log_level', 'debug')
+    settings.values.clear()
+    assert settings.log_level == 'DEBUG'
+
+
+def test_list_and_map_casts():
+    assert comma_list('LEC, SEM ,LAB') == ('LEC', 'SEM', 'LAB')
+    assert department_map('BTGD=6606, ABED = 7000,') == {'BTGD': 6606, 'ABED': 7000}
+
+
+def test_lazy_import_defers_until_first_use():
+    sys.modules.pop('colorsys', None)
+    module = lazy.lazy_import('colorsys')
+    assert 'colorsys' not in sys.modules
+    assert 'not loaded' in repr(module)
+
+    assert module.rgb_to_hsv(1, 0, 0) == (0.0, 1.0, 1)
+    assert 'colorsys' in sys.modules
+
+
+def test_lazy_import_of_a_loaded_or_missing_module():
+    assert lazy.lazy_import('json') is sys.modules['json']
+    assert lazy.lazy_import('no_such_module_here', optional=True) is None
+    with pytest.raises(ModuleNotFoundError):
+        lazy.lazy_import('no_such_module_here').anything
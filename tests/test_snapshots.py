@@ -0,0 +1,133 @@
+import os
+
+import pandas as pd
+import pytest
+
+import csv_db
+import snapshots
+
+COLUMNS = ['ProjectId', 'Year', 'Term', 'Department', 'Code', 'SectionType', 'Recorded', 'AdoptionStatus']
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Course rows standing in for MySQL, with snapshots written under tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(snapshots, '_loaded', {"stamp": None, "snapshot": None, "version": None, "offset": 0})
+    rows = pd.DataFrame(
+        [(7, 2024, 'FW' if i < 6 else 'SP', 'MATH' if i % 2 else 'CHEM', f'2024-FW-D2-S0{i}-C{i}',
+          'LEC' if i % 3 else 'LAB', int(i % 4 == 0), None) for i in range(10)],
+        columns=COLUMNS,
+    )
+    monkeypatch.setattr(csv_db, 'get_last_three_years', lambda: [(2024,)])
+    monkeypatch.setattr(csv_db, 'fetch_summary_courses', lambda years: rows.copy())
+    return rows
+
+
+def set_recorded(db, code, value):
+    """What the upload and exempt endpoints do: commit to MySQL, then record the change."""
+    db.loc[db['Code'] == code, 'Recorded'] = value
+    snapshots.record_status(code, value)
+
+
+def expected(db):
+    snap = snapshots.Snapshot('expected', [2024], db.assign(Recorded=db['Recorded'].astype('Int64')),
+                              *snapshots.summarize(db.assign(Recorded=db['Recorded'].astype('Int64'))))
+    return snap.counts, snap.departments
+
+
+def recorded(snap, code):
+    return snap.courses.loc[snap.courses['Code'] == code, 'Recorded'].tolist()
+
+
+def versions():
+    return sorted(d for d in os.listdir(snapshots.snapshot_path) if d.isdigit())
+
+
+def reload_from_disk(monkeypatch):
+    monkeypatch.setattr(snapshots, '_loaded', {"stamp": None, "snapshot": None, "version": None, "offset": 0})
+    return snapshots.current()
+
+
+def test_status_recorded_during_publish_survives_the_rewrite(db, monkeypatch):
+    snapshots.publish_snapshots()
+    code = db['Code'][1]
+    assert db['Recorded'][1] == 0
+
+    def fetch_then_upload(years):
+        # The publish reads the courses, then an upload commits and records before it writes
+        stale = db.copy()
+        set_recorded(db, code, 1)
+        return stale
+
+    monkeypatch.setattr(csv_db, 'fetch_summary_courses', fetch_then_upload)
+    version = snapshots.publish_snapshots()
+
+    snap = reload_from_disk(monkeypatch)
+    assert snap.version == version
+    assert snapshots.read_status(version) == ([], 0)
+    assert recorded(snap, code) == [1]
+    assert (snap.counts, snap.departments) == expected(db)
+
+
+def test_record_status_appends_to_the_live_version(db, monkeypatch):
+    version = snapshots.publish_snapshots()
+    before = snapshots.current()
+
+    set_recorded(db, db['Code'][1], 1)
+    set_recorded(db, db['Code'][4], 0)
+    set_recorded(db, db['Code'][5], 2)
+    set_recorded(db, 'not-in-the-snapshot', 1)
+
+    assert versions() == [version]
+    changes, _ = snapshots.read_status(version)
+    assert changes == [(db['Code'][1], 1), (db['Code'][4], 0), (db['Code'][5], 2)]
+
+    after = snapshots.current()
+    assert after is not before
+    assert (after.counts, after.departments) == expected(db)
+    reloaded = reload_from_disk(monkeypatch)
+    assert (reloaded.counts, reloaded.departments) == expected(db)
+
+
+def test_with_status_leaves_the_snapshot_readers_hold_untouched(db):
+    snapshots.publish_snapshots()
+    before = snapshots.current()
+    counts, departments = before.counts.copy(), {k: dict(v) for k, v in before.departments.items()}
+    recorded = before.courses['Recorded'].tolist()
+
+    after = before.with_status([(db['Code'][1], 1), (db['Code'][3], 1)])
+
+    assert before.courses['Recorded'].tolist() == recorded
+    assert before.counts == counts and before.departments == departments
+    assert after.counts[(7, 2024, 'FW')][1] == counts[(7, 2024, 'FW')][1] + 2
+
+
+def test_a_partly_written_status_line_waits_for_the_rest(db):
+    version = snapshots.publish_snapshots()
+    code = db['Code'][1]
+    line = f'{{"code": "{code}", "value": 1}}\n'
+    with open(snapshots.status_path(version), 'a') as f:
+        f.write(line[:10])
+    assert recorded(snapshots.current(), code) == [0]
+
+    with open(snapshots.status_path(version), 'a') as f:
+        f.write(line[10:])
+    assert recorded(snapshots.current(), code) == [1]
+
+
+def test_a_failed_append_changes_nothing(db, monkeypatch):
+    version = snapshots.publish_snapshots()
+    before = snapshots.current()
+
+    def open_failing_appends(path, mode='r', *args, **kwargs):
+        if mode == 'a':
+            raise OSError('No space left on device')
+        return open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(snapshots, 'open', open_failing_appends, raising=False)
+    snapshots.record_status(db['Code'][1], 1)
+
+    assert snapshots.current() is before
+    assert snapshots.read_status(version) == ([], 0)
+    assert before.courses['Recorded'].tolist() == db['Recorded'].tolist()
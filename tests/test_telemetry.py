@@ -0,0 +1,42 @@
+import telemetry
+
+
+def test_counter_and_histogram_render_in_the_exposition_format():
+    counter = telemetry.Counter('test_requests_total', 'Requests.', ['route'])
+    counter.inc(route='/api/upload')
+    counter.inc(2, route='/api/upload')
+    counter.inc(route='say "hi"\n')
+
+    histogram = telemetry.Histogram('test_query_seconds', 'Query time.', ['function'], buckets=(0.1, 1))
+    for seconds in (0.05, 0.5, 5):
+        histogram.observe(seconds, function='fetch_counts')
+
+    text = telemetry.render()
+    assert '# TYPE test_requests_total counter' in text
+    assert 'test_requests_total{route="/api/upload"} 3' in text
+    assert 'test_requests_total{route="say \\"hi\\"\\n"} 1' in text
+    assert 'test_query_seconds_bucket{function="fetch_counts",le="0.1"} 1' in text
+    assert 'test_query_seconds_bucket{function="fetch_counts",le="1"} 2' in text
+    assert 'test_query_seconds_bucket{function="fetch_counts",le="+Inf"} 3' in text
+    assert 'test_query_seconds_sum{function="fetch_counts"} 5.550000' in text
+    assert 'test_query_seconds_count{function="fetch_counts"} 3' in text
+    assert text.endswith('\n')
+
+
+def test_timed_observes_each_call_under_the_function_name():
+    histogram = telemetry.Histogram('test_timed_seconds', 'Timed calls.', ['function'])
+
+    @telemetry.timed(histogram)
+    def get_last_three_years():
+        return [(2024,)]
+
+    assert get_last_three_years() == [(2024,)]
+    assert histogram.values[('get_last_three_years',)][2] == 1
+
+
+def test_collectors_are_called_at_scrape_time(monkeypatch):
+    monkeypatch.setattr(telemetry, '_collectors', list(telemetry._collectors))
+    state = {'idle': 1}
+    telemetry.register_collector(lambda: [f"test_pool_idle {state['idle']}"])
+    state['idle'] = 4
+    assert 'test_pool_idle 4' in telemetry.render()
@@ -0,0 +1,39 @@
+import io
+import math
+
+import openpyxl
+import pandas as pd
+
+import xlsx_stream
+
+
+def read_back(row_batches):
+    data = b''.join(xlsx_stream.stream_sheet(row_batches, 'report'))
+    ws = openpyxl.load_workbook(io.BytesIO(data))['report']
+    return ws, list(ws.iter_rows(values_only=True))
+
+
+def test_missing_values_keep_later_cells_in_their_columns():
+    ws, rows = read_back([[['x<&>"', None, True, math.nan, 3]], [[pd.NaT, pd.NA, False, 'end', 1.5]]])
+    assert rows == [('x<&>"', None, True, None, 3), (None, None, False, 'end', 1.5)]
+
+
+def test_header_and_values_line_up_across_batches():
+    header = ['Year', 'Term', 'Book Store Status', 'SyllabusStatus']
+    batches = [[header], [[2024, 'FW', None, 'Collected']] * 3, [], [[2024, 'SP', 'Complete', None]]]
+    ws, rows = read_back(batches)
+    assert rows[0] == tuple(header)
+    assert rows[1:] == [(2024, 'FW', None, 'Collected')] * 3 + [(2024, 'SP', 'Complete', None)]
+    assert ws.freeze_panes == 'A2'
+
+
+def test_text_is_escaped_and_kept_verbatim():
+    values = ['  padded  ', '<tag attr="1">&amp;</tag>', "it's", 'bell\x07gone', '123']
+    _, rows = read_back([[values]])
+    assert rows == [('  padded  ', '<tag attr="1">&amp;</tag>', "it's", 'bellgone', '123')]
+
+
+def test_wide_rows_get_multi_letter_columns():
+    _, rows = read_back([[list(range(30))]])
+    assert rows == [tuple(range(30))]
+    assert [xlsx_stream.column_letter(i) for i in (0, 25, 26, 27, 701, 702)] == ['A', 'Z', 'AA', 'AB', 'ZZ', 'AAA']
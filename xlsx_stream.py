@@ -0,0 +1,149 @@
+import io
+import re
+import math
+import decimal
+import zipfile
+import numbers
+import functools
+from xml.sax.saxutils import escape
+
+# Single-sheet .xlsx written as it is produced: the sheet XML goes straight into a deflated zip
+# entry and the compressed bytes are handed out as they come, so the first byte is sent without
+# the whole workbook being built first (an openpyxl write-only workbook only emits on save).
+# Strings are inline, so there is no shared-strings table to collect before the sheet.
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    # Freeze the first row
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '<selection pane="bottomLeft"/>'
+    '</sheetView></sheetViews>'
+    '<sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+# Characters XML 1.0 does not allow; openpyxl refuses them, here they are dropped
+ILLEGAL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file object that keeps what is written until it is taken with drain()."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def drain(self):
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        return chunk
+
+
+@functools.lru_cache(maxsize=None)
+def column_letter(index):
+    """Spreadsheet column name for a 0-based column index: 0 -> A, 26 -> AA."""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def missing(value):
+    """None, NaN, NaT and pd.NA: values that are not equal to themselves."""
+    try:
+        return value is None or bool(value != value)
+    except TypeError:
+        # pd.NA has no truth value
+        return True
+
+
+def cell(ref, value):
+    # Missing values leave the cell out; the explicit reference on the cells that are
+    # written keeps the later ones in their own column
+    if missing(value):
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (numbers.Real, decimal.Decimal)) and math.isfinite(value):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    text = escape(ILLEGAL_CHARACTERS.sub('', str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def row_xml(number, values):
+    """The <row> element for 1-based row `number`."""
+    cells = ''.join(cell(f'{column_letter(i)}{number}', v) for i, v in enumerate(values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def stream_sheet(row_batches, sheet_name='Sheet1'):
+    """Yield the bytes of a one-sheet workbook whose rows come from row_batches, an iterable of row lists.
+
+    A chunk is yielded after each batch, with whatever the compressor has released by then.
+    The zip's central directory is written last, so a body cut short by an error does not
+    open as a workbook.
+    """
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES)
+        zf.writestr('_rels/.rels', ROOT_RELS)
+        zf.writestr('xl/workbook.xml', WORKBOOK.format(name=escape(sheet_name, {'"': '&quot;'})))
+        zf.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(SHEET_START.encode())
+            number = 0
+            for rows in row_batches:
+                xml = []
+                for row in rows:
+                    number += 1
+                    xml.append(row_xml(number, row))
+                sheet.write(''.join(xml).encode())
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+            sheet.write(SHEET_END.encode())
+    yield sink.drain()